@@ -6,7 +6,7 @@ import sys
 
 from aws_cdk import Environment, App
 
-from swift_main_stack.main import SwiftMain
+from utilities.synth_cache import SynthCache, cli_context
 
 region = os.environ["CDK_DEFAULT_REGION"]
 account = os.environ["CDK_DEFAULT_ACCOUNT"]
@@ -18,7 +18,25 @@ if region == "" or account == "":
 environment = Environment(region=region, account=account)
 
 app = App()
+synth_cache = None
+if app.node.try_get_context("synth_cache") == "true":
+    synth_cache = SynthCache(app.outdir, cli_context())
+    if synth_cache.restore():
+        sys.exit()
+
+# pylint: disable=wrong-import-position
+from swift_main_stack.main import SwiftMain
+
 main_stack = SwiftMain(app, "SWIFTMain-" + region, env=environment,
                        description="Quick Start for SWIFT Connectivity (qs-1rlbqnpbe)")
 
+if app.node.try_get_context("golden_ami_pipeline") == "true":
+    # only loaded when enabled, see utilities/import_report.py
+    from golden_ami.golden_ami_pipeline import SwiftGoldenAMI
+
+    SwiftGoldenAMI(app, "SWIFTGoldenAMI-" + region, env=environment,
+                   description="Golden AMI pipeline for SWIFT Connectivity hosts")
+
 app.synth()
+if synth_cache is not None:
+    synth_cache.record(main_stack)
@@ -0,0 +1,138 @@
+"""Timed user data steps and the readiness signal of the SWIFT hosts.
+
+The instances boot while the VPC endpoints they need are still being created, each step
+waits on what it needs instead of a fixed sleep. Step durations are sent to the statsd
+listener of the CloudWatch agent once it runs, and the instance signals a wait condition
+handle when its agents and volumes are up. The wait condition itself is created in the
+parent stack by create_ready_condition, after the VPC endpoints the signal goes through."""
+from typing import List
+
+from aws_cdk import CfnWaitCondition, CfnWaitConditionHandle, Aws, Stack
+from constructs import Construct, IConstruct
+
+# step durations, appended by every timed step, read back by the readiness commands
+BOOT_STEPS_FILE = "/var/log/swift-boot-steps"
+# published by the statsd listener of the agent as swift_boot_step_ms and swift_boot_ms
+# in the CWAgent namespace, with the append_dimensions of the agent profile
+STEP_METRIC = "swift_boot_step_ms"
+BOOT_METRIC = "swift_boot_ms"
+STATSD_ADDRESS = "/dev/udp/127.0.0.1/8125"
+# readiness checks every 5 seconds, for at most 10 minutes
+READY_CHECK_ATTEMPTS = 120
+READY_CHECK_SECONDS = READY_CHECK_ATTEMPTS * 5
+# seconds left after the readiness checks for the statsd listener and the signal
+SIGNAL_SECONDS = 120
+# seconds CloudFormation waits for the signals, boot plus the VPC endpoints stack
+DEFAULT_READY_TIMEOUT = 2700
+
+AGENT_CTL = "/opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl"
+
+
+def get_boot_start_commands() -> List[str]:
+    """first commands of the user data, starting the boot clock"""
+    return [
+        "boot_start=$(date +%s%3N)",
+        f": > {BOOT_STEPS_FILE}",
+    ]
+
+
+def timed_step(name: str, commands: List[str]) -> List[str]:
+    """commands run as one boot step, recording its duration in milliseconds"""
+    if not commands:
+        return []
+    return ["step_start=$(date +%s%3N)"] + list(commands) + [
+        f"echo \"{name} $(( $(date +%s%3N) - step_start ))\" >> {BOOT_STEPS_FILE}"]
+
+
+def get_ready_timeout(scope: Construct) -> int:
+    """seconds CloudFormation waits for the signals, the ready_timeout context"""
+    return int(scope.node.try_get_context("ready_timeout") or DEFAULT_READY_TIMEOUT)
+
+
+def get_endpoint_wait_seconds(scope: Construct) -> int:
+    """seconds from the boot start the endpoint waits may take, so that the readiness
+    checks and the signal still fit in the ready_timeout"""
+    wait_seconds = get_ready_timeout(scope) - READY_CHECK_SECONDS - SIGNAL_SECONDS
+    if wait_seconds < 300:
+        raise ValueError(f"ready_timeout must be at least "
+                         f"{READY_CHECK_SECONDS + SIGNAL_SECONDS + 300} seconds")
+    return wait_seconds
+
+
+def get_wait_for_endpoint_commands(url: str, wait_seconds: int) -> List[str]:
+    """commands waiting until an HTTPS endpoint answers, whatever the status code:
+    the VPC endpoints are created after the instances. Every wait ends wait_seconds after
+    the boot start, see get_endpoint_wait_seconds"""
+    return [
+        f"while [ $(( $(date +%s%3N) - boot_start )) -lt {wait_seconds * 1000} ]; do",
+        f"  curl -s -o /dev/null --connect-timeout 5 {url} && break",
+        "  sleep 5",
+        "done",
+    ]
+
+
+def get_s3_check_url(region: str) -> str:
+    """object of the SSM agent bucket, readable through the S3 gateway endpoint policy"""
+    return "https://s3." + region + "." + Aws.URL_SUFFIX + "/amazon-ssm-" + region + \
+        "/latest/VERSION"
+
+
+def get_ssm_check_url(region: str) -> str:
+    """SSM API, answering once the interface endpoint and its private DNS exist"""
+    return "https://ssm." + region + "." + Aws.URL_SUFFIX
+
+
+def get_readiness_commands(ready_url: str, component: str,
+                           mount_points: List[str]) -> List[str]:
+    """commands waiting for the SSM and CloudWatch agents and the volumes, publishing the
+    step durations to the statsd listener of the agent, then signalling ready_url with
+    SUCCESS or FAILURE and the failed checks as reason"""
+    checks = [("ssm-agent", "systemctl is-active --quiet amazon-ssm-agent"),
+              ("cloudwatch-agent", f"{{ [ ! -x {AGENT_CTL} ] || systemctl is-active --quiet "
+                                   "amazon-cloudwatch-agent; }")]
+    checks += [(mount_point, f"mountpoint -q {mount_point}") for mount_point in mount_points]
+    tags = f"component:{component}"
+    return [
+        "ready_status=FAILURE",
+        f"for attempt in $(seq 1 {READY_CHECK_ATTEMPTS}); do",
+        "  failed=''",
+    ] + [f"  {check} || failed=\"$failed {name}\"" for name, check in checks] + [
+        "  if [ -z \"$failed\" ]; then ready_status=SUCCESS; break; fi",
+        "  sleep 5",
+        "done",
+        f"echo \"ready $(( $(date +%s%3N) - boot_start ))\" >> {BOOT_STEPS_FILE}",
+        # the listener binds a moment after the agent reports active
+        "for attempt in $(seq 1 12); do",
+        "  ss -lun | grep -q ':8125 ' && break",
+        "  sleep 5",
+        "done",
+        "while read -r step duration; do",
+        f"  echo \"{STEP_METRIC}:$duration|ms|#step:$step,{tags}\" > {STATSD_ADDRESS}",
+        f"done < {BOOT_STEPS_FILE}",
+        "boot_ms=$(( $(date +%s%3N) - boot_start ))",
+        f"echo \"{BOOT_METRIC}:$boot_ms|ms|#status:$ready_status,{tags}\" > {STATSD_ADDRESS}",
+        "instance_id=$(cat /var/lib/cloud/data/instance-id)",
+        "reason=\"boot ${boot_ms} ms${failed:+, not ready:$failed}\"",
+        "printf '{\"Status\":\"%s\",\"Reason\":\"%s\",\"UniqueId\":\"%s\",\"Data\":\"%s\"}' "
+        "\"$ready_status\" \"$reason\" \"$instance_id\" \"$boot_ms\" > /tmp/swift-ready.json",
+        "curl -s -X PUT -H 'Content-Type:' --data-binary @/tmp/swift-ready.json "
+        f"--retry 5 '{ready_url}'",
+    ]
+
+
+def create_ready_handle(scope: Construct) -> CfnWaitConditionHandle:
+    """handle the instances of a host stack signal when ready"""
+    return CfnWaitConditionHandle(scope, "ReadyHandle")
+
+
+def create_ready_condition(scope: Stack, cid: str, handle: CfnWaitConditionHandle,
+                           count: int, depends_on: List[IConstruct]) -> CfnWaitCondition:
+    """wait condition in the parent stack on the signals of count instances, the signal
+    is sent through the VPC endpoints in depends_on. The timeout is the ready_timeout
+    context in seconds"""
+    condition = CfnWaitCondition(
+        scope, cid + "Ready", handle=handle.ref, count=count,
+        timeout=str(get_ready_timeout(scope)))
+    for dependency in depends_on:
+        condition.node.add_dependency(dependency)
+    return condition
@@ -0,0 +1,255 @@
+"""CloudWatch agent configuration generated per component from named profiles"""
+import json
+from typing import Dict, List, Tuple
+
+from aws_cdk import aws_ssm as _ssm
+from aws_cdk import NestedStack, Token
+from constructs import Construct
+
+from base_host_group.storage_layout import StorageLayout
+from utilities.context_values import get_component_setting
+
+# resources of a plugin resolved from the storage layout of the instance
+RESOURCES_MOUNTS = "mounts"
+RESOURCES_DEVICES = "devices"
+# assumed number of resources matched by "*", for the metrics budget
+WILDCARD_RESOURCE_ESTIMATE = 4
+# SSM standard parameters are limited to 4 KB
+STANDARD_PARAMETER_BYTES = 4096
+
+# everything under /var/log into one log group, the legacy profile only
+DEFAULT_LOG_FILES = [
+    {
+        "file_path": "/var/log",
+        "log_group_name": "varlog",
+        "log_stream_name": "{instance_id}"
+    }
+]
+
+
+class MetricPlugin:
+    """Measurements of one agent plugin (cpu, disk, diskio...) and their collection interval,
+    an interval below 60 seconds publishes high resolution metrics"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, plugin: str, measurements: List[str],
+                 interval: int = 60,
+                 resources=None,
+                 totalcpu: bool = None,
+                 drop_device: bool = None) -> None:
+        self.plugin = plugin
+        self.measurements = measurements
+        self.interval = interval
+        self.resources = resources
+        self.totalcpu = totalcpu
+        self.drop_device = drop_device
+
+    def get_resources(self, storage_layout: StorageLayout = None) -> List[str]:
+        """resources of the plugin, mounts and devices from the storage layout"""
+        if self.resources == RESOURCES_MOUNTS:
+            mounts = ["/"]
+            if storage_layout is not None:
+                mounts += [volume.mount_point for volume in storage_layout.volumes
+                           if volume.mount_point]
+            return mounts
+        if self.resources == RESOURCES_DEVICES:
+            # EBS volumes are NVMe devices on the Nitro instances of the performance tiers
+            count = 1 if storage_layout is None else 1 + len(storage_layout.volumes)
+            return [f"nvme{index}n1" for index in range(count)]
+        return self.resources
+
+    def to_config(self, storage_layout: StorageLayout = None) -> dict:
+        """agent configuration of the plugin"""
+        config = {"measurement": list(self.measurements),
+                  "metrics_collection_interval": self.interval}
+        resources = self.get_resources(storage_layout)
+        if resources is not None:
+            config["resources"] = resources
+        if self.totalcpu is not None:
+            config["totalcpu"] = self.totalcpu
+        if self.drop_device is not None:
+            config["drop_device"] = self.drop_device
+        return config
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "MetricPlugin":
+        """creating a plugin from a context object"""
+        return cls(**spec)
+
+
+class AgentProfile:
+    """Metrics, dimensions and logs collected by the CloudWatch agent of an instance"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name: str, plugins: List[MetricPlugin],
+                 append_dimensions: List[str] = None,
+                 aggregation_dimensions: List[List[str]] = None,
+                 statsd: bool = True,
+                 log_files: List[dict] = None,
+                 force_flush_interval: int = None,
+                 max_metrics: int = None,
+                 max_datapoints_per_minute: int = None) -> None:
+        self.name = name
+        self.plugins = plugins
+        self.append_dimensions = ["InstanceId"] if append_dimensions is None \
+            else append_dimensions
+        self.aggregation_dimensions = aggregation_dimensions or []
+        self.statsd = statsd
+        self.log_files = log_files or []
+        self.force_flush_interval = force_flush_interval
+        self.max_metrics = max_metrics
+        self.max_datapoints_per_minute = max_datapoints_per_minute
+
+    def build(self, storage_layout: StorageLayout = None,
+              collect_list: List[dict] = None) -> dict:
+        """agent configuration for an instance with the storage layout, shipping the
+        log files of the profile and collect_list (see log_collection.get_collect_list),
+        raising ValueError when it exceeds the metrics budget of the profile"""
+        metrics_collected = {plugin.plugin: plugin.to_config(storage_layout)
+                             for plugin in self.plugins}
+        if self.statsd:
+            metrics_collected["statsd"] = {"metrics_aggregation_interval": 10,
+                                           "metrics_collection_interval": 10,
+                                           "service_address": ":8125"}
+        metrics = {
+            "append_dimensions": {dimension: "${aws:" + dimension + "}"
+                                  for dimension in self.append_dimensions},
+            "metrics_collected": metrics_collected
+        }
+        if self.aggregation_dimensions:
+            metrics["aggregation_dimensions"] = self.aggregation_dimensions
+
+        config = {"agent": {"metrics_collection_interval": 60, "run_as_user": "root"},
+                  "metrics": metrics}
+        log_files = self.log_files + (collect_list or [])
+        if log_files:
+            config["logs"] = {"logs_collected": {"files": {"collect_list": log_files}}}
+            if self.force_flush_interval is not None:
+                # events are batched into one PutLogEvents per file until the interval
+                config["logs"]["force_flush_interval"] = self.force_flush_interval
+
+        metric_count, datapoints = estimate_metrics(config)
+        if self.max_metrics is not None and metric_count > self.max_metrics:
+            raise ValueError(f"CloudWatch agent profile {self.name}: about {metric_count} "
+                             f"metrics, over the budget of {self.max_metrics}")
+        if self.max_datapoints_per_minute is not None \
+                and datapoints > self.max_datapoints_per_minute:
+            raise ValueError(f"CloudWatch agent profile {self.name}: about {datapoints:.0f} "
+                             f"datapoints per minute, over the budget of "
+                             f"{self.max_datapoints_per_minute}")
+        return config
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "AgentProfile":
+        """creating a profile from a context object"""
+        spec = dict(spec)
+        plugins = [MetricPlugin.from_spec(plugin) for plugin in spec.pop("plugins")]
+        return cls(name, plugins, **spec)
+
+    @classmethod
+    def from_context(cls, scope: Construct, component: str, cid: str) -> "AgentProfile":
+        """selecting the profile of an instance from the cw_agent_profiles context,
+        by instance id (AMH1) first, then by component (AMH), then "default"."""
+        selected = get_component_setting(scope, "cw_agent_profiles", [cid, component],
+                                         "standard")
+        if isinstance(selected, dict):
+            return cls.from_spec(cid, selected)
+        if selected not in AGENT_PROFILES:
+            raise ValueError(f"Unknown CloudWatch agent profile {selected} for {cid}, "
+                             f"choose from {', '.join(AGENT_PROFILES)}")
+        return AGENT_PROFILES[selected]
+
+
+def estimate_metrics(config: dict) -> Tuple[int, float]:
+    """estimated number of custom metrics and datapoints per minute an agent
+    configuration publishes from one instance, statsd metrics not included"""
+    metrics = config["metrics"]
+    dimension_sets = 1 + len(metrics.get("aggregation_dimensions", []))
+    metric_count = 0
+    datapoints = 0.0
+    for plugin, plugin_config in metrics["metrics_collected"].items():
+        if plugin == "statsd":
+            continue
+        resources = plugin_config.get("resources")
+        if resources is None:
+            resource_count = 1
+        elif "*" in resources:
+            resource_count = WILDCARD_RESOURCE_ESTIMATE
+        else:
+            resource_count = len(resources)
+        if plugin == "cpu" and plugin_config.get("totalcpu", True) and resources is not None:
+            resource_count += 1
+        count = len(plugin_config["measurement"]) * resource_count * dimension_sets
+        metric_count += count
+        datapoints += count * 60 / plugin_config.get("metrics_collection_interval", 60)
+    return metric_count, datapoints
+
+
+def create_agent_config_parameter(scope: NestedStack, cid: str, config: dict,
+                                  token_values: Dict[str, str] = None) -> _ssm.StringParameter:
+    """store the agent configuration in the SSM parameter the instance fetches it from,
+    the instance role can read the AmazonCloudWatch-* parameters. The tier is picked on
+    the size of the configuration with its tokens replaced by token_values, the values they
+    resolve to, and is advanced when a token is left unresolved"""
+    value = json.dumps(config, separators=(",", ":"), sort_keys=True)
+    resolved_value = value
+    for token, token_value in (token_values or {}).items():
+        resolved_value = resolved_value.replace(token, token_value)
+    tier = _ssm.ParameterTier.ADVANCED
+    if not Token.is_unresolved(resolved_value) \
+            and len(resolved_value.encode()) <= STANDARD_PARAMETER_BYTES:
+        tier = _ssm.ParameterTier.STANDARD
+    return _ssm.StringParameter(
+        scope, "CWAgentConfig",
+        parameter_name="AmazonCloudWatch-" + scope.nested_stack_parent.stack_name + "-" + cid,
+        string_value=value, tier=tier,
+        description=f"CloudWatch agent configuration of {cid}")
+
+
+AGENT_PROFILES = {
+    # every metric each second on every resource and /var/log in a single log group
+    "legacy": AgentProfile("legacy", [
+        MetricPlugin("cpu", ["cpu_usage_idle", "cpu_usage_iowait", "cpu_usage_user",
+                             "cpu_usage_system"], interval=1, resources=["*"], totalcpu=False),
+        MetricPlugin("disk", ["used_percent", "inodes_free"], interval=1, resources=["*"]),
+        MetricPlugin("diskio", ["io_time"], interval=1, resources=["*"]),
+        MetricPlugin("mem", ["mem_used_percent"], interval=1),
+        MetricPlugin("swap", ["swap_used_percent"], interval=1),
+    ], append_dimensions=["AutoScalingGroupName", "ImageId", "InstanceId", "InstanceType"],
+                           log_files=DEFAULT_LOG_FILES),
+    # standard resolution, total cpu only, disks of the storage layout only
+    "standard": AgentProfile("standard", [
+        MetricPlugin("cpu", ["cpu_usage_iowait", "cpu_usage_user", "cpu_usage_system"],
+                     totalcpu=True),
+        MetricPlugin("disk", ["used_percent"], interval=300, resources=RESOURCES_MOUNTS,
+                     drop_device=True),
+        MetricPlugin("diskio", ["io_time", "write_bytes", "read_bytes"],
+                     resources=RESOURCES_DEVICES),
+        MetricPlugin("mem", ["mem_used_percent"]),
+        MetricPlugin("swap", ["swap_used_percent"], interval=300),
+    ], force_flush_interval=15, max_metrics=30, max_datapoints_per_minute=30),
+    # SAG/SNL is latency bound: high resolution cpu and open connections
+    "sagsnl": AgentProfile("sagsnl", [
+        MetricPlugin("cpu", ["cpu_usage_iowait", "cpu_usage_user", "cpu_usage_system",
+                             "cpu_usage_steal"], interval=10, totalcpu=True),
+        MetricPlugin("netstat", ["tcp_established", "tcp_time_wait"], interval=10),
+        MetricPlugin("disk", ["used_percent"], interval=300, resources=RESOURCES_MOUNTS,
+                     drop_device=True),
+        MetricPlugin("mem", ["mem_used_percent"]),
+        MetricPlugin("swap", ["swap_used_percent"], interval=300),
+    ], force_flush_interval=10, max_metrics=30, max_datapoints_per_minute=90),
+    # AMH is bound by message store io and JVM memory: high resolution diskio and memory,
+    # aggregated per Auto Scaling group for the AMH fleet
+    "amh": AgentProfile("amh", [
+        MetricPlugin("cpu", ["cpu_usage_iowait", "cpu_usage_user", "cpu_usage_system"],
+                     totalcpu=True),
+        MetricPlugin("diskio", ["io_time", "write_bytes", "writes"], interval=10,
+                     resources=RESOURCES_DEVICES),
+        MetricPlugin("mem", ["mem_used_percent"], interval=10),
+        MetricPlugin("disk", ["used_percent"], interval=300, resources=RESOURCES_MOUNTS,
+                     drop_device=True),
+        MetricPlugin("swap", ["swap_used_percent"], interval=300),
+    ], append_dimensions=["AutoScalingGroupName", "InstanceId"],
+                        aggregation_dimensions=[["AutoScalingGroupName"]],
+                        force_flush_interval=10, max_metrics=60, max_datapoints_per_minute=300),
+}
@@ -1,16 +1,32 @@
 """Base class for EC2 instance"""
+from typing import Dict, List
+
 from aws_cdk import (
     aws_ec2 as _ec2,
+    aws_iam as _iam,
     aws_kms as _kms,
 )
 from constructs import Construct
-from aws_cdk import NestedStack, Aws
+from aws_cdk import NestedStack, Aws, CfnWaitConditionHandle
 
 from cdk_ec2_key_pair import KeyPair
 
-from network.generic_network import GenericNetwork
+from base_host_group.boot_readiness import AGENT_CTL, create_ready_handle, \
+    get_boot_start_commands, get_endpoint_wait_seconds, get_readiness_commands, \
+    get_s3_check_url, get_ssm_check_url, get_wait_for_endpoint_commands, timed_step
+from base_host_group.cw_agent_config import AgentProfile, create_agent_config_parameter
+from base_host_group.log_collection import get_collect_list, get_log_group_names
+from base_host_group.network_tuning import NetworkTuning
+from base_host_group.performance_tier import PerformanceTier
+from base_host_group.storage_layout import StorageLayout
+from network.generic_network import GenericNetwork, get_vpn_cidrs
+from network.swift_vpc_endpoints import get_endpoint_settings, get_interface_services
 from security.generic_security import GenericSecurity
 
+# pins the endpoint names to the endpoints of the AZ, see get_az_local_endpoint_commands
+ENDPOINT_HOSTS_SCRIPT = "/usr/local/sbin/swift-endpoint-hosts"
+ENDPOINT_HOSTS_MARKER = "# swift-endpoint-hosts"
+
 
 class HostGroup(NestedStack):
     """Base class for EC2 instance"""
@@ -26,39 +42,26 @@ class HostGroup(NestedStack):
                  vpc_subnets: _ec2.SubnetSelection = None,
                  ami_id: str = None,
                  private_ip: str = None,
+                 performance_tier: PerformanceTier = None,
+                 storage_layout: StorageLayout = None,
+                 placement_group: _ec2.CfnPlacementGroup = None,
+                 log_groups: Dict[str, str] = None,
+                 network_tuning: NetworkTuning = None,
                  **kwargs):
         super().__init__(scope, cid, **kwargs)
 
         self.instance_id = ""
         self._workload_key = workload_key
-        sec_group = security.get_security_group(component + "SG")
-        if not sec_group:
-            sec_group = security.create_security_group(component + "SG")
-            endpt_sg = security.get_security_group("VPCEndpointSG")
-            endpt_sg.connections.allow_from(
-                sec_group,
-                port_range=_ec2.Port(
-                    protocol=_ec2.Protocol.TCP,
-                    string_representation=component + " -> Endpoint (443)",
-                    from_port=443,
-                    to_port=443
-                ),
-                description="VPC Endpoint Ingress rule from " + component
-            )
-            sec_group.connections.allow_to(
-                endpt_sg,
-                port_range=_ec2.Port(
-                    protocol=_ec2.Protocol.TCP,
-                    string_representation=component + " -> Endpoint (443)",
-                    from_port=443,
-                    to_port=443
-                ),
-                description="Egress rule to VPC Endpoint for " + component
-
-            )
-
-        instance_type = _ec2.InstanceType.of(instance_class=_ec2.InstanceClass.STANDARD5,
-                                             instance_size=_ec2.InstanceSize.XLARGE)
+        sec_group = get_host_security_group(security, component)
+
+        if performance_tier is None:
+            performance_tier = PerformanceTier.from_context(self, component, cid)
+        self.performance_tier = performance_tier
+        if network_tuning is None:
+            network_tuning = NetworkTuning.from_context(self, component, cid)
+        network_tuning.check(cid, performance_tier)
+        self.network_tuning = network_tuning
+
         key_name = None
         if ops_key is not None:
             key_name = ops_key.key_pair_name
@@ -66,33 +69,68 @@ class HostGroup(NestedStack):
         if vpc_subnets is None:
             vpc_subnets = _ec2.SubnetSelection(subnet_group_name=component)
 
-        user_data = None
-        if ami_id is None:
-            machine_image = _ec2.MachineImage.lookup(
-                name="RHEL-8.3.0_HVM-????????-x86_64-0-Hourly2-GP2", owners=["309956199498"])
-            user_data = _ec2.UserData.for_linux()
-            for line in get_user_data(self.region, self.node.try_get_context("qs_s3_bucket")):
-                user_data.add_commands(line)
-        else:
-            machine_image = _ec2.MachineImage.lookup(name="*", filters={"image-id": [ami_id]})
+        if storage_layout is None:
+            storage_layout = StorageLayout.from_context(self, component, cid)
+        self.storage_layout = storage_layout
+        # the instance is placed in the first subnet of the selection
+        subnet = network.get_vpc().select_subnets(
+            subnet_group_name=vpc_subnets.subnet_group_name,
+            availability_zones=vpc_subnets.availability_zones).subnets[0]
+        volumes = storage_layout.create_volumes(self, subnet, workload_key)
 
-        instance_role = security.get_instance_role(component)
-        if not instance_role:
-            instance_role = security.create_instance_role(component)
+        machine_image = get_machine_image(ami_id)
+        self.ready_handle = create_ready_handle(self)
+        user_data = create_user_data(self, component, cid, storage_layout,
+                                     storage_layout.get_mount_commands(volumes),
+                                     ami_id, log_groups, self.ready_handle.ref,
+                                     get_endpoint_cidrs(self, network, [subnet]),
+                                     network_tuning.get_commands(get_vpn_cidrs(self)))
+
+        instance_role = get_host_instance_role(security, component)
 
         # noinspection PyTypeChecker
-        self.instance = _ec2.Instance(self, cid, instance_type=instance_type,
+        self.instance = _ec2.Instance(self, cid,
+                                      instance_type=performance_tier.get_instance_type(),
                                       machine_image=machine_image,
-                                      block_devices=[_ec2.BlockDevice(
-                                          device_name="/dev/sda1",
-                                          volume=_ec2.BlockDeviceVolume.ebs(
-                                              volume_size=100, encrypted=True))],
+                                      block_devices=storage_layout.get_block_devices(),
                                       vpc=network.get_vpc(),
                                       role=instance_role, security_group=sec_group,
                                       vpc_subnets=vpc_subnets, key_name=key_name,
                                       private_ip_address=private_ip, user_data=user_data)
+        performance_tier.apply(self.instance)
+        if placement_group is not None:
+            if placement_group.strategy == "cluster" and performance_tier.family.startswith("t"):
+                raise ValueError(f"{cid}: burstable {performance_tier.instance_type} "
+                                 "instances cannot be placed in a cluster placement group")
+            cfn_instance: _ec2.CfnInstance = self.instance.node.default_child
+            cfn_instance.placement_group_name = placement_group.ref
+        self.launch_template = None
+        if network_tuning.uses_launch_template:
+            self.launch_template = self.attach_launch_template(
+                network_tuning, sec_group, subnet.subnet_id, private_ip)
+        storage_layout.attach_volumes(self, self.instance, volumes)
         self.instance_id = self.instance.instance_id
 
+    def attach_launch_template(self, network_tuning: NetworkTuning,
+                               sec_group: _ec2.ISecurityGroup, subnet_id: str,
+                               private_ip: str = None) -> _ec2.LaunchTemplate:
+        """launching the instance from a launch template holding the metadata options and
+        the network interface of the tuning. Only these launch settings are in the
+        template, the instance keeps the others so that they are updated in place; with
+        ENA Express the network interface holds the subnet, security group and IP address"""
+        launch_template = _ec2.LaunchTemplate(self, "LaunchTemplate",
+                                              **network_tuning.get_launch_template_options())
+        cfn_instance: _ec2.CfnInstance = self.instance.node.default_child
+        if network_tuning.ena_express:
+            network_tuning.apply_to_launch_template(launch_template, sec_group, subnet_id,
+                                                    private_ip)
+            for name in ["SubnetId", "SecurityGroupIds", "PrivateIpAddress"]:
+                cfn_instance.add_property_deletion_override(name)
+        cfn_instance.launch_template = _ec2.CfnInstance.LaunchTemplateSpecificationProperty(
+            launch_template_id=launch_template.launch_template_id,
+            version=launch_template.latest_version_number)
+        return launch_template
+
     def get_instance_id(self) -> str:
         """get instance id as string"""
         return self.instance_id
@@ -101,11 +139,98 @@ class HostGroup(NestedStack):
         """get instance reference"""
         return self.instance
 
+    def get_ready_handle(self) -> CfnWaitConditionHandle:
+        """get the wait condition handle the instance signals when ready"""
+        return self.ready_handle
+
+
+def get_host_security_group(security: GenericSecurity, component: str) -> _ec2.SecurityGroup:
+    """getting the security group of a component, creating it with the
+    VPC endpoint rules on first use"""
+    sec_group = security.get_security_group(component + "SG")
+    if not sec_group:
+        sec_group = security.create_security_group(component + "SG")
+        security.add_security_group_connection(
+            component + "SG", "VPCEndpointSG", _ec2.Protocol.TCP, 443,
+            description="VPC Endpoint rule for " + component,
+            name=component + " -> Endpoint (443)")
+    return sec_group
+
+
+def get_host_instance_role(security: GenericSecurity, component: str) -> _iam.IRole:
+    """getting the instance role of a component, creating it on first use"""
+    instance_role = security.get_instance_role(component)
+    if not instance_role:
+        instance_role = security.create_instance_role(component)
+    return instance_role
+
+
+def get_machine_image(ami_id: str = None) -> _ec2.IMachineImage:
+    """getting the provided AMI, or the RHEL 8 AMI when none is provided"""
+    if ami_id is None:
+        return _ec2.MachineImage.lookup(
+            name="RHEL-8.3.0_HVM-????????-x86_64-0-Hourly2-GP2", owners=["309956199498"])
+    return _ec2.MachineImage.lookup(name="*", filters={"image-id": [ami_id]})
+
+
+def create_user_data(scope: NestedStack, component: str, cid: str,
+                     storage_layout: StorageLayout, mount_commands: List[str],
+                     ami_id: str = None, log_groups: Dict[str, str] = None,
+                     ready_url: str = None,
+                     endpoint_cidrs: Dict[str, str] = None,
+                     network_commands: List[str] = None) -> _ec2.UserData:
+    """User data mounting the volumes and configuring the CloudWatch agent, installing the
+    agents first on the stock RHEL AMI. A provided AMI (such as the golden AMI built by
+    golden_ami) already has the agents, only the steps varying per instance are run.
+    Every step is timed, see boot_readiness, and ready_url is signalled once the agents
+    and volumes are up. With endpoint_cidrs, the CIDR range of the endpoint subnet by AZ,
+    the endpoints are resolved to the ENI in the AZ of the instance. The network_commands
+    of the network tuning run first, before any download"""
+    agent_config = AgentProfile.from_context(scope, component, cid).build(
+        storage_layout, get_collect_list(scope, component, log_groups or {}))
+    # the log group names are tokens of the parent stack here, sized by their actual names
+    log_group_names = get_log_group_names(scope.nested_stack_parent, component)
+    agent_config_parameter = create_agent_config_parameter(
+        scope, cid, agent_config, {token: log_group_names[name]
+                                   for name, token in (log_groups or {}).items()})
 
-def get_user_data(region: str, bucket_name: str):
-    """User data for the ec2"""
+    wait_seconds = get_endpoint_wait_seconds(scope)
+    user_data_lines = get_boot_start_commands()
+    if network_commands:
+        user_data_lines += timed_step("network_tuning", network_commands)
+    user_data_lines += timed_step("mount", mount_commands)
+    if ami_id is None:
+        # the packages come through the S3 gateway endpoint
+        user_data_lines += timed_step(
+            "wait_s3", get_wait_for_endpoint_commands(get_s3_check_url(scope.region),
+                                                      wait_seconds))
+        user_data_lines += timed_step("install_agents",
+                                      get_agent_install_commands(scope.region))
+    user_data_lines += timed_step(
+        "wait_ssm", get_wait_for_endpoint_commands(get_ssm_check_url(scope.region),
+                                                   wait_seconds))
+    if endpoint_cidrs:
+        services = list(get_interface_services(get_endpoint_settings(scope)))
+        user_data_lines += timed_step(
+            "endpoint_dns", get_az_local_endpoint_commands(scope.region, services,
+                                                           endpoint_cidrs))
+    user_data_lines += timed_step(
+        "agent_config", get_agent_config_commands(agent_config_parameter.parameter_name))
+    if ready_url is not None:
+        user_data_lines += get_readiness_commands(
+            ready_url, component,
+            [volume.mount_point for volume in storage_layout.volumes if volume.mount_point])
+
+    user_data = _ec2.UserData.for_linux()
+    for line in user_data_lines:
+        user_data.add_commands(line)
+    return user_data
+
+
+def get_agent_install_commands(region: str) -> List[str]:
+    """commands installing the SSM and CloudWatch agents on RHEL 8,
+    run on every boot of the stock AMI and once when baking the golden AMI"""
     return [
-        "sleep 120",
         "dnf config-manager --disable rhui-client-config-server-8",
         "dnf config-manager --disable rhel-8-appstream-rhui-rpms",
         "dnf config-manager --disable rhel-8-baseos-rhui-rpms",
@@ -116,9 +241,84 @@ def get_user_data(region: str, bucket_name: str):
         "curl https://s3." + region + "." + Aws.URL_SUFFIX + "/amazoncloudwatch-agent-" + region +
         "/redhat/amd64/latest/amazon-cloudwatch-agent.rpm -o /tmp/amazon-cloudwatch-agent.rpm",
         "rpm -U /tmp/amazon-cloudwatch-agent.rpm",
-        "curl https://" + bucket_name + "-" + region + ".s3." + region +
-        "." + Aws.URL_SUFFIX + "/" +
-        "quickstart-swift-digital-connectivity/assets/cw_agent_config.json -o /tmp/cw_agent_config.json",
-        "/opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl"
-        " -a fetch-config -m ec2 -s -c file:/tmp/cw_agent_config.json"
+    ]
+
+
+def get_endpoint_cidrs(scope: Construct, network: GenericNetwork,
+                       subnets: List[_ec2.ISubnet]) -> Dict[str, str]:
+    """CIDR range of the endpoint subnet by AZ when the hosts resolve the endpoints in
+    their own AZ (az_local_dns of the vpc_endpoints context), checking that every AZ
+    of the subnets has an endpoint subnet"""
+    if not get_endpoint_settings(scope)["az_local_dns"]:
+        return {}
+    endpoint_cidrs = network.get_endpoint_subnet_cidrs()
+    for subnet in subnets:
+        if subnet.availability_zone not in endpoint_cidrs:
+            raise ValueError(f"{scope.node.id}: no endpoint subnet in "
+                             f"{subnet.availability_zone}")
+    return endpoint_cidrs
+
+
+def get_az_local_endpoint_commands(region: str, services: List[str],
+                                   endpoint_cidrs: Dict[str, str]) -> List[str]:
+    """commands pinning the endpoint names in /etc/hosts to the endpoint ENI of the AZ of
+    the instance: the private DNS names resolve to the ENIs of every AZ. The pins are
+    refreshed every 5 minutes by a systemd timer, so a replaced endpoint is picked up"""
+    hosts = " ".join(service + "." + region + "." + Aws.URL_SUFFIX for service in services)
+    return [
+        f"cat > {ENDPOINT_HOSTS_SCRIPT} <<'EOF'",
+        "#!/bin/bash",
+        "imds_token=$(curl -s -X PUT -H 'X-aws-ec2-metadata-token-ttl-seconds: 60' "
+        "http://169.254.169.254/latest/api/token)",
+        "az=$(curl -s -H \"X-aws-ec2-metadata-token: $imds_token\" "
+        "http://169.254.169.254/latest/meta-data/placement/availability-zone)",
+        "case \"$az\" in",
+    ] + [f"  {zone}) endpoint_cidr={cidr} ;;" for zone, cidr in endpoint_cidrs.items()] + [
+        "  *) exit 0 ;;",
+        "esac",
+        "in_cidr() {",
+        "  awk -v ip=\"$1\" -v cidr=\"$2\" 'function n(a, p) { split(a, p, \".\"); "
+        "return ((p[1] * 256 + p[2]) * 256 + p[3]) * 256 + p[4] } "
+        "BEGIN { split(cidr, c, \"/\"); m = 2 ^ (32 - c[2]); "
+        "exit !(int(n(ip) / m) == int(n(c[1]) / m)) }'",
+        "}",
+        # the previous pins go first, getent would answer with them
+        f"sed -i '/ {ENDPOINT_HOSTS_MARKER}$/d' /etc/hosts",
+        f"for host in {hosts}; do",
+        "  for ip in $(getent ahostsv4 \"$host\" | awk '{print $1}' | sort -u); do",
+        "    if in_cidr \"$ip\" \"$endpoint_cidr\"; then",
+        f"      echo \"$ip $host {ENDPOINT_HOSTS_MARKER}\" >> /etc/hosts",
+        "      break",
+        "    fi",
+        "  done",
+        "done",
+        "EOF",
+        f"chmod 755 {ENDPOINT_HOSTS_SCRIPT}",
+        "cat > /etc/systemd/system/swift-endpoint-hosts.service <<'EOF'",
+        "[Unit]",
+        "Description=Pin the VPC endpoint names to the endpoints of the AZ",
+        "[Service]",
+        "Type=oneshot",
+        f"ExecStart={ENDPOINT_HOSTS_SCRIPT}",
+        "EOF",
+        "cat > /etc/systemd/system/swift-endpoint-hosts.timer <<'EOF'",
+        "[Timer]",
+        "OnBootSec=5min",
+        "OnUnitActiveSec=5min",
+        "[Install]",
+        "WantedBy=timers.target",
+        "EOF",
+        ENDPOINT_HOSTS_SCRIPT,
+        "systemctl daemon-reload",
+        "systemctl enable --now swift-endpoint-hosts.timer",
+    ]
+
+
+def get_agent_config_commands(agent_config_parameter: str) -> List[str]:
+    """commands starting the CloudWatch agent with the configuration of the instance,
+    when the agent is installed"""
+    return [
+        f"if [ -x {AGENT_CTL} ]; then",
+        f"  {AGENT_CTL} -a fetch-config -m ec2 -s -c ssm:" + agent_config_parameter,
+        "fi",
     ]
@@ -0,0 +1,118 @@
+"""Log files the CloudWatch agent ships per component, and their log groups"""
+from typing import Dict, List
+
+from aws_cdk import aws_logs as _logs
+from aws_cdk import Stack
+from constructs import Construct
+
+from utilities.context_values import get_context_object
+
+# log4j / java.util.logging style timestamps of the SWIFT applications
+JAVA_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+JAVA_LINE_START = "^\\d{4}-\\d{2}-\\d{2} \\d{2}:\\d{2}:\\d{2}"
+SYSLOG_TIMESTAMP_FORMAT = "%b %d %H:%M:%S"
+
+
+class LogSource:
+    """Log files collected into one log group, a line not matching multi_line_start_pattern
+    (a JVM stack trace line) is appended to the previous event"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name: str, file_path: str,
+                 timestamp_format: str = None,
+                 multi_line_start_pattern: str = None,
+                 exclude_pattern: str = None,
+                 retention_days: int = 90) -> None:
+        self.name = name
+        self.file_path = file_path
+        self.timestamp_format = timestamp_format
+        self.multi_line_start_pattern = multi_line_start_pattern
+        self.exclude_pattern = exclude_pattern
+        self.retention_days = retention_days
+
+    def to_config(self, log_group_name: str) -> dict:
+        """collect_list entry of the agent configuration"""
+        config = {"file_path": self.file_path,
+                  "log_group_name": log_group_name,
+                  "log_stream_name": "{instance_id}"}
+        if self.timestamp_format is not None:
+            config["timestamp_format"] = self.timestamp_format
+        if self.multi_line_start_pattern is not None:
+            config["multi_line_start_pattern"] = self.multi_line_start_pattern
+        if self.exclude_pattern is not None:
+            # dropped on the instance, never sent to PutLogEvents
+            config["filters"] = [{"type": "exclude", "expression": self.exclude_pattern}]
+        return config
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "LogSource":
+        """creating a log source from a context object"""
+        return cls(**spec)
+
+
+# operating system logs kept for every component, the security log for the CSP audit trail
+OS_LOG_SOURCES = [
+    LogSource("messages", "/var/log/messages", timestamp_format=SYSLOG_TIMESTAMP_FORMAT,
+              retention_days=30),
+    LogSource("secure", "/var/log/secure", timestamp_format=SYSLOG_TIMESTAMP_FORMAT,
+              retention_days=400),
+]
+
+# application logs, on the log volume of the sagsnl and amh storage layouts
+LOG_SOURCES = {
+    "SAGSNL": [
+        LogSource("sag", "/swift/SAGSNL/log/gateway/**.log",
+                  timestamp_format=JAVA_TIMESTAMP_FORMAT,
+                  multi_line_start_pattern=JAVA_LINE_START, exclude_pattern=" DEBUG ",
+                  retention_days=400),
+        LogSource("snl", "/swift/SAGSNL/log/swiftnet/**.log",
+                  timestamp_format=JAVA_TIMESTAMP_FORMAT,
+                  multi_line_start_pattern=JAVA_LINE_START, exclude_pattern=" DEBUG ",
+                  retention_days=400),
+    ],
+    "AMH": [
+        LogSource("amh", "/swift/AMH/log/amh/**.log", timestamp_format=JAVA_TIMESTAMP_FORMAT,
+                  multi_line_start_pattern=JAVA_LINE_START, exclude_pattern=" DEBUG ",
+                  retention_days=400),
+        # JVM stdout and garbage collection, for heap and pause analysis
+        LogSource("jvm", "/swift/AMH/log/jvm/*.log",
+                  multi_line_start_pattern="^\\[\\d{4}-\\d{2}-\\d{2}", retention_days=30),
+    ],
+}
+
+
+def get_log_sources(scope: Construct, component: str) -> List[LogSource]:
+    """log sources of a component, from the log_sources context when set there"""
+    specs = get_context_object(scope, "log_sources", {}).get(component)
+    sources = LOG_SOURCES.get(component, []) if specs is None \
+        else [LogSource.from_spec(spec) for spec in specs]
+    return OS_LOG_SOURCES + sources
+
+
+def get_log_group_names(scope: Construct, component: str) -> Dict[str, str]:
+    """names of the log groups of the component in the stack of scope, by source name"""
+    return {source.name: "/swift/" + Stack.of(scope).stack_name + "/" + component + "/" +
+                         source.name
+            for source in get_log_sources(scope, component)}
+
+
+def create_log_groups(scope: Construct, component: str) -> Dict[str, str]:
+    """create a log group with retention per log source of the component,
+    returns the log group names by source name"""
+    names = get_log_group_names(scope, component)
+    log_groups = {}
+    for source in get_log_sources(scope, component):
+        log_group = _logs.CfnLogGroup(
+            scope, component + source.name.capitalize() + "LogGroup",
+            log_group_name=names[source.name],
+            retention_in_days=source.retention_days)
+        log_groups[source.name] = log_group.ref
+    return log_groups
+
+
+def get_collect_list(scope: Construct, component: str,
+                     log_groups: Dict[str, str]) -> List[dict]:
+    """collect_list of the agent configuration shipping the logs of a component
+    to the log groups created by create_log_groups"""
+    return [source.to_config(log_groups[source.name])
+            for source in get_log_sources(scope, component) if source.name in log_groups]
@@ -0,0 +1,197 @@
+"""Network tuning of host group instances, launch template settings and kernel networking.
+
+Inside the VPC the instances use jumbo frames (MTU 9001). Traffic to SWIFT and the HSM
+leaves through the VPN, whose tunnels carry 1446 byte packets at most: the routes to those
+ranges lock the MTU and advertise a clamped MSS, so no connection relies on path MTU
+discovery across the VPN. The TCP buffers are sized for bulk AMH <-> SAGSNL and AMH <-> MQ
+transfers. ENA Express (SRD) raises the bandwidth of a single flow between instances of
+the same AZ, as the AMH and SAGSNL of a cluster placement pair.
+
+The kernel settings are applied by the user data and by a NetworkManager dispatcher
+script, so they survive reboots and DHCP renewals. The instance metadata options and ENA
+Express are only available through a launch template.
+"""
+from typing import List
+
+from aws_cdk import aws_ec2 as _ec2
+from constructs import Construct
+
+from base_host_group.performance_tier import PerformanceTier
+from utilities.context_values import get_component_setting
+
+# smallest size (its multiple of xlarge) supporting ENA Express by instance family, the
+# metal sizes support it too
+ENA_EXPRESS_MIN_SIZES = {"c6gn": 16, "c6in": 12, "c7gn": 16, "c7i": 12, "m6idn": 12,
+                         "m6in": 12, "m7i": 12, "r6idn": 12, "r6in": 12, "r7i": 12}
+JUMBO_MTU = 9001
+# largest packet and TCP segment of a Site-to-Site VPN tunnel
+VPN_MTU = 1446
+VPN_MSS = 1406
+TUNING_SCRIPT = "/usr/local/sbin/swift-network-tuning"
+DISPATCHER_SCRIPT = "/etc/NetworkManager/dispatcher.d/90-swift-network-tuning"
+SYSCTL_FILE = "/etc/sysctl.d/90-swift-network.conf"
+
+
+def supports_ena_express(instance_type: str) -> bool:
+    """whether an instance type supports ENA Express, ie c6in.12xlarge"""
+    family, size = instance_type.split(".")
+    if family not in ENA_EXPRESS_MIN_SIZES:
+        return False
+    if size.startswith("metal"):
+        return True
+    if not size.endswith("xlarge"):
+        return False
+    return int(size[:-len("xlarge")] or 1) >= ENA_EXPRESS_MIN_SIZES[family]
+
+
+class NetworkTuning:
+    """Launch template and kernel network settings of a host group instance"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name: str,
+                 require_imdsv2: bool = False,
+                 metadata_hop_limit: int = None,
+                 ena_express: bool = False,
+                 ena_express_udp: bool = False,
+                 jumbo_frames: bool = False,
+                 clamp_vpn_mss: bool = False,
+                 tcp_buffer_bytes: int = None) -> None:
+        self.name = name
+        self.require_imdsv2 = require_imdsv2
+        self.metadata_hop_limit = metadata_hop_limit
+        self.ena_express = ena_express
+        self.ena_express_udp = ena_express_udp
+        self.jumbo_frames = jumbo_frames
+        self.clamp_vpn_mss = clamp_vpn_mss
+        self.tcp_buffer_bytes = tcp_buffer_bytes
+
+        if ena_express_udp and not ena_express:
+            raise ValueError(f"Network tuning {name}: ena_express_udp needs ena_express")
+
+    @property
+    def uses_launch_template(self) -> bool:
+        """whether an instance needs a launch template for these settings"""
+        return self.require_imdsv2 or self.metadata_hop_limit is not None or self.ena_express
+
+    def check(self, cid: str, performance_tier: PerformanceTier) -> None:
+        """checking the instance type of the tier supports the settings"""
+        if self.ena_express and not supports_ena_express(performance_tier.instance_type):
+            raise ValueError(f"{cid}: {performance_tier.instance_type} does not support "
+                             f"ENA Express of network tuning {self.name}")
+
+    def get_launch_template_options(self) -> dict:
+        """instance metadata options of the LaunchTemplate construct"""
+        return {"require_imdsv2": self.require_imdsv2 or None,
+                "http_put_response_hop_limit": self.metadata_hop_limit}
+
+    def apply_to_launch_template(self, launch_template: _ec2.LaunchTemplate,
+                                 security_group: _ec2.ISecurityGroup,
+                                 subnet_id: str = None, private_ip: str = None) -> None:
+        """setting ENA Express on the primary network interface, which then holds the
+        security group, and the subnet and private IP address of a single instance"""
+        if not self.ena_express:
+            return
+        network_interface = {
+            "DeviceIndex": 0,
+            "Groups": [security_group.security_group_id],
+            "EnaSrdSpecification": {
+                "EnaSrdEnabled": True,
+                "EnaSrdUdpSpecification": {"EnaSrdUdpEnabled": self.ena_express_udp}},
+        }
+        if subnet_id is not None:
+            network_interface["SubnetId"] = subnet_id
+        if private_ip is not None:
+            network_interface["PrivateIpAddress"] = private_ip
+        cfn_launch_template: _ec2.CfnLaunchTemplate = launch_template.node.default_child
+        cfn_launch_template.add_property_deletion_override("LaunchTemplateData.SecurityGroupIds")
+        cfn_launch_template.add_property_override("LaunchTemplateData.NetworkInterfaces",
+                                                  [network_interface])
+
+    def get_commands(self, vpn_cidrs: List[str]) -> List[str]:
+        """user data installing the tuning script, its dispatcher script and the sysctl
+        settings, and applying them"""
+        script = []
+        if self.jumbo_frames:
+            script += [
+                f"[ \"$(cat /sys/class/net/$dev/mtu)\" = {JUMBO_MTU} ] || "
+                f"ip link set dev \"$dev\" mtu {JUMBO_MTU}",
+            ]
+        if self.clamp_vpn_mss and vpn_cidrs:
+            script += [
+                f"for cidr in {' '.join(vpn_cidrs)}; do",
+                "  ip route replace \"$cidr\" via \"$gw\" dev \"$dev\" "
+                f"mtu lock {VPN_MTU} advmss {VPN_MSS}",
+                "done",
+            ]
+        sysctl = []
+        if self.tcp_buffer_bytes is not None:
+            sysctl = [
+                f"net.core.rmem_max = {self.tcp_buffer_bytes}",
+                f"net.core.wmem_max = {self.tcp_buffer_bytes}",
+                f"net.ipv4.tcp_rmem = 4096 131072 {self.tcp_buffer_bytes}",
+                f"net.ipv4.tcp_wmem = 4096 65536 {self.tcp_buffer_bytes}",
+                "net.ipv4.tcp_mtu_probing = 1",
+                "net.ipv4.tcp_slow_start_after_idle = 0",
+            ]
+
+        commands = []
+        if script:
+            commands += [
+                f"cat > {TUNING_SCRIPT} <<'EOF'",
+                "#!/bin/bash",
+                "dev=$(ip -4 route show default | awk '{print $5; exit}')",
+                "gw=$(ip -4 route show default | awk '{print $3; exit}')",
+                "[ -n \"$dev\" ] || exit 0",
+            ] + script + [
+                "EOF",
+                f"chmod 755 {TUNING_SCRIPT}",
+                f"printf '#!/bin/bash\\n[ \"$2\" = up ] && {TUNING_SCRIPT}\\nexit 0\\n' "
+                f"> {DISPATCHER_SCRIPT}",
+                f"chmod 755 {DISPATCHER_SCRIPT}",
+                TUNING_SCRIPT,
+            ]
+        if sysctl:
+            commands += [f"cat > {SYSCTL_FILE} <<'EOF'"] + sysctl + [
+                "EOF",
+                f"sysctl -q -p {SYSCTL_FILE}",
+            ]
+        return commands
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "NetworkTuning":
+        """creating a tuning from a context object"""
+        return cls(name, require_imdsv2=spec.get("require_imdsv2", False),
+                   metadata_hop_limit=spec.get("metadata_hop_limit"),
+                   ena_express=spec.get("ena_express", False),
+                   ena_express_udp=spec.get("ena_express_udp", False),
+                   jumbo_frames=spec.get("jumbo_frames", False),
+                   clamp_vpn_mss=spec.get("clamp_vpn_mss", False),
+                   tcp_buffer_bytes=spec.get("tcp_buffer_bytes"))
+
+    @classmethod
+    def from_context(cls, scope: Construct, component: str, cid: str) -> "NetworkTuning":
+        """selecting the tuning of an instance from the network_tunings context,
+        by instance id (AMH1) first, then by component (AMH), then "default"."""
+        selected = get_component_setting(scope, "network_tunings", [cid, component], "legacy")
+        if isinstance(selected, dict):
+            return cls.from_spec(cid, selected)
+        if selected not in NETWORK_TUNINGS:
+            raise ValueError(f"Unknown network tuning {selected} for {cid}, "
+                             f"choose from {', '.join(NETWORK_TUNINGS)}")
+        return NETWORK_TUNINGS[selected]
+
+
+NETWORK_TUNINGS = {
+    # no launch template settings nor kernel tuning
+    "legacy": NetworkTuning("legacy"),
+    # IMDSv2 only, the agents and the user data use session tokens
+    "imdsv2": NetworkTuning("imdsv2", require_imdsv2=True, metadata_hop_limit=1),
+    # jumbo frames in the VPC, clamped MSS over the VPN and 16 MiB TCP buffers
+    "throughput": NetworkTuning("throughput", require_imdsv2=True, metadata_hop_limit=1,
+                                jumbo_frames=True, clamp_vpn_mss=True,
+                                tcp_buffer_bytes=16777216),
+    # throughput with ENA Express for TCP, on the ENA_EXPRESS_MIN_SIZES, ie the network tier
+    "ena_express": NetworkTuning("ena_express", require_imdsv2=True, metadata_hop_limit=1,
+                                 ena_express=True, jumbo_frames=True, clamp_vpn_mss=True,
+                                 tcp_buffer_bytes=16777216),
+}
@@ -0,0 +1,112 @@
+"""Performance tiers for host group instances"""
+from aws_cdk import aws_ec2 as _ec2
+from constructs import Construct
+
+from utilities.context_values import get_component_setting
+
+# instance families built on Nitro, which come with ENA enhanced networking
+ENA_FAMILIES = {"t3", "t3a", "m5", "m5n", "m5zn", "m6i", "m6in", "m7i", "c5", "c5n", "c6i",
+                "c6in", "c7i", "r5", "r5n", "r6i", "r6in", "r7i", "z1d"}
+
+
+class PerformanceTier:
+    """Instance type and performance settings of a host group instance"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name: str, instance_type: str,
+                 ebs_optimized: bool = None,
+                 enhanced_networking: bool = True,
+                 detailed_monitoring: bool = False,
+                 core_count: int = None,
+                 threads_per_core: int = None) -> None:
+        self.name = name
+        self.instance_type = instance_type
+        self.ebs_optimized = ebs_optimized
+        self.enhanced_networking = enhanced_networking
+        self.detailed_monitoring = detailed_monitoring
+        self.core_count = core_count
+        self.threads_per_core = threads_per_core
+
+        family = instance_type.split(".")[0]
+        if enhanced_networking and family not in ENA_FAMILIES:
+            raise ValueError(f"Performance tier {name}: {instance_type} "
+                             "does not support ENA enhanced networking")
+
+    @property
+    def family(self) -> str:
+        """instance family, ie m5 for m5.xlarge"""
+        return self.instance_type.split(".")[0]
+
+    def get_instance_type(self) -> _ec2.InstanceType:
+        """getting the cdk instance type"""
+        return _ec2.InstanceType(self.instance_type)
+
+    def apply(self, instance: _ec2.Instance) -> None:
+        """applying the settings that the Instance construct does not expose"""
+        cfn_instance: _ec2.CfnInstance = instance.node.default_child
+        if self.ebs_optimized is not None:
+            cfn_instance.ebs_optimized = self.ebs_optimized
+        if self.detailed_monitoring:
+            cfn_instance.monitoring = True
+        if self.core_count is not None or self.threads_per_core is not None:
+            cfn_instance.cpu_options = _ec2.CfnInstance.CpuOptionsProperty(
+                core_count=self.core_count, threads_per_core=self.threads_per_core)
+
+    def apply_to_launch_template(self, launch_template: _ec2.LaunchTemplate) -> None:
+        """applying the settings that the LaunchTemplate construct does not expose"""
+        cfn_launch_template: _ec2.CfnLaunchTemplate = launch_template.node.default_child
+        if self.ebs_optimized is not None:
+            cfn_launch_template.add_property_override("LaunchTemplateData.EbsOptimized",
+                                                      self.ebs_optimized)
+        if self.detailed_monitoring:
+            cfn_launch_template.add_property_override("LaunchTemplateData.Monitoring.Enabled",
+                                                      True)
+        if self.core_count is not None:
+            cfn_launch_template.add_property_override("LaunchTemplateData.CpuOptions.CoreCount",
+                                                      self.core_count)
+        if self.threads_per_core is not None:
+            cfn_launch_template.add_property_override(
+                "LaunchTemplateData.CpuOptions.ThreadsPerCore", self.threads_per_core)
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "PerformanceTier":
+        """creating a tier from a context object"""
+        return cls(name, instance_type=spec["instance_type"],
+                   ebs_optimized=spec.get("ebs_optimized"),
+                   enhanced_networking=spec.get("enhanced_networking", True),
+                   detailed_monitoring=spec.get("detailed_monitoring", False),
+                   core_count=spec.get("core_count"),
+                   threads_per_core=spec.get("threads_per_core"))
+
+    @classmethod
+    def from_context(cls, scope: Construct, component: str, cid: str) -> "PerformanceTier":
+        """selecting the tier of an instance from the performance_tiers context,
+        by instance id (AMH1) first, then by component (AMH), then "default"."""
+        selected = get_component_setting(scope, "performance_tiers", [cid, component],
+                                         "standard")
+        if isinstance(selected, dict):
+            return cls.from_spec(cid, selected)
+        if selected not in PERFORMANCE_TIERS:
+            raise ValueError(f"Unknown performance tier {selected} for {cid}, "
+                             f"choose from {', '.join(PERFORMANCE_TIERS)}")
+        return PERFORMANCE_TIERS[selected]
+
+
+PERFORMANCE_TIERS = {
+    # cheap instances for development and testing
+    "dev": PerformanceTier("dev", "t3.large"),
+    # general purpose, the tier of the components not set in performance_tiers
+    "standard": PerformanceTier("standard", "m5.xlarge"),
+    # high message volume AMH
+    "compute": PerformanceTier("compute", "c5.2xlarge", ebs_optimized=True,
+                               detailed_monitoring=True),
+    # latency sensitive SAG, one thread per core to avoid SMT contention
+    "latency": PerformanceTier("latency", "c5n.2xlarge", ebs_optimized=True,
+                               detailed_monitoring=True, core_count=4, threads_per_core=1),
+    # large AMH caches
+    "memory": PerformanceTier("memory", "r5.xlarge", ebs_optimized=True,
+                              detailed_monitoring=True),
+    # bulk AMH <-> SAG transfers, the smallest c6in with ENA Express, see network_tuning
+    "network": PerformanceTier("network", "c6in.12xlarge", ebs_optimized=True,
+                               detailed_monitoring=True),
+}
@@ -0,0 +1,26 @@
+"""Placement groups for host group instances"""
+from aws_cdk import aws_ec2 as _ec2
+from constructs import Construct
+
+PLACEMENT_STRATEGIES = ["none", "cluster", "partition", "spread"]
+
+
+def get_placement_strategy(scope: Construct) -> str:
+    """getting the placement strategy from the placement_strategy context"""
+    strategy = scope.node.try_get_context("placement_strategy") or "none"
+    if strategy not in PLACEMENT_STRATEGIES:
+        raise ValueError(f"Unknown placement strategy {strategy}, "
+                         f"choose from {', '.join(PLACEMENT_STRATEGIES)}")
+    return strategy
+
+
+def create_placement_group(scope: Construct, cid: str, strategy: str,
+                           partition_count: int = 2) -> _ec2.CfnPlacementGroup:
+    """create placement group, cluster for co-location within an AZ,
+    partition or spread for keeping HA instances on separate hardware"""
+    if strategy == "partition":
+        return _ec2.CfnPlacementGroup(scope, cid, strategy=strategy,
+                                      partition_count=partition_count)
+    if strategy == "spread":
+        return _ec2.CfnPlacementGroup(scope, cid, strategy=strategy, spread_level="rack")
+    return _ec2.CfnPlacementGroup(scope, cid, strategy=strategy)
@@ -0,0 +1,184 @@
+"""Storage layouts for host group instances, root volume plus dedicated data and log volumes"""
+from typing import List
+
+from aws_cdk import (
+    aws_ec2 as _ec2,
+    aws_kms as _kms,
+)
+from constructs import Construct
+
+from utilities.context_values import get_component_setting
+
+XFS_MOUNT_OPTIONS = "defaults,noatime,nodiratime,logbufs=8,logbsize=256k,inode64,nofail"
+
+# finds the block device of an EBS volume, by name on Xen and by volume id on Nitro.
+# Volumes of a launch template have no id known in advance, they are found by size
+EBS_DEVICE_FUNCTION = [
+    "ebs_device() {",
+    "  for attempt in $(seq 1 60); do",
+    "    for device in \"$1\" \"${1/sd/xvd}\" "
+    "${2:+\"/dev/disk/by-id/nvme-Amazon_Elastic_Block_Store_${2/-/}\"}; do",
+    "      if [ -b \"$device\" ]; then readlink -f \"$device\"; return 0; fi",
+    "    done",
+    "    for device in $(lsblk -b -dpn -o NAME,SIZE,TYPE | "
+    "awk -v size=$(( $3 * 1073741824 )) '$2 == size && $3 == \"disk\" {print $1}'); do",
+    "      if [ -z \"$2\" ] && [ \"$(lsblk -n \"$device\" | wc -l)\" = 1 ] "
+    "&& ! findmnt -S \"$device\" > /dev/null; then echo \"$device\"; return 0; fi",
+    "    done",
+    "    sleep 5",
+    "  done",
+    "  echo \"EBS volume $2 ($1) not found\" >&2",
+    "  return 1",
+    "}",
+]
+
+
+class VolumeSpec:
+    """EBS volume of a storage layout"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, device_name: str, size: int,
+                 volume_type: str = "gp3",
+                 iops: int = None,
+                 throughput: int = None,
+                 mount_point: str = None,
+                 mkfs_options: str = "-K",
+                 mount_options: str = XFS_MOUNT_OPTIONS) -> None:
+        self.device_name = device_name
+        self.size = size
+        self.volume_type = volume_type
+        self.iops = iops
+        self.throughput = throughput
+        self.mount_point = mount_point
+        self.mkfs_options = mkfs_options
+        self.mount_options = mount_options
+
+        if volume_type in ("io1", "io2") and iops is None:
+            raise ValueError(f"{device_name}: {volume_type} volumes need provisioned iops")
+        if throughput is not None and volume_type != "gp3":
+            raise ValueError(f"{device_name}: throughput can only be set on gp3 volumes")
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "VolumeSpec":
+        """creating a volume from a context object"""
+        return cls(**spec)
+
+    def mount_commands(self, volume_id: str = "") -> List[str]:
+        """commands formatting the volume on first boot and mounting it"""
+        return [
+            f"dev=$(ebs_device {self.device_name} \"{volume_id}\" {self.size})",
+            f"blkid \"$dev\" || mkfs.xfs {self.mkfs_options} \"$dev\"",
+            f"mkdir -p {self.mount_point}",
+            "uuid=$(blkid -s UUID -o value \"$dev\")",
+            f"grep -q \"$uuid\" /etc/fstab || echo \"UUID=$uuid {self.mount_point} xfs "
+            f"{self.mount_options} 0 2\" >> /etc/fstab",
+            f"mountpoint -q {self.mount_point} || mount {self.mount_point}",
+        ]
+
+
+class StorageLayout:
+    """Root volume and additional volumes of a host group instance"""
+
+    def __init__(self, name: str, root: VolumeSpec, volumes: List[VolumeSpec] = None) -> None:
+        self.name = name
+        self.root = root
+        self.volumes = volumes or []
+
+    @staticmethod
+    def _block_device(volume: VolumeSpec) -> _ec2.BlockDevice:
+        options = {"volume_size": volume.size, "encrypted": True}
+        if volume.volume_type != "gp2":
+            options["volume_type"] = _ec2.EbsDeviceVolumeType[volume.volume_type.upper()]
+            options["iops"] = volume.iops
+        return _ec2.BlockDevice(device_name=volume.device_name,
+                                volume=_ec2.BlockDeviceVolume.ebs(**options))
+
+    def get_block_devices(self) -> List[_ec2.BlockDevice]:
+        """block device of the root volume"""
+        return [self._block_device(self.root)]
+
+    def get_launch_template_block_devices(self) -> List[_ec2.BlockDevice]:
+        """block devices of every volume, for instances launched from a launch template"""
+        sizes = [volume.size for volume in self.volumes]
+        if len(set(sizes)) != len(sizes):
+            raise ValueError(f"Storage layout {self.name}: volumes of a launch template "
+                             "are found by size, their sizes must differ")
+        return [self._block_device(volume) for volume in [self.root] + self.volumes]
+
+    def apply_throughput(self, launch_template: _ec2.LaunchTemplate) -> None:
+        """setting gp3 throughput, which the launch template construct does not expose"""
+        cfn_launch_template: _ec2.CfnLaunchTemplate = launch_template.node.default_child
+        for index, volume in enumerate([self.root] + self.volumes):
+            if volume.throughput is not None:
+                cfn_launch_template.add_property_override(
+                    f"LaunchTemplateData.BlockDeviceMappings.{index}.Ebs.Throughput",
+                    volume.throughput)
+
+    def create_volumes(self, scope: Construct, subnet: _ec2.ISubnet,
+                       workload_key: _kms.IKey) -> List[_ec2.CfnVolume]:
+        """create the additional volumes in the availability zone of the subnet"""
+        cfn_subnet: _ec2.CfnSubnet = subnet.node.default_child
+        volumes = []
+        for volume in self.volumes:
+            volumes.append(_ec2.CfnVolume(
+                scope, "Volume" + volume.device_name.split("/")[-1].upper(),
+                availability_zone=cfn_subnet.attr_availability_zone,
+                size=volume.size, volume_type=volume.volume_type,
+                iops=volume.iops, throughput=volume.throughput,
+                encrypted=True, kms_key_id=workload_key.key_arn))
+        return volumes
+
+    def attach_volumes(self, scope: Construct, instance: _ec2.Instance,
+                       volumes: List[_ec2.CfnVolume]) -> None:
+        """attach the volumes created by create_volumes to the instance"""
+        for volume, spec in zip(volumes, self.volumes):
+            _ec2.CfnVolumeAttachment(
+                scope, "Attachment" + spec.device_name.split("/")[-1].upper(),
+                instance_id=instance.instance_id, volume_id=volume.ref,
+                device=spec.device_name)
+
+    def get_mount_commands(self, volumes: List[_ec2.CfnVolume] = None) -> List[str]:
+        """user data formatting and mounting the volumes created by create_volumes,
+        or the volumes of a launch template when volumes is None"""
+        if not self.volumes or volumes == []:
+            return []
+        volume_ids = [""] * len(self.volumes) if volumes is None \
+            else [volume.ref for volume in volumes]
+        commands = list(EBS_DEVICE_FUNCTION)
+        for volume_id, spec in zip(volume_ids, self.volumes):
+            commands += spec.mount_commands(volume_id)
+        return commands
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "StorageLayout":
+        """creating a layout from a context object"""
+        return cls(name, root=VolumeSpec.from_spec(spec["root"]),
+                   volumes=[VolumeSpec.from_spec(volume) for volume in spec.get("volumes", [])])
+
+    @classmethod
+    def from_context(cls, scope: Construct, component: str, cid: str) -> "StorageLayout":
+        """selecting the layout of an instance from the storage_layouts context,
+        by instance id (AMH1) first, then by component (AMH), then "default"."""
+        selected = get_component_setting(scope, "storage_layouts", [cid, component], "legacy")
+        if isinstance(selected, dict):
+            return cls.from_spec(cid, selected)
+        if selected not in STORAGE_LAYOUTS:
+            raise ValueError(f"Unknown storage layout {selected} for {cid}, "
+                             f"choose from {', '.join(STORAGE_LAYOUTS)}")
+        return STORAGE_LAYOUTS[selected]
+
+
+STORAGE_LAYOUTS = {
+    # one 100 GiB gp2 root volume and no data volumes
+    "legacy": StorageLayout("legacy", root=VolumeSpec("/dev/sda1", 100, volume_type="gp2")),
+    # SAG/SNL message store and logs on their own volumes
+    "sagsnl": StorageLayout("sagsnl", root=VolumeSpec("/dev/sda1", 100), volumes=[
+        VolumeSpec("/dev/sdf", 200, iops=6000, throughput=250, mount_point="/swift/SAGSNL/data"),
+        VolumeSpec("/dev/sdg", 100, iops=3000, throughput=250, mount_point="/swift/SAGSNL/log"),
+    ]),
+    # AMH data on provisioned iops, logs on gp3
+    "amh": StorageLayout("amh", root=VolumeSpec("/dev/sda1", 100), volumes=[
+        VolumeSpec("/dev/sdf", 500, volume_type="io2", iops=10000, mount_point="/swift/AMH/data"),
+        VolumeSpec("/dev/sdg", 200, iops=3000, throughput=250, mount_point="/swift/AMH/log"),
+    ]),
+}
@@ -0,0 +1,221 @@
+"""Synthesis benchmark for SwiftMain and every nested stack.
+
+Record a baseline:   python -m benchmarks.synth_benchmark --record
+Compare against it:  python -m benchmarks.synth_benchmark --compare
+
+Lookups are stubbed (see utilities.stubbed_app), so no AWS access is needed.
+Peak memory is measured by tracemalloc and only covers the Python side,
+the jsii node process is not included.
+"""
+import argparse
+import functools
+import inspect
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from aws_cdk import NestedStack
+
+from base_host_group.host_group import HostGroup
+from cmk.generic_cmk import GenericCMK
+from network.generic_network import GenericNetwork
+from network.swift_vpc_endpoints import SwiftVPCEndpoints
+from security.generic_security import GenericSecurity
+from security.swift_security import SWIFTSecurity
+from swift_database.swift_database import SwiftDatabase
+from swift_iam_role.swift_iam_role import SwiftIAMRole
+from swift_mq.swift_mq import SwiftMQ
+from utilities.stubbed_app import build_stubbed_app
+
+BASELINE_FILE = Path(__file__).parent / "baselines" / "synth.json"
+INSTRUMENTED_CLASSES = [GenericCMK, GenericNetwork, GenericSecurity, SWIFTSecurity, HostGroup,
+                        SwiftDatabase, SwiftMQ, SwiftVPCEndpoints, SwiftIAMRole]
+# differences below this are treated as noise whatever the threshold
+MIN_TIME_DELTA_SECONDS = 0.05
+
+
+class ConstructTimer:
+    """accumulates exclusive time spent in the methods of each nested stack"""
+
+    def __init__(self):
+        self.seconds = {}
+        self._active = []
+
+    def wrap(self, func):
+        """wrap a nested stack method so its exclusive time is attributed to the instance"""
+        @functools.wraps(func)
+        def timed(instance, *args, **kwargs):
+            now = time.perf_counter()
+            if self._active:
+                self._pause(now)
+            self._active.append([instance, now])
+            try:
+                return func(instance, *args, **kwargs)
+            finally:
+                now = time.perf_counter()
+                self._pause(now)
+                self._active.pop()
+                if self._active:
+                    self._active[-1][1] = now
+
+        return timed
+
+    def _pause(self, now: float):
+        instance, started = self._active[-1]
+        self.seconds[id(instance)] = self.seconds.get(id(instance), 0.0) + now - started
+
+    def install(self):
+        """wrap the public methods of every instrumented class, returns the originals"""
+        originals = []
+        for cls in INSTRUMENTED_CLASSES:
+            for name, func in list(vars(cls).items()):
+                if inspect.isfunction(func) and (name == "__init__" or not name.startswith("_")):
+                    originals.append((cls, name, func))
+                    setattr(cls, name, self.wrap(func))
+        return originals
+
+    @staticmethod
+    def uninstall(originals):
+        """restore the methods replaced by install"""
+        for cls, name, func in originals:
+            setattr(cls, name, func)
+
+
+def measure(outdir: str) -> dict:
+    """build and synthesize SwiftMain once, returning the measurements"""
+    timer = ConstructTimer()
+    originals = timer.install()
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        app, main_stack = build_stubbed_app(outdir=outdir)
+        constructed = time.perf_counter()
+        app.synth()
+        finished = time.perf_counter()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        ConstructTimer.uninstall(originals)
+
+    stacks = {}
+    for child in main_stack.node.children:
+        if not isinstance(child, NestedStack):
+            continue
+        template_path = Path(outdir) / child.template_file
+        with open(template_path, "r", encoding="utf-8") as file:
+            template = json.load(file)
+        stacks[child.node.id] = {
+            "class": type(child).__name__,
+            "construct_seconds": timer.seconds.get(id(child), 0.0),
+            "construct_count": len(child.node.find_all()),
+            "template_bytes": template_path.stat().st_size,
+            "resource_count": len(template.get("Resources", {}))
+        }
+
+    return {
+        "total": {
+            "wall_seconds": finished - started,
+            "construct_seconds": constructed - started,
+            "synth_seconds": finished - constructed,
+            "peak_memory_bytes": peak_memory,
+            "construct_count": len(main_stack.node.find_all()),
+            "template_bytes": sum(stack["template_bytes"] for stack in stacks.values()),
+            "resource_count": sum(stack["resource_count"] for stack in stacks.values())
+        },
+        "stacks": stacks
+    }
+
+
+def run(repeat: int) -> dict:
+    """run the benchmark repeat times, keeping the median of every timing"""
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as outdir:
+            runs.append(measure(outdir))
+
+    result = runs[0]
+    for key in result["total"]:
+        if key.endswith("_seconds") or key == "peak_memory_bytes":
+            result["total"][key] = statistics.median(item["total"][key] for item in runs)
+    for name, stack in result["stacks"].items():
+        stack["construct_seconds"] = statistics.median(
+            item["stacks"][name]["construct_seconds"] for item in runs)
+    result["repeat"] = repeat
+    return result
+
+
+def compare(current: dict, baseline: dict, time_threshold: float,
+            size_threshold: float) -> list:
+    """list every synth time or template size regression past the thresholds"""
+    regressions = []
+    entries = [("total", current["total"], baseline["total"], "wall_seconds")]
+    entries += [(name, stack, baseline["stacks"][name], "construct_seconds")
+                for name, stack in current["stacks"].items() if name in baseline["stacks"]]
+
+    for name, now, before, time_key in entries:
+        if now[time_key] - before[time_key] > max(before[time_key] * time_threshold,
+                                                  MIN_TIME_DELTA_SECONDS):
+            regressions.append(f"{name}: {time_key} {before[time_key]:.3f} -> "
+                               f"{now[time_key]:.3f}")
+        if now["template_bytes"] > before["template_bytes"] * (1 + size_threshold):
+            regressions.append(f"{name}: template_bytes {before['template_bytes']} -> "
+                               f"{now['template_bytes']}")
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    """print the result as a table"""
+    print(f"{'stack':<32}{'class':<20}{'seconds':>9}{'constructs':>12}"
+          f"{'bytes':>10}{'resources':>11}")
+    for name, stack in result["stacks"].items():
+        print(f"{name:<32}{stack['class']:<20}{stack['construct_seconds']:>9.3f}"
+              f"{stack['construct_count']:>12}{stack['template_bytes']:>10}"
+              f"{stack['resource_count']:>11}")
+    total = result["total"]
+    print(f"total: wall {total['wall_seconds']:.3f}s (construct {total['construct_seconds']:.3f}s,"
+          f" synth {total['synth_seconds']:.3f}s), peak python memory "
+          f"{total['peak_memory_bytes'] / 1048576:.1f} MiB, {total['construct_count']} constructs,"
+          f" {total['template_bytes']} template bytes, {total['resource_count']} resources")
+
+
+def main() -> int:
+    """command line entry"""
+    parser = argparse.ArgumentParser(description="Synthesis benchmark for SwiftMain")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--output", type=Path, help="also write the result to this file")
+    parser.add_argument("--record", action="store_true", help="store the result as baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="fail when the result regresses against the baseline")
+    parser.add_argument("--time-threshold", type=float, default=0.25,
+                        help="allowed relative increase of synth time")
+    parser.add_argument("--size-threshold", type=float, default=0.05,
+                        help="allowed relative increase of template size")
+    args = parser.parse_args()
+
+    result = run(args.repeat)
+    print_report(result)
+
+    outputs = ([args.baseline] if args.record else []) + ([args.output] if args.output else [])
+    for output in outputs:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    if args.compare:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(result, json.load(file),
+                                  args.time_threshold, args.size_threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Stack for the EC2 Image Builder pipeline baking the golden SAGSNL/AMH AMI"""
+import hashlib
+import json
+
+from aws_cdk import (
+    aws_iam as _iam,
+    aws_imagebuilder as _imagebuilder,
+)
+from aws_cdk import Stack, CfnOutput
+from constructs import Construct
+
+from base_host_group.host_group import get_agent_install_commands, get_machine_image
+
+# OS settings baked into the image, the same for every SWIFT host
+OS_SETTINGS_COMMANDS = [
+    # used by the volume mount commands of the storage layouts
+    "dnf install -y xfsprogs nvme-cli util-linux",
+    # Amazon Time Sync Service, message timestamps must not drift
+    "dnf install -y chrony",
+    "sed -i '/^pool /d;/^server /d' /etc/chrony.conf",
+    "echo 'server 169.254.169.123 prefer iburst minpoll 4 maxpoll 4' >> /etc/chrony.conf",
+    "systemctl enable chronyd",
+    "dnf install -y tuned",
+    "systemctl enable tuned",
+    "tuned-adm profile throughput-performance",
+    "dnf clean all",
+]
+
+ROOT_VOLUME = {"volume_size": 100, "volume_type": "gp3", "encrypted": True,
+               "delete_on_termination": True}
+
+VALIDATE_COMMANDS = [
+    "systemctl is-enabled amazon-ssm-agent",
+    "test -x /opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl",
+    "systemctl is-enabled chronyd",
+    "command -v mkfs.xfs",
+]
+
+
+def get_content_version(*contents: str) -> str:
+    """semantic version of an Image Builder component or recipe from its content. Both are
+    immutable and replaced on any change, the replacement needs a version of its own"""
+    # a version number is at most 2^30 - 1
+    patch = int(hashlib.sha256("\n".join(contents).encode()).hexdigest()[:7], 16)
+    return "1.0." + str(patch)
+
+
+class SwiftGoldenAMI(Stack):
+    """EC2 Image Builder pipeline baking the SSM and CloudWatch agents and the OS settings
+    into a RHEL 8 image, so that instances launched from it skip the agent installation.
+
+    Deployed on its own with -c golden_ami_pipeline=true, the AMI id of a pipeline run is
+    then passed to SwiftMain with the sagsnl_ami and amh_ami context. The build instance
+    needs outbound access to S3 and SSM, it runs in the default VPC unless the
+    golden_ami_subnet_id and golden_ami_security_group_id context are set."""
+
+    def __init__(self, scope: Construct, cid: str, **kwargs) -> None:
+        super().__init__(scope, cid, **kwargs)
+
+        component_data = json.dumps({
+            "name": "SwiftHostBaseline",
+            "schemaVersion": 1.0,
+            "phases": [
+                # OS packages first, the agent installation disables the RHUI repositories
+                {"name": "build", "steps": [
+                    {"name": "OsSettings", "action": "ExecuteBash",
+                     "inputs": {"commands": OS_SETTINGS_COMMANDS}},
+                    {"name": "InstallAgents", "action": "ExecuteBash",
+                     "inputs": {"commands": get_agent_install_commands(self.region)}}]},
+                {"name": "validate", "steps": [
+                    {"name": "ValidateBaseline", "action": "ExecuteBash",
+                     "inputs": {"commands": VALIDATE_COMMANDS}}]}]
+        })
+        component_description = "SSM and CloudWatch agents and OS settings of the SWIFT hosts"
+        component_version = get_content_version(component_description, component_data)
+        component = _imagebuilder.CfnComponent(
+            self, "SwiftHostBaseline", name="SwiftHostBaseline", platform="Linux",
+            version=component_version, description=component_description,
+            data=component_data)
+
+        # a new RHEL image from the lookup or a new component version makes a new recipe
+        parent_image = get_machine_image().get_image(self).image_id
+        recipe = _imagebuilder.CfnImageRecipe(
+            self, "SwiftHostRecipe", name="SwiftHostRecipe",
+            version=get_content_version(parent_image, component_version,
+                                        json.dumps(ROOT_VOLUME, sort_keys=True)),
+            parent_image=parent_image,
+            components=[_imagebuilder.CfnImageRecipe.ComponentConfigurationProperty(
+                component_arn=component.attr_arn)],
+            block_device_mappings=[
+                _imagebuilder.CfnImageRecipe.InstanceBlockDeviceMappingProperty(
+                    device_name="/dev/sda1",
+                    ebs=_imagebuilder.CfnImageRecipe.EbsInstanceBlockDeviceSpecificationProperty(
+                        **ROOT_VOLUME))])
+
+        build_role = _iam.Role(
+            self, "ImageBuilderInstanceRole",
+            assumed_by=_iam.ServicePrincipal("ec2.amazonaws.com"),
+            managed_policies=[
+                _iam.ManagedPolicy.from_aws_managed_policy_name("AmazonSSMManagedInstanceCore"),
+                _iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "EC2InstanceProfileForImageBuilder")])
+        instance_profile = _iam.CfnInstanceProfile(
+            self, "ImageBuilderInstanceProfile", roles=[build_role.role_name])
+
+        security_group_id = self.node.try_get_context("golden_ami_security_group_id")
+        infrastructure = _imagebuilder.CfnInfrastructureConfiguration(
+            self, "SwiftHostInfrastructure", name="SwiftHostInfrastructure",
+            instance_profile_name=instance_profile.ref,
+            instance_types=["m5.large"],
+            subnet_id=self.node.try_get_context("golden_ami_subnet_id") or None,
+            security_group_ids=[security_group_id] if security_group_id else None,
+            instance_metadata_options=_imagebuilder.CfnInfrastructureConfiguration
+            .InstanceMetadataOptionsProperty(http_tokens="required"),
+            terminate_instance_on_failure=True)
+
+        distribution = _imagebuilder.CfnDistributionConfiguration(
+            self, "SwiftHostDistribution", name="SwiftHostDistribution",
+            distributions=[_imagebuilder.CfnDistributionConfiguration.DistributionProperty(
+                region=self.region,
+                ami_distribution_configuration={
+                    "Name": "swift-golden-{{ imagebuilder:buildDate }}",
+                    "AmiTags": {"SwiftGoldenAMI": "true"}})])
+
+        pipeline = _imagebuilder.CfnImagePipeline(
+            self, "SwiftHostPipeline", name="SwiftHostPipeline",
+            image_recipe_arn=recipe.attr_arn,
+            infrastructure_configuration_arn=infrastructure.attr_arn,
+            distribution_configuration_arn=distribution.attr_arn,
+            image_tests_configuration=_imagebuilder.CfnImagePipeline
+            .ImageTestsConfigurationProperty(image_tests_enabled=True, timeout_minutes=60),
+            # monthly rebuild picks up the latest agents and OS patches
+            schedule=_imagebuilder.CfnImagePipeline.ScheduleProperty(
+                schedule_expression="cron(0 3 1 * ? *)",
+                pipeline_execution_start_condition=
+                "EXPRESSION_MATCH_AND_DEPENDENCY_UPDATES_AVAILABLE"))
+
+        CfnOutput(self, "ImagePipelineArn", value=pipeline.attr_arn,
+                  description="aws imagebuilder start-image-pipeline-execution "
+                              "--image-pipeline-arn <arn>, then set sagsnl_ami and amh_ami "
+                              "to the AMI of the image")
@@ -0,0 +1,113 @@
+"""CIDR allocation of the subnet groups of the VPC, checked at synth.
+
+The groups are allocated in the order they are added, from the start of the VPC range,
+each subnet aligned on its own size, one subnet per AZ. A group is sized for reserved_azs
+AZs and spare more subnets, kept free after it, so adding an AZ or growing the group later
+does not move the groups after it. A group can pin the CIDR ranges of its AZs instead,
+and ranges of the VPC can be kept out of the allocation; both are checked for collisions.
+
+With reserved_azs the number of AZs, no spare and nothing pinned, the ranges are those the
+CDK Vpc allocates itself: SAGSNL 10.10.0-1.0/24, AMH 2-3, Database 4-5, MQ 6-7, then the
+endpoint subnets 10.10.8.0/27 and 10.10.8.32/27.
+"""
+import ipaddress
+from typing import Dict, List
+
+
+class CidrAllocationError(ValueError):
+    """Exception for subnet groups not fitting in the VPC, or colliding"""
+
+
+class SubnetGroupPlan:
+    """Sizing of a subnet group: one subnet of cidr_mask per AZ, room for reserved_azs AZs
+    and spare more subnets, or the pinned CIDR range of each AZ"""
+
+    def __init__(self, name: str, cidr_mask: int = 24, spare: int = 0,
+                 cidrs: List[str] = None) -> None:
+        self.name = name
+        self.cidr_mask = cidr_mask
+        self.spare = spare
+        self.cidrs = cidrs or []
+
+
+class CidrAllocator:
+    """Allocates the CIDR ranges of the subnet groups of a VPC for a number of AZs"""
+
+    def __init__(self, vpc_cidr: str, azs: int, reserved_azs: int = None) -> None:
+        self.vpc = ipaddress.ip_network(vpc_cidr)
+        self.azs = azs
+        self.reserved_azs = max(azs, reserved_azs or azs)
+        self.groups: List[SubnetGroupPlan] = []
+        # ranges taken so far, with what took them
+        self.taken: List[tuple] = []
+
+    def reserve(self, cidr: str, name: str = "reserved") -> None:
+        """keep a range of the VPC out of the allocation"""
+        self._take(self._in_vpc(cidr, name), name)
+
+    def add_group(self, plan: SubnetGroupPlan) -> None:
+        """add a subnet group, allocated in the order of the groups"""
+        if plan.cidrs and len(plan.cidrs) != self.azs:
+            raise CidrAllocationError(f"{plan.name} pins {len(plan.cidrs)} CIDR ranges "
+                                      f"for {self.azs} AZs")
+        self.groups.append(plan)
+
+    def allocate(self) -> Dict[str, List[str]]:
+        """CIDR range of each AZ by subnet group, the pinned ranges first"""
+        allocation = {}
+        for plan in self.groups:
+            if plan.cidrs:
+                allocation[plan.name] = []
+                for i, cidr in enumerate(plan.cidrs):
+                    network = self._in_vpc(cidr, plan.name)
+                    self._take(network, f"{plan.name} AZ{i + 1}")
+                    allocation[plan.name].append(str(network))
+        cursor = int(self.vpc.network_address)
+        for plan in self.groups:
+            if plan.cidrs:
+                continue
+            subnets = []
+            for i in range(self.reserved_azs + plan.spare):
+                network = self._next_free(cursor, plan.cidr_mask, plan.name)
+                if i < self.azs:
+                    self._take(network, f"{plan.name} AZ{i + 1}")
+                    subnets.append(str(network))
+                elif i < self.reserved_azs:
+                    self._take(network, f"{plan.name} AZ{i + 1} reserved")
+                else:
+                    self._take(network, f"{plan.name} spare")
+                cursor = int(network.broadcast_address) + 1
+            allocation[plan.name] = subnets
+        return allocation
+
+    def describe(self) -> List[str]:
+        """the taken ranges in address order, with what took them"""
+        return [f"{network} {name}" for network, name in sorted(self.taken)]
+
+    def _in_vpc(self, cidr: str, name: str):
+        """the network of a range, which must lie within the VPC"""
+        network = ipaddress.ip_network(cidr)
+        if not network.subnet_of(self.vpc):
+            raise CidrAllocationError(f"{name} {network} is outside of the VPC {self.vpc}")
+        return network
+
+    def _take(self, network, name: str) -> None:
+        """mark a range as taken, raising CidrAllocationError on a collision"""
+        for taken, owner in self.taken:
+            if network.overlaps(taken):
+                raise CidrAllocationError(f"{name} {network} collides with {owner} {taken}")
+        self.taken.append((network, name))
+
+    def _next_free(self, cursor: int, cidr_mask: int, name: str):
+        """first free range of cidr_mask at or after the cursor, aligned on its size"""
+        size = 2 ** (32 - cidr_mask)
+        start = -(-cursor // size) * size
+        while start + size - 1 <= int(self.vpc.broadcast_address):
+            network = ipaddress.ip_network(f"{ipaddress.ip_address(start)}/{cidr_mask}")
+            blocking = [taken for taken, _ in self.taken if network.overlaps(taken)]
+            if not blocking:
+                return network
+            end = max(int(taken.broadcast_address) for taken in blocking) + 1
+            start = -(-end // size) * size
+        raise CidrAllocationError(f"{name} /{cidr_mask} does not fit in the VPC {self.vpc}, "
+                                  "taken: " + ", ".join(self.describe()))
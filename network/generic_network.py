@@ -1,8 +1,74 @@
 """Nested Stack for Networking"""
+import ipaddress
+from typing import Dict, List, Optional
+
 from aws_cdk import aws_ec2 as _ec2
-from aws_cdk import NestedStack
+from aws_cdk import custom_resources as _cr
+from aws_cdk import Annotations, NestedStack
 from constructs import Construct
 
+from network.cidr_allocator import CidrAllocationError, CidrAllocator, SubnetGroupPlan
+from utilities.context_values import get_context_object
+
+DEFAULT_NETWORK_SETTINGS = {
+    "max_azs": 2,
+    # AZs the subnet groups keep room for, a later AZ then fits without moving the groups
+    # after it, see network/cidr_allocator.py
+    "reserved_azs": 2,
+    # sizing by subnet group name: cidr_mask, spare subnets kept free after the group, or
+    # the pinned cidrs of each AZ
+    "subnet_groups": {},
+    # ranges of the VPC kept out of the allocation
+    "reserved_ranges": [],
+}
+
+
+CONNECTIVITY_MODES = ["vgw", "transit_gateway"]
+DEFAULT_CONNECTIVITY_SETTINGS = {
+    # vgw: a virtual private gateway, one VPN tunnel carries the traffic at a time.
+    # transit_gateway: a transit gateway attachment, ECMP over the tunnels of every VPN
+    # connection and optionally a Direct Connect gateway
+    "mode": "vgw",
+    "amazon_side_asn": 64512,
+    # customer gateways of the VPN connections, ip_address and bgp_asn, BGP is needed for ECMP
+    "vpn_connections": [],
+    "direct_connect_gateway_id": None,
+    # ranges routed to the transit gateway, empty for the swift_ip_range and the hsm_ip
+    "destination_cidrs": [],
+}
+
+
+def get_connectivity_settings(scope: Construct) -> dict:
+    """connectivity settings, DEFAULT_CONNECTIVITY_SETTINGS updated by the connectivity
+    context"""
+    settings = dict(DEFAULT_CONNECTIVITY_SETTINGS,
+                    **get_context_object(scope, "connectivity", {}))
+    if settings["mode"] not in CONNECTIVITY_MODES:
+        raise ValueError(f"Unknown connectivity mode {settings['mode']}, "
+                         f"choose from {', '.join(CONNECTIVITY_MODES)}")
+    if settings["mode"] == "transit_gateway" and not settings["vpn_connections"] \
+            and not settings["direct_connect_gateway_id"]:
+        raise ValueError("transit_gateway needs vpn_connections or a direct_connect_gateway_id")
+    return settings
+
+
+def get_vpn_cidrs(scope: Construct) -> List[str]:
+    """ranges reached over the VPN: the destination_cidrs of the connectivity context,
+    or the swift_ip_range and the hsm_ip"""
+    return get_connectivity_settings(scope)["destination_cidrs"] or [
+        scope.node.try_get_context("swift_ip_range"), scope.node.try_get_context("hsm_ip")]
+
+
+def get_network_settings(scope: Construct) -> dict:
+    """network settings, DEFAULT_NETWORK_SETTINGS updated by the network context"""
+    settings = dict(DEFAULT_NETWORK_SETTINGS, **get_context_object(scope, "network", {}))
+    settings["max_azs"] = int(settings["max_azs"])
+    settings["reserved_azs"] = int(settings["reserved_azs"])
+    if settings["max_azs"] < 2:
+        raise ValueError("max_azs needs at least 2 AZs, for the SAGSNL pair")
+    return settings
+
+
 class GenericNetwork(NestedStack):
     """Nested Stack for Networking"""
 
@@ -17,7 +83,14 @@ class GenericNetwork(NestedStack):
         self._vgw_propagation_subnet: _ec2.SubnetSelection
         self._has_private_subnet = False
         self._max_azs = 2
+        self._reserved_azs = None
         self._vgw = False
+        self._transit_gateway_settings: Optional[dict] = None
+        self._transit_gateway: Optional[_ec2.CfnTransitGateway] = None
+        self._endpoint_subnet_group = None
+        self._group_plans: List[SubnetGroupPlan] = []
+        self._reserved_ranges: List[str] = []
+        self._subnet_cidrs: Dict[str, List[str]] = {}
 
     def generate(self):
         """Generate networking stack (VPC) with all the variable set in this instance """
@@ -26,8 +99,22 @@ class GenericNetwork(NestedStack):
         if self._has_private_subnet:
             nat_gateways = self._max_azs
 
+        if len(self.availability_zones) < self._max_azs:
+            raise ValueError(f"{self._max_azs} AZs wanted, the stack has "
+                             f"{len(self.availability_zones)}: "
+                             f"{', '.join(self.availability_zones)}")
+        cidr_range = self._cidr_range or _ec2.Vpc.DEFAULT_CIDR_RANGE
+        allocator = CidrAllocator(cidr_range, self._max_azs, self._reserved_azs)
+        for reserved_range in self._reserved_ranges:
+            allocator.reserve(reserved_range)
+        for plan in self._group_plans:
+            allocator.add_group(plan)
+        self._subnet_cidrs = allocator.allocate()
+        for line in allocator.describe():
+            Annotations.of(self).add_info(line)
+
         self._base_vpc = _ec2.Vpc(self, "SwiftVPC",
-                                  cidr=self._cidr_range,
+                                  cidr=cidr_range,
                                   enable_dns_hostnames=True,
                                   enable_dns_support=True,
                                   subnet_configuration=self._subnet_configuration,
@@ -35,31 +122,118 @@ class GenericNetwork(NestedStack):
                                   nat_gateways=nat_gateways,
                                   vpn_gateway=self._vgw,
                                   vpn_route_propagation=[self._vgw_propagation_subnet]
+                                  if self._vgw else None
                                   )
 
-        for i in range(self._max_azs):
-            selected_subnet: _ec2.SelectedSubnets = self._base_vpc.select_subnets(
-                availability_zones=[self.availability_zones[i]])
-            for subnet in selected_subnet.subnets:
-                subnet_cfn = subnet.node.default_child
-                subnet_cfn.add_property_override("AvailabilityZone",
-                                                 {"Fn::Select": [str(i), {"Fn::GetAZs": ""}]})
+        # pin the subnet of each group and AZ to the allocated range, and to the AZ of the
+        # same index at deployment
+        for plan in self._group_plans:
+            for i in range(self._max_azs):
+                selected_subnet: _ec2.SelectedSubnets = self._base_vpc.select_subnets(
+                    subnet_group_name=plan.name,
+                    availability_zones=[self.availability_zones[i]])
+                for subnet in selected_subnet.subnets:
+                    subnet_cfn = subnet.node.default_child
+                    subnet_cfn.add_property_override(
+                        "AvailabilityZone", {"Fn::Select": [str(i), {"Fn::GetAZs": ""}]})
+                    subnet_cfn.add_property_override(
+                        "CidrBlock", self._subnet_cidrs[plan.name][i])
+
+        if self._transit_gateway_settings is not None:
+            self._create_transit_gateway(self._transit_gateway_settings)
+
+    def _create_transit_gateway(self, settings: dict) -> None:
+        """create the transit gateway, its VPC attachment and VPN connections, and route the
+        destination ranges of the propagation subnets to it. The VPN connections use BGP, so
+        the transit gateway spreads the traffic over all their tunnels with ECMP"""
+        self._transit_gateway = _ec2.CfnTransitGateway(
+            self, "TransitGateway",
+            amazon_side_asn=int(settings["amazon_side_asn"]),
+            vpn_ecmp_support="enable",
+            default_route_table_association="enable",
+            default_route_table_propagation="enable",
+            dns_support="enable",
+            description="SWIFT and HSM connectivity, ECMP over the VPN tunnels")
+        group_name = self._vgw_propagation_subnet.subnet_group_name
+        attachment = _ec2.CfnTransitGatewayAttachment(
+            self, "TransitGatewayAttachment",
+            transit_gateway_id=self._transit_gateway.ref,
+            vpc_id=self._base_vpc.vpc_id,
+            subnet_ids=self._base_vpc.select_subnets(subnet_group_name=group_name,
+                                                     one_per_az=True).subnet_ids)
+
+        # a transit gateway does not propagate into the VPC route tables, the ranges are
+        # static routes of the propagation subnets, as the VGW propagation does
+        subnets = self._base_vpc.select_subnets(subnet_group_name=group_name).subnets
+        for i, subnet in enumerate(subnets):
+            for j, cidr in enumerate(settings["destination_cidrs"]):
+                route = _ec2.CfnRoute(self, f"TransitGatewayRoute{i + 1}Destination{j + 1}",
+                                      route_table_id=subnet.route_table.route_table_id,
+                                      destination_cidr_block=cidr,
+                                      transit_gateway_id=self._transit_gateway.ref)
+                route.add_dependency(attachment)
+
+        for i, vpn in enumerate(settings["vpn_connections"]):
+            customer_gateway = _ec2.CfnCustomerGateway(
+                self, f"CustomerGateway{i + 1}", bgp_asn=int(vpn["bgp_asn"]),
+                ip_address=vpn["ip_address"], type="ipsec.1")
+            _ec2.CfnVPNConnection(self, f"VPNConnection{i + 1}",
+                                  customer_gateway_id=customer_gateway.ref,
+                                  transit_gateway_id=self._transit_gateway.ref,
+                                  type="ipsec.1", static_routes_only=False)
+
+        if settings["direct_connect_gateway_id"]:
+            # no CloudFormation resource associates a Direct Connect gateway with a
+            # transit gateway
+            association = "directConnectGatewayAssociation.associationId"
+            _cr.AwsCustomResource(
+                self, "DirectConnectGatewayAssociation",
+                on_create=_cr.AwsSdkCall(
+                    service="DirectConnect",
+                    action="createDirectConnectGatewayAssociation",
+                    parameters={
+                        "directConnectGatewayId": settings["direct_connect_gateway_id"],
+                        "gatewayId": self._transit_gateway.ref,
+                        "addAllowedPrefixesToDirectConnectGateway": [
+                            {"cidr": self._base_vpc.vpc_cidr_block}]},
+                    physical_resource_id=_cr.PhysicalResourceId.from_response(association)),
+                on_delete=_cr.AwsSdkCall(
+                    service="DirectConnect",
+                    action="deleteDirectConnectGatewayAssociation",
+                    parameters={"associationId": _cr.PhysicalResourceIdReference()}),
+                policy=_cr.AwsCustomResourcePolicy.from_sdk_calls(
+                    resources=_cr.AwsCustomResourcePolicy.ANY_RESOURCE))
 
     def set_vgw_propagation_subnet(self, subnet_selection: _ec2.SubnetSelection):
-        """setting subnets for vgw propagation"""
+        """setting subnets for vgw propagation, or for the routes to the transit gateway"""
         self._vgw_propagation_subnet = subnet_selection
 
     def set_max_azs(self, m_val: int = 2):
         """setting the AZ numbers"""
         self._max_azs = m_val
 
+    def set_reserved_azs(self, reserved_azs: int = None) -> None:
+        """setting the AZ numbers the subnet groups keep room for, max_azs by default"""
+        self._reserved_azs = reserved_azs
+
+    def add_reserved_range(self, cidr: str) -> None:
+        """keeping a range of the VPC out of the subnet allocation"""
+        self._reserved_ranges.append(cidr)
+
     def set_vgw(self, vgw: bool) -> None:
         """setting for vgw creation"""
         self._vgw = vgw
 
+    def set_transit_gateway(self, settings: dict) -> None:
+        """setting for transit gateway creation instead of the vgw, with the
+        connectivity settings (see DEFAULT_CONNECTIVITY_SETTINGS)"""
+        self._vgw = False
+        self._transit_gateway_settings = settings
+
     def add_private_subnets(self, name: str) -> None:
         """adding private subnet, Public Subnet and
         Nat Gateway will be created and needed for this"""
+        self._group_plans.append(SubnetGroupPlan(name))
         self._subnet_configuration.append(
             _ec2.SubnetConfiguration(
                 name=name,
@@ -70,19 +244,30 @@ class GenericNetwork(NestedStack):
         )
         self._has_private_subnet = True
 
-    def add_isolated_subnets(self, name: str) -> None:
-        """adding isolated subnet, air gap"""
+    def add_isolated_subnets(self, name: str, cidr_mask: int = 24, spare: int = 0,
+                             cidrs: List[str] = None) -> None:
+        """adding isolated subnet, air gap, with spare subnets kept free after the group
+        or the pinned cidrs of each AZ"""
+        self._group_plans.append(SubnetGroupPlan(name, cidr_mask, spare, cidrs))
         self._subnet_configuration.append(
             _ec2.SubnetConfiguration(
                 name=name,
                 subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED,
-                cidr_mask=24,
+                cidr_mask=cidr_mask,
                 reserved=False
             )
         )
 
+    def add_endpoint_subnets(self, name: str = "Endpoints", cidr_mask: int = 27,
+                             spare: int = 0, cidrs: List[str] = None) -> None:
+        """adding isolated subnets holding the interface VPC endpoints, one ENI per AZ.
+        Added after the other subnets, so their CIDR ranges are unchanged"""
+        self.add_isolated_subnets(name, cidr_mask, spare, cidrs)
+        self._endpoint_subnet_group = name
+
     def add_public_subnets(self, name: str) -> None:
         """adding public subnets"""
+        self._group_plans.append(SubnetGroupPlan(name))
         self._subnet_configuration.append(
             _ec2.SubnetConfiguration(
                 name=name,
@@ -123,6 +308,37 @@ class GenericNetwork(NestedStack):
             return self._get_subnets(_ec2.SubnetType.PUBLIC, subnet_group_name)
         raise NotGeneratedException("Please call stack.generate() first")
 
+    def get_endpoint_subnets(self) -> Optional[_ec2.SubnetSelection]:
+        """getting the endpoint subnets, one per AZ, None without endpoint subnets"""
+        if self._endpoint_subnet_group is None:
+            return None
+        return _ec2.SubnetSelection(subnet_group_name=self._endpoint_subnet_group,
+                                    one_per_az=True)
+
+    def get_endpoint_subnet_cidrs(self) -> Dict[str, str]:
+        """getting the CIDR range of the endpoint subnet of each AZ"""
+        if self._endpoint_subnet_group is None:
+            return {}
+        return dict(zip(self.availability_zones,
+                        self.get_subnet_cidrs(self._endpoint_subnet_group)))
+
+    def get_subnet_cidrs(self, subnet_group_name: str) -> List[str]:
+        """getting the allocated CIDR range of each AZ of a subnet group"""
+        if self._is_generated:
+            return self._subnet_cidrs[subnet_group_name]
+        raise NotGeneratedException("Please call stack.generate() first")
+
+    def check_private_ip(self, subnet_group_name: str, az_index: int, private_ip: str) -> None:
+        """checking a fixed private IP address lies in the subnet of its group and AZ"""
+        cidr = self.get_subnet_cidrs(subnet_group_name)[az_index]
+        if ipaddress.ip_address(private_ip) not in ipaddress.ip_network(cidr):
+            raise CidrAllocationError(f"{private_ip} is outside of the {subnet_group_name} "
+                                      f"subnet {cidr} of AZ{az_index + 1}")
+
+    def get_transit_gateway(self) -> Optional[_ec2.CfnTransitGateway]:
+        """getting the transit gateway, None with the vgw"""
+        return self._transit_gateway
+
     def get_vpc(self) -> _ec2.Vpc:
         """getting vpc reference"""
         return self._base_vpc
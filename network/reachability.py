@@ -0,0 +1,539 @@
+"""Offline reachability analysis of the synthesized network and security groups.
+
+python -m network.reachability [--assembly cdk.out] [-c key=value] SOURCE TARGET PORT [PROTOCOL]
+python -m network.reachability [--assembly cdk.out] [-c key=value] --matrix
+
+Answers "can SOURCE reach TARGET on PORT" from the templates alone, without deploying and
+without the VPC Reachability Analyzer. The subnets, route tables, VGW route propagation,
+network ACLs and security groups of every stack are indexed once, references across the
+nested stacks are followed through their parameters and outputs. Without --assembly the
+app is synthesized with stubbed lookups (see utilities.stubbed_app).
+
+A component is a security group, named after its group name without the SG suffix
+(SAGSNL, AMH, RDS, MQ, VPCEndpoint...), placed in the subnets of the instances, fleets,
+databases, brokers and endpoints using it. A source or target can also be a CIDR range,
+as the HSM or the SWIFT ranges, or a prefix list id, as the S3 gateway endpoint.
+
+Traffic is allowed when, for every pair of source and target placements:
+- the route table of each subnet routes to the other side, the VPC ranges are local, the
+  gateway endpoints route their prefix lists, other ranges need a static route or the VGW
+  route propagation, which is taken as carrying every on-premises range,
+- the network ACLs allow the request, and the return traffic on the ephemeral ports,
+  between different subnets,
+- the security groups of the source allow it out and those of the target allow it in.
+An allow rule or ACL entry only matches a range it fully covers, a deny entry matches a
+range it overlaps, so a verdict never assumes more than the templates say.
+"""
+import argparse
+import ipaddress
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from utilities.deploy_graph import ASSET_PATH_METADATA, NESTED_STACK_TYPE, \
+    find_stack_template, synth_assembly
+
+# a resource of a stack, by stack name and logical id
+Key = Tuple[str, str]
+
+INGRESS = "ingress"
+EGRESS = "egress"
+ALL_PROTOCOLS = "-1"
+PROTOCOL_NUMBERS = {"tcp": "6", "udp": "17", "icmp": "1", "all": ALL_PROTOCOLS}
+ALL_PORTS = (0, 65535)
+# ports of the return traffic, the network ACLs are stateless
+EPHEMERAL_PORTS = (1024, 65535)
+ANYWHERE = ipaddress.ip_network("0.0.0.0/0")
+SUBNET_NAME_TAG = "aws-cdk:subnet-name"
+# properties placing a resource in security groups and in subnets
+SECURITY_GROUP_KEYS = ("SecurityGroupIds", "SecurityGroups", "VPCSecurityGroups",
+                       "VpcSecurityGroupIds", "GroupSet", "Groups")
+SUBNET_KEYS = ("SubnetId", "SubnetIds", "VPCZoneIdentifier")
+# resources holding the subnets or security groups of the resource referencing them
+FOLLOWED_TYPES = ("AWS::RDS::DBSubnetGroup", "AWS::EC2::LaunchTemplate")
+
+
+def normalize_protocol(protocol) -> str:
+    """protocol number as a string, -1 for all protocols"""
+    return PROTOCOL_NUMBERS.get(str(protocol).lower(), str(protocol))
+
+
+def as_network(value: Optional[str]):
+    """IPv4 network of a CIDR range, None when unresolved"""
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except (TypeError, ValueError):
+        return None
+
+
+class StackTemplate:
+    """Template of a stack of the cloud assembly and of its nested stacks"""
+
+    def __init__(self, name: str, template: dict, assembly_dir: Path,
+                 parent: "StackTemplate" = None, parent_id: str = None) -> None:
+        self.name = name
+        self.resources = template.get("Resources", {})
+        self.parameters = template.get("Parameters", {})
+        self.outputs = template.get("Outputs", {})
+        self.parent = parent
+        self.parent_id = parent_id
+        self.children: Dict[str, StackTemplate] = {}
+        for logical_id, resource in self.resources.items():
+            asset_path = resource.get("Metadata", {}).get(ASSET_PATH_METADATA)
+            if resource["Type"] == NESTED_STACK_TYPE and asset_path:
+                with open(assembly_dir / asset_path, "r", encoding="utf-8") as file:
+                    self.children[logical_id] = StackTemplate(
+                        name + "/" + logical_id, json.load(file), assembly_dir,
+                        self, logical_id)
+
+    def walk(self) -> List["StackTemplate"]:
+        """this stack and all its nested stacks"""
+        stacks = [self]
+        for child in self.children.values():
+            stacks += child.walk()
+        return stacks
+
+
+class Placement:
+    """Where traffic comes from or goes to: a subnet of the VPC with the address range and
+    the security groups of a component there, or a range or prefix list outside of it"""
+
+    def __init__(self, name: str, network=None, subnet: Key = None,
+                 groups: frozenset = frozenset(), prefix_list: str = None) -> None:
+        self.name = name
+        self.network = network
+        self.subnet = subnet
+        self.groups = groups
+        self.prefix_list = prefix_list
+
+    def is_covered_by(self, network) -> bool:
+        """the address range of the placement lies within network"""
+        if self.network is None:
+            return network == ANYWHERE
+        return self.network.subnet_of(network)
+
+    def overlaps(self, network) -> bool:
+        """some addresses of the placement lie within network"""
+        return self.network is None or self.network.overlaps(network)
+
+
+class Rule:
+    """Rule of a security group, the peer is a CIDR range, a prefix list or a group"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, protocol: str, from_port: int, to_port: int, network=None,
+                 prefix_list=None, peer_group: Key = None) -> None:
+        self.protocol = protocol
+        self.ports = ALL_PORTS if protocol == ALL_PROTOCOLS else (from_port, to_port)
+        self.network = network
+        self.prefix_list = prefix_list
+        self.peer_group = peer_group
+
+
+class AclEntry:
+    """Entry of a network ACL"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, number: int, protocol: str, ports: Tuple[int, int], network,
+                 allow: bool) -> None:
+        self.number = number
+        self.protocol = protocol
+        self.ports = ports
+        self.network = network
+        self.allow = allow
+
+
+class Verdict:
+    """Answer to a reachability query, with why the traffic is not allowed"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, source: str, target: str, port: int, protocol: str,
+                 problems: List[str]) -> None:
+        self.source = source
+        self.target = target
+        self.port = port
+        self.protocol = protocol
+        self.problems = problems
+
+    @property
+    def allowed(self) -> bool:
+        """whether the traffic is allowed from every source to every target placement"""
+        return not self.problems
+
+    def __str__(self) -> str:
+        head = f"{self.source} -> {self.target} {self.protocol}/{self.port}: " \
+               f"{'allowed' if self.allowed else 'denied'}"
+        return "\n".join([head] + ["  " + problem for problem in self.problems])
+
+
+# pylint: disable=too-many-instance-attributes
+class NetworkModel:
+    """Indexed routes, network ACLs and security groups of the synthesized stacks"""
+
+    def __init__(self, root: StackTemplate) -> None:
+        self.stacks = {stack.name: stack for stack in root.walk()}
+        self.vpc_networks = []
+        self.subnets: Dict[Key, Tuple[str, object]] = {}
+        self.subnet_route_table: Dict[Key, Key] = {}
+        self.static_routes: Dict[Key, List[object]] = {}
+        self.propagated: Set[Key] = set()
+        self.gateway_endpoint_routes: Set[Key] = set()
+        self.subnet_acl: Dict[Key, Key] = {}
+        self.acl_entries: Dict[Tuple[Key, str], List[AclEntry]] = {}
+        self.groups: Dict[Key, str] = {}
+        self.rules: Dict[Tuple[Key, str], List[Rule]] = {}
+        self.prefix_lists: Dict[Key, List[object]] = {}
+        self.components: Dict[str, List[Placement]] = {}
+        self._verdicts: Dict[tuple, Verdict] = {}
+        for stack in self.stacks.values():
+            for logical_id, resource in stack.resources.items():
+                self._index(stack, logical_id, resource)
+        for stack in self.stacks.values():
+            for logical_id, resource in stack.resources.items():
+                self._index_rules(stack, logical_id, resource)
+                self._index_placements(stack, resource)
+        for entries in self.acl_entries.values():
+            entries.sort(key=lambda entry: entry.number)
+
+    def resolve(self, stack: StackTemplate, value):
+        """concrete value, or key of the resource a reference points to, following the
+        parameters and outputs of the nested stacks. None when not known at synth time"""
+        if isinstance(value, (str, int)):
+            return str(value)
+        if not isinstance(value, dict) or len(value) != 1:
+            return None
+        (function, argument), = value.items()
+        if function == "Ref":
+            if argument in stack.resources:
+                return stack.name, argument
+            if argument in stack.parameters and stack.parent is not None:
+                passed = stack.parent.resources[stack.parent_id]["Properties"] \
+                    .get("Parameters", {})
+                if argument in passed:
+                    return self.resolve(stack.parent, passed[argument])
+            return stack.parameters.get(argument, {}).get("Default")
+        if function == "Fn::GetAtt":
+            logical_id, attribute = argument if isinstance(argument, list) \
+                else argument.split(".", 1)
+            if logical_id in stack.children and attribute.startswith("Outputs."):
+                child = stack.children[logical_id]
+                output = child.outputs.get(attribute[len("Outputs."):])
+                return self.resolve(child, output["Value"]) if output else None
+            properties = stack.resources.get(logical_id, {}).get("Properties", {})
+            if attribute in properties:
+                return self.resolve(stack, properties[attribute])
+            return (stack.name, logical_id) if logical_id in stack.resources else None
+        return None
+
+    def resolve_list(self, stack: StackTemplate, value) -> list:
+        """resolved items of a list property, or of a single value"""
+        items = value if isinstance(value, list) else [value]
+        return [item for item in (self.resolve(stack, item) for item in items)
+                if item is not None]
+
+    def resource(self, key: Key) -> dict:
+        """template resource of a key"""
+        return self.stacks[key[0]].resources[key[1]]
+
+    def _index(self, stack: StackTemplate, logical_id: str, resource: dict) -> None:
+        """index the subnets, routes, network ACLs and security groups"""
+        key = (stack.name, logical_id)
+        properties = resource.get("Properties", {})
+        resource_type = resource["Type"]
+        if resource_type == "AWS::EC2::VPC":
+            self.vpc_networks.append(as_network(self.resolve(stack, properties.get("CidrBlock"))))
+        elif resource_type == "AWS::EC2::Subnet":
+            tags = {tag["Key"]: tag["Value"] for tag in properties.get("Tags", [])}
+            self.subnets[key] = (tags.get(SUBNET_NAME_TAG, logical_id),
+                                 as_network(self.resolve(stack, properties.get("CidrBlock"))))
+        elif resource_type == "AWS::EC2::SubnetRouteTableAssociation":
+            self.subnet_route_table[self.resolve(stack, properties["SubnetId"])] = \
+                self.resolve(stack, properties["RouteTableId"])
+        elif resource_type == "AWS::EC2::Route":
+            network = as_network(self.resolve(stack, properties.get("DestinationCidrBlock")))
+            if network is not None:
+                self.static_routes.setdefault(
+                    self.resolve(stack, properties["RouteTableId"]), []).append(network)
+        elif resource_type == "AWS::EC2::VPNGatewayRoutePropagation":
+            self.propagated.update(self.resolve_list(stack, properties["RouteTableIds"]))
+        elif resource_type == "AWS::EC2::VPCEndpoint" and \
+                properties.get("VpcEndpointType") == "Gateway":
+            self.gateway_endpoint_routes.update(
+                self.resolve_list(stack, properties.get("RouteTableIds", [])))
+        elif resource_type == "AWS::EC2::SubnetNetworkAclAssociation":
+            self.subnet_acl[self.resolve(stack, properties["SubnetId"])] = \
+                self.resolve(stack, properties["NetworkAclId"])
+        elif resource_type == "AWS::EC2::NetworkAclEntry":
+            port_range = properties.get("PortRange")
+            egress = properties.get("Egress") in (True, "true")
+            self.acl_entries.setdefault(
+                (self.resolve(stack, properties["NetworkAclId"]), EGRESS if egress else INGRESS),
+                []).append(AclEntry(
+                    int(properties["RuleNumber"]), normalize_protocol(properties["Protocol"]),
+                    (int(port_range["From"]), int(port_range["To"])) if port_range
+                    else ALL_PORTS,
+                    as_network(self.resolve(stack, properties.get("CidrBlock"))),
+                    properties["RuleAction"] == "allow"))
+        elif resource_type == "AWS::EC2::SecurityGroup":
+            name = self.resolve(stack, properties.get("GroupName")) or logical_id
+            self.groups[key] = name[:-2] if name.endswith("SG") else name
+        elif resource_type == "AWS::EC2::PrefixList":
+            self.prefix_lists[key] = [as_network(self.resolve(stack, entry["Cidr"]))
+                                      for entry in properties.get("Entries", [])]
+
+    def _index_rules(self, stack: StackTemplate, logical_id: str, resource: dict) -> None:
+        """index the inline and the separate rules of the security groups"""
+        properties = resource.get("Properties", {})
+        if resource["Type"] == "AWS::EC2::SecurityGroup":
+            for direction, name in ((INGRESS, "SecurityGroupIngress"),
+                                    (EGRESS, "SecurityGroupEgress")):
+                for rule in properties.get(name, []):
+                    self._add_rule(stack, (stack.name, logical_id), direction, rule)
+        elif resource["Type"] == "AWS::EC2::SecurityGroupIngress":
+            self._add_rule(stack, self.resolve(stack, properties["GroupId"]), INGRESS,
+                           properties)
+        elif resource["Type"] == "AWS::EC2::SecurityGroupEgress":
+            self._add_rule(stack, self.resolve(stack, properties["GroupId"]), EGRESS,
+                           properties)
+
+    def _add_rule(self, stack: StackTemplate, group: Key, direction: str, rule: dict) -> None:
+        """index one rule, rules with a peer unknown at synth time match nothing"""
+        peer = rule.get("SourceSecurityGroupId") or rule.get("DestinationSecurityGroupId")
+        prefix_list = rule.get("SourcePrefixListId") or rule.get("DestinationPrefixListId")
+        self.rules.setdefault((group, direction), []).append(Rule(
+            normalize_protocol(rule["IpProtocol"]),
+            int(rule.get("FromPort", ALL_PORTS[0])), int(rule.get("ToPort", ALL_PORTS[1])),
+            network=as_network(self.resolve(stack, rule.get("CidrIp"))),
+            prefix_list=self.resolve(stack, prefix_list) if prefix_list else None,
+            peer_group=self.resolve(stack, peer) if peer else None))
+
+    def _collect(self, stack: StackTemplate, value, groups: set, subnets: set) -> None:
+        """security groups and subnets of a resource, following its subnet groups and
+        launch templates"""
+        if isinstance(value, list):
+            for item in value:
+                self._collect(stack, item, groups, subnets)
+        elif isinstance(value, dict):
+            reference = value.get("Ref") or value.get("Fn::GetAtt")
+            if reference is not None and len(value) == 1:
+                key = self.resolve(stack, value)
+                if isinstance(key, tuple) and self.resource(key)["Type"] in FOLLOWED_TYPES:
+                    self._collect(self.stacks[key[0]],
+                                  self.resource(key).get("Properties", {}), groups, subnets)
+                return
+            for name, item in value.items():
+                if name in SECURITY_GROUP_KEYS:
+                    groups.update(key for key in self.resolve_list(stack, item)
+                                  if key in self.groups)
+                elif name in SUBNET_KEYS:
+                    subnets.update(key for key in self.resolve_list(stack, item)
+                                   if key in self.subnets)
+                else:
+                    self._collect(stack, item, groups, subnets)
+
+    def _index_placements(self, stack: StackTemplate, resource: dict) -> None:
+        """place the components of the security groups of a resource in its subnets,
+        an instance with a fixed private IP address in that address only"""
+        if resource["Type"] in FOLLOWED_TYPES:
+            return
+        groups, subnets = set(), set()
+        self._collect(stack, resource.get("Properties", {}), groups, subnets)
+        if not groups or not subnets:
+            return
+        address = as_network(self.resolve(
+            stack, resource.get("Properties", {}).get("PrivateIpAddress")))
+        for group in groups:
+            for subnet in sorted(subnets):
+                name, network = self.subnets[subnet]
+                network = address or network
+                self.components.setdefault(self.groups[group], []).append(Placement(
+                    f"{self.groups[group]} in {name} {network}", network, subnet,
+                    frozenset(groups)))
+
+    def get_placements(self, spec: str) -> List[Placement]:
+        """placements of a component, a CIDR range or a prefix list id"""
+        if spec in self.components:
+            return self.components[spec]
+        if spec.startswith("pl-") or (self.resolve_prefix_list(spec) is not None):
+            return [Placement(spec, prefix_list=spec)]
+        network = as_network(spec)
+        if network is None:
+            raise ValueError(f"Unknown component {spec}, "
+                             f"choose from {', '.join(sorted(self.components))}")
+        for subnet, (name, subnet_network) in self.subnets.items():
+            if subnet_network is not None and network.subnet_of(subnet_network):
+                return [Placement(f"{spec} in {name}", network, subnet)]
+        return [Placement(spec, network)]
+
+    def resolve_prefix_list(self, spec: str) -> Optional[Key]:
+        """key of a prefix list of the templates by logical id"""
+        for key in self.prefix_lists:
+            if key[1] == spec:
+                return key
+        return None
+
+    def is_local(self, placement: Placement) -> bool:
+        """the placement is in the VPC"""
+        return placement.subnet is not None or any(
+            network is not None and placement.network is not None
+            and placement.network.subnet_of(network) for network in self.vpc_networks)
+
+    def routes_to(self, subnet: Key, other: Placement) -> bool:
+        """the route table of the subnet routes to the other placement"""
+        route_table = self.subnet_route_table.get(subnet)
+        if self.is_local(other):
+            return True
+        if other.prefix_list is not None:
+            return route_table in self.gateway_endpoint_routes
+        if route_table in self.propagated:
+            return True
+        return any(other.is_covered_by(network)
+                   for network in self.static_routes.get(route_table, []))
+
+    # pylint: disable=too-many-arguments
+    def acl_allows(self, subnet: Key, direction: str, other: Placement, protocol: str,
+                   ports: Tuple[int, int]) -> bool:
+        """the network ACL of the subnet allows the traffic with the other placement, the
+        first matching entry decides, a subnet without network ACL has the default one"""
+        acl = self.subnet_acl.get(subnet)
+        if acl is None:
+            return True
+        for entry in self.acl_entries.get((acl, direction), []):
+            if entry.protocol not in (ALL_PROTOCOLS, protocol) or entry.network is None:
+                continue
+            if entry.allow and entry.ports[0] <= ports[0] and ports[1] <= entry.ports[1] \
+                    and other.is_covered_by(entry.network):
+                return True
+            if not entry.allow and entry.ports[0] <= ports[1] and ports[0] <= entry.ports[1] \
+                    and other.overlaps(entry.network):
+                return False
+        return False
+
+    # pylint: disable=too-many-arguments
+    def groups_allow(self, groups: frozenset, direction: str, other: Placement,
+                     protocol: str, port: int) -> bool:
+        """a rule of the security groups allows the traffic with the other placement"""
+        for group in groups:
+            for rule in self.rules.get((group, direction), []):
+                if rule.protocol not in (ALL_PROTOCOLS, protocol) or \
+                        not rule.ports[0] <= port <= rule.ports[1]:
+                    continue
+                if rule.peer_group is not None and rule.peer_group in other.groups:
+                    return True
+                if rule.network is not None and other.is_covered_by(rule.network):
+                    return True
+                if rule.prefix_list is not None and (
+                        rule.prefix_list == other.prefix_list
+                        or (isinstance(rule.prefix_list, tuple)
+                            and rule.prefix_list[1] == other.prefix_list)
+                        or any(network is not None and other.is_covered_by(network)
+                               for network in self.prefix_lists.get(rule.prefix_list, []))):
+                    return True
+        return False
+
+    def check(self, source: Placement, target: Placement, protocol: str,
+              port: int) -> List[str]:
+        """what stops the traffic from the source to the target placement"""
+        problems = []
+        pair = f"{source.name} -> {target.name}: "
+        crosses_subnets = source.subnet != target.subnet
+        for placement, other, direction, back in ((source, target, EGRESS, INGRESS),
+                                                  (target, source, INGRESS, EGRESS)):
+            if placement.subnet is None:
+                continue
+            if not self.routes_to(placement.subnet, other):
+                problems.append(pair + f"no route from {placement.name} to {other.name}")
+            if crosses_subnets and not self.acl_allows(placement.subnet, direction, other,
+                                                       protocol, (port, port)):
+                problems.append(pair + f"network ACL {direction} of {placement.name}")
+            if crosses_subnets and not self.acl_allows(placement.subnet, back, other,
+                                                       protocol, EPHEMERAL_PORTS):
+                problems.append(pair + f"network ACL {back} return traffic of "
+                                f"{placement.name}")
+            if placement.groups and not self.groups_allow(placement.groups, direction,
+                                                          other, protocol, port):
+                problems.append(pair + f"security group {direction} of {placement.name}")
+        return problems
+
+    def can_reach(self, source: str, target: str, port: int, protocol: str = "tcp") \
+            -> Verdict:
+        """whether every placement of the source reaches every placement of the target"""
+        query = (source, target, port, normalize_protocol(protocol))
+        if query not in self._verdicts:
+            problems = [problem for source_placement in self.get_placements(source)
+                        for target_placement in self.get_placements(target)
+                        for problem in self.check(source_placement, target_placement,
+                                                  query[3], port)]
+            self._verdicts[query] = Verdict(source, target, port, protocol, problems)
+        return self._verdicts[query]
+
+    def rule_ports(self, protocol: str = "tcp") -> List[int]:
+        """ports named by the security group rules of a protocol"""
+        protocol = normalize_protocol(protocol)
+        return sorted({port for rules in self.rules.values() for rule in rules
+                       if rule.protocol == protocol for port in rule.ports})
+
+    def matrix(self, ports: List[int] = None, protocol: str = "tcp") \
+            -> Dict[Tuple[str, str], List[int]]:
+        """allowed ports of every pair of components, by default of the ports named by
+        the rules"""
+        ports = ports or self.rule_ports(protocol)
+        return {(source, target): [port for port in ports
+                                   if self.can_reach(source, target, port, protocol).allowed]
+                for source in sorted(self.components) for target in sorted(self.components)
+                if source != target}
+
+
+def load_model(assembly_dir: Path, stack_name: str = None) -> NetworkModel:
+    """network model of a stack of the cloud assembly, the SWIFTMain stack by default"""
+    name, template_file = find_stack_template(assembly_dir, stack_name)
+    with open(template_file, "r", encoding="utf-8") as file:
+        return NetworkModel(StackTemplate(name, json.load(file), assembly_dir))
+
+
+def format_matrix(matrix: Dict[Tuple[str, str], List[int]]) -> str:
+    """one line per pair of components with the allowed ports"""
+    return "\n".join(f"{source} -> {target}: "
+                     f"{', '.join(str(port) for port in ports) or '-'}"
+                     for (source, target), ports in matrix.items())
+
+
+def main() -> int:
+    """command line entry, exits with 1 when the queried traffic is denied"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--assembly", help="cloud assembly directory of a cdk synth")
+    parser.add_argument("--stack", help="stack name, SWIFTMain-<region> by default")
+    parser.add_argument("--matrix", action="store_true",
+                        help="allowed ports of every pair of components")
+    parser.add_argument("-c", "--context", action="append", default=[],
+                        help="context override key=value, as for cdk synth -c")
+    parser.add_argument("query", nargs="*", help="SOURCE TARGET PORT [PROTOCOL]")
+    args = parser.parse_args()
+    if not args.matrix and len(args.query) not in (3, 4):
+        parser.error("give SOURCE TARGET PORT [PROTOCOL], or --matrix")
+
+    with tempfile.TemporaryDirectory() as outdir:
+        stack_name = args.stack
+        if not args.assembly:
+            stack_name = stack_name or synth_assembly(
+                outdir, dict(item.split("=", 1) for item in args.context))
+        model = load_model(Path(args.assembly or outdir), stack_name)
+
+    start = time.perf_counter()
+    if args.matrix:
+        print(format_matrix(model.matrix()))
+        allowed = True
+    else:
+        verdict = model.can_reach(args.query[0], args.query[1], int(args.query[2]),
+                                  *args.query[3:])
+        print(verdict)
+        allowed = verdict.allowed
+    print(f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0 if allowed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 """Nested Stack for creating VPC endpoint"""
-from typing import List, Dict
+import json
+from typing import List, Dict, Optional
 
 from aws_cdk import (
     aws_ec2 as _ec2,
@@ -8,88 +9,140 @@ from aws_cdk import (
 from aws_cdk import NestedStack
 from constructs import Construct
 
+from utilities.context_values import get_context_object
+
+# actions allowed through each interface endpoint, for the SSM and CloudWatch agents
+INTERFACE_ENDPOINT_ACTIONS = {
+    "ssm": ["ssm:DescribeAssociation",
+            "ssm:GetDeployablePatchSnapshotForInstance",
+            "ssm:GetDocument",
+            "ssm:DescribeDocument",
+            "ssm:GetManifest",
+            "ssm:GetParameter",
+            "ssm:GetParameters",
+            "ssm:ListAssociations",
+            "ssm:ListInstanceAssociations",
+            "ssm:PutInventory",
+            "ssm:PutComplianceItems",
+            "ssm:PutConfigurePackageResult",
+            "ssm:UpdateAssociationStatus",
+            "ssm:UpdateInstanceAssociationStatus",
+            "ssm:UpdateInstanceInformation"],
+    "ec2": ["ec2:Describe*"],
+    "ssmmessages": ["ssmmessages:CreateControlChannel",
+                    "ssmmessages:CreateDataChannel",
+                    "ssmmessages:OpenControlChannel",
+                    "ssmmessages:OpenDataChannel"],
+    "ec2messages": ["ec2messages:AcknowledgeMessage",
+                    "ec2messages:DeleteMessage",
+                    "ec2messages:FailMessage",
+                    "ec2messages:GetEndpoint",
+                    "ec2messages:GetMessages",
+                    "ec2messages:SendReply"],
+    "logs": ["logs:PutLogEvents",
+             "logs:DescribeLogStreams",
+             "logs:DescribeLogGroups",
+             "logs:CreateLogStream",
+             "logs:CreateLogGroup"],
+    "monitoring": ["cloudwatch:PutMetricData"],
+}
+
+# optional interface endpoints, for the hosts calling these services
+EXTRA_ENDPOINT_ACTIONS = {
+    "kms": ["kms:Decrypt",
+            "kms:DescribeKey",
+            "kms:Encrypt",
+            "kms:GenerateDataKey*"],
+    "secretsmanager": ["secretsmanager:DescribeSecret",
+                       "secretsmanager:GetSecretValue"],
+    "sts": ["sts:GetCallerIdentity"],
+}
+
+DEFAULT_ENDPOINT_SETTINGS = {
+    # interface endpoints in their own subnets, one ENI per AZ, instead of the first
+    # isolated subnet group of each AZ
+    "dedicated_subnets": False,
+    # hosts resolve the endpoints to the ENI of their own AZ, see host_group
+    "az_local_dns": False,
+    # endpoints of EXTRA_ENDPOINT_ACTIONS to create
+    "extra_services": [],
+}
+
+ENDPOINT_POLICY_MODES = ["instances", "roles", "tags"]
+# VPC endpoint policies are limited to 20,480 characters
+ENDPOINT_POLICY_LIMIT = 20480
+
+
+def get_endpoint_settings(scope: Construct) -> dict:
+    """endpoint settings, DEFAULT_ENDPOINT_SETTINGS updated by the vpc_endpoints context"""
+    settings = dict(DEFAULT_ENDPOINT_SETTINGS, **get_context_object(scope, "vpc_endpoints", {}))
+    unknown = [service for service in settings["extra_services"]
+               if service not in EXTRA_ENDPOINT_ACTIONS]
+    if unknown:
+        raise ValueError(f"Unknown endpoint services {', '.join(unknown)}, "
+                         f"choose from {', '.join(EXTRA_ENDPOINT_ACTIONS)}")
+    if settings["az_local_dns"] and not settings["dedicated_subnets"]:
+        raise ValueError("az_local_dns needs the dedicated_subnets of the endpoints")
+    return settings
+
+
+def get_interface_services(settings: dict) -> Dict[str, List[str]]:
+    """actions by service of the interface endpoints to create"""
+    services = dict(INTERFACE_ENDPOINT_ACTIONS)
+    for service in settings["extra_services"]:
+        services[service] = EXTRA_ENDPOINT_ACTIONS[service]
+    return services
+
 
 class SwiftVPCEndpoints(NestedStack):
-    """Nested Stack for creating VPC endpoint"""
+    """Nested Stack for creating VPC endpoint.
+
+    The interface endpoint policies allow the agent actions to the instances of the
+    applications, by policy_mode:
+      instances: the role session of every instance id, the policies grow with the instances
+        and change on every replacement. Applications without instance ids (an Auto Scaling
+        group) are matched by role as below
+      roles: any EC2 instance session (ec2:SourceInstanceARN) of the application roles
+      tags: any EC2 instance session of this account whose role is tagged SwiftComponent
+        with one of the applications, independent of the roles too
+    """
 
     # pylint: disable=too-many-arguments
     def __init__(self, scope: Construct, cid: str, application_names: List[str],
-                 instance_ids: Dict[str, List[str]],
+                 instance_ids: Dict[str, Optional[List[str]]],
                  instance_roles_map: Dict[str, _iam.IRole],
                  endpoint_sg: _ec2.ISecurityGroup,
-                 vpc: _ec2.Vpc) -> None:
+                 vpc: _ec2.Vpc,
+                 policy_mode: str = "instances",
+                 subnets: _ec2.SubnetSelection = None,
+                 services: Dict[str, List[str]] = None) -> None:
 
         super().__init__(scope, cid)
-        principals = []
-
-        for application_name in application_names:
-            for instance_id in instance_ids[application_name]:
-                principals.append(_iam.ArnPrincipal(
-                    arn="arn:aws:sts::" + self.account + ":assumed-role/" +
-                        instance_roles_map[application_name].role_name + "/" + instance_id))
-
-        self.create_interface_endpoint(
-            "ssm", security_group=endpoint_sg,
-            interface_endpoint_policy=
-            _iam.PolicyStatement(effect=_iam.Effect.ALLOW,
-                                 actions=["ssm:DescribeAssociation",
-                                          "ssm:GetDeployablePatchSnapshotForInstance",
-                                          "ssm:GetDocument",
-                                          "ssm:DescribeDocument",
-                                          "ssm:GetManifest",
-                                          "ssm:GetParameter",
-                                          "ssm:GetParameters",
-                                          "ssm:ListAssociations",
-                                          "ssm:ListInstanceAssociations",
-                                          "ssm:PutInventory",
-                                          "ssm:PutComplianceItems",
-                                          "ssm:PutConfigurePackageResult",
-                                          "ssm:UpdateAssociationStatus",
-                                          "ssm:UpdateInstanceAssociationStatus",
-                                          "ssm:UpdateInstanceInformation"], resources=["*"],
-                                 principals=principals), vpc=vpc)
-        self.create_interface_endpoint(
-            "ec2", security_group=endpoint_sg,
-            interface_endpoint_policy=
-            _iam.PolicyStatement(effect=_iam.Effect.ALLOW,
-                                 actions=["ec2:Describe*"], resources=["*"],
-                                 principals=principals), vpc=vpc)
-        self.create_interface_endpoint(
-            "ssmmessages", security_group=endpoint_sg,
-            interface_endpoint_policy=
-            _iam.PolicyStatement(effect=_iam.Effect.ALLOW,
-                                 actions=["ssmmessages:CreateControlChannel",
-                                          "ssmmessages:CreateDataChannel",
-                                          "ssmmessages:OpenControlChannel",
-                                          "ssmmessages:OpenDataChannel"], resources=["*"],
-                                 principals=principals), vpc=vpc)
-        self.create_interface_endpoint(
-            "ec2messages", security_group=endpoint_sg,
-            interface_endpoint_policy=
-            _iam.PolicyStatement(effect=_iam.Effect.ALLOW,
-                                 actions=["ec2messages:AcknowledgeMessage",
-                                          "ec2messages:DeleteMessage",
-                                          "ec2messages:FailMessage",
-                                          "ec2messages:GetEndpoint",
-                                          "ec2messages:GetMessages",
-                                          "ec2messages:SendReply"], resources=["*"],
-                                 principals=principals), vpc=vpc)
-        self.create_interface_endpoint(
-            "logs", security_group=endpoint_sg,
-            interface_endpoint_policy=
-            _iam.PolicyStatement(effect=_iam.Effect.ALLOW, actions=["logs:PutLogEvents",
-                                                                    "logs:DescribeLogStreams",
-                                                                    "logs:DescribeLogGroups",
-                                                                    "logs:CreateLogStream",
-                                                                    "logs:CreateLogGroup"],
-                                 resources=["*"],
-                                 principals=principals), vpc=vpc)
-        self.create_interface_endpoint(
-            "monitoring", security_group=endpoint_sg,
-            interface_endpoint_policy=
-            _iam.PolicyStatement(effect=_iam.Effect.ALLOW,
-                                 actions=["cloudwatch:PutMetricData"], resources=["*"],
-                                 principals=principals), vpc=vpc)
+        if policy_mode not in ENDPOINT_POLICY_MODES:
+            raise ValueError(f"Unknown endpoint policy mode {policy_mode}, "
+                             f"choose from {', '.join(ENDPOINT_POLICY_MODES)}")
+        self._application_names = application_names
+        self._instance_roles_map = instance_roles_map
+        self._policy_mode = policy_mode
+        self._principals = []
+        self._fleet_roles = []
+        if policy_mode == "instances":
+            for application_name in application_names:
+                # no instance ids for an Auto Scaling group, or not waited for with
+                # parallel_deploy: the role is matched instead
+                if instance_ids.get(application_name) is None:
+                    self._fleet_roles.append(instance_roles_map[application_name])
+                    continue
+                for instance_id in instance_ids[application_name]:
+                    self._principals.append(_iam.ArnPrincipal(
+                        arn="arn:aws:sts::" + self.account + ":assumed-role/" +
+                            instance_roles_map[application_name].role_name + "/" + instance_id))
+
+        for service_name, actions in (services or INTERFACE_ENDPOINT_ACTIONS).items():
+            self.create_interface_endpoint(service_name, security_group=endpoint_sg,
+                                           vpc=vpc, subnets=subnets,
+                                           interface_endpoint_policies=
+                                           self.get_policy_statements(actions))
 
         self.create_gateway_endpoint(
             "s3", vpc=vpc,
@@ -107,23 +160,74 @@ class SwiftVPCEndpoints(NestedStack):
                     "arn:aws:s3:::aws-ssm-distributor-file-" + self.region + "/*",
                     "arn:aws:s3:::patch-baseline-snapshot-" + self.region + "/*",
                     "arn:aws:s3:::amazoncloudwatch-agent-" + self.region + "/*",
+                    # readiness signals of the instances, see boot_readiness
+                    "arn:aws:s3:::cloudformation-waitcondition-" + self.region + "/*",
                     "arn:aws:s3:::" + self.node.try_get_context("qs_s3_bucket") +
                     "-" + self.region + "/*"],
                 principals=[_iam.AnyPrincipal()]))
 
     def create_interface_endpoint(self, service_name: str, security_group: _ec2.ISecurityGroup,
                                   vpc: _ec2.Vpc,
-                                  interface_endpoint_policy: _iam.PolicyStatement = None):
-        """create interface endpoint"""
+                                  interface_endpoint_policy: _iam.PolicyStatement = None,
+                                  interface_endpoint_policies: List[_iam.PolicyStatement] = None,
+                                  subnets: _ec2.SubnetSelection = None):
+        """create interface endpoint, in subnets or one subnet per AZ chosen by CDK"""
         vpc_endpoint = _ec2.InterfaceVpcEndpoint(
             self, id=service_name.upper() + "VPCEndPoint",
-            vpc=vpc,
+            vpc=vpc, subnets=subnets,
             service=_ec2.InterfaceVpcEndpointAwsService(service_name),
             private_dns_enabled=True,
             security_groups=[security_group]
         )
-        if interface_endpoint_policy is not None:
-            vpc_endpoint.add_to_policy(interface_endpoint_policy)
+        statements = [interface_endpoint_policy] if interface_endpoint_policy else []
+        statements += interface_endpoint_policies or []
+        for policy in statements:
+            vpc_endpoint.add_to_policy(policy)
+        self.check_policy_size(service_name, statements)
+
+    def get_policy_statements(self, actions: List[str]) -> List[_iam.PolicyStatement]:
+        """statements of an interface endpoint policy allowing the actions, see policy_mode"""
+        source_instance = {"ArnLike": {"ec2:SourceInstanceARN":
+                                       "arn:" + self.partition + ":ec2:" + self.region + ":" +
+                                       self.account + ":instance/*"}}
+        if self._policy_mode == "roles":
+            return [_iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW, actions=actions, resources=["*"],
+                principals=[_iam.AnyPrincipal()],
+                conditions=dict(source_instance, ArnEquals={"aws:PrincipalArn": [
+                    self._instance_roles_map[application_name].role_arn
+                    for application_name in self._application_names]}))]
+        if self._policy_mode == "tags":
+            return [_iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW, actions=actions, resources=["*"],
+                principals=[_iam.AnyPrincipal()],
+                conditions=dict(source_instance, StringEquals={
+                    "aws:PrincipalAccount": self.account,
+                    "aws:PrincipalTag/SwiftComponent": self._application_names}))]
+
+        statements = []
+        if self._principals:
+            statements.append(_iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW, actions=actions, resources=["*"],
+                principals=self._principals))
+        for role in self._fleet_roles:
+            statements.append(_iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW, actions=actions, resources=["*"],
+                principals=[_iam.AnyPrincipal()],
+                conditions={"ArnEquals": {"aws:PrincipalArn": role.role_arn}}))
+        return statements
+
+    def check_policy_size(self, service_name: str,
+                          statements: List[_iam.PolicyStatement]) -> None:
+        """raising ValueError when an endpoint policy is over the size limit. The size is
+        measured on the resolved template, references to instance ids and roles stand in for
+        ARNs of a similar length"""
+        document = _iam.PolicyDocument(statements=statements)
+        size = len(json.dumps(self.resolve(document.to_json()), separators=(",", ":")))
+        if size > ENDPOINT_POLICY_LIMIT:
+            raise ValueError(f"The {service_name} endpoint policy is about {size} characters, "
+                             f"over the limit of {ENDPOINT_POLICY_LIMIT}: use the roles or tags "
+                             "endpoint_policy_mode")
 
     def create_gateway_endpoint(self, service_name: str, vpc: _ec2.Vpc,
                                 gateway_endpoint_policy: _iam.PolicyStatement = None):
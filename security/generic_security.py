@@ -1,13 +1,16 @@
 """Nested Stack for Generic Security"""
-from typing import Dict
+from typing import Dict, List
 
 from aws_cdk import (
     aws_ec2 as _ec2,
     aws_iam as _iam
 )
-from aws_cdk import NestedStack
+from aws_cdk import Annotations, NestedStack, Tags
 from constructs import Construct
 
+from security.rule_compiler import DEFAULT_RULE_QUOTA, EGRESS, INGRESS, \
+    QUOTA_WARNING_RATIO, RuleTable, count_entries, format_quota_report
+
 
 class GenericSecurity(NestedStack):
     """Nested Stack for Generic Security, creating security groups, nacls, instance roles"""
@@ -19,6 +22,7 @@ class GenericSecurity(NestedStack):
         self._nacls: {str, _ec2.NetworkAcl} = {}
         self._gateway_endpoints: {str, _ec2.GatewayVpcEndpoint} = {}
         self._instance_role: {str, _iam.Role} = {}
+        self._rules = RuleTable()
 
     def get_instance_roles(self) -> Dict[str, _iam.IRole]:
         """getting all instance roles"""
@@ -36,6 +40,8 @@ class GenericSecurity(NestedStack):
                                   assumed_by=_iam.ServicePrincipal('ec2.amazonaws.com')
                                   )
 
+        # aws:PrincipalTag/SwiftComponent of the instance sessions, see SwiftVPCEndpoints
+        Tags.of(instance_role).add("SwiftComponent", name)
         instance_role.add_managed_policy(
             _iam.ManagedPolicy.from_aws_managed_policy_name("AmazonSSMManagedInstanceCore"))
 
@@ -119,42 +125,69 @@ class GenericSecurity(NestedStack):
                                 prefix_list: str = None,
                                 from_port: int = 0,
                                 to_port: int = 0, is_ingress: bool = True, description: str = None):
-        """add security group rule"""
-        if cidr_range is None:
+        """add security group rule to the rule table, see apply_security_group_rules"""
+        if cidr_range is None and prefix_list is None:
             cidr_range = self._vpc.vpc_cidr_block
+        self._rules.allow(sg_id, INGRESS if is_ingress else EGRESS, protocol,
+                          from_port=from_port, to_port=to_port, cidr=cidr_range,
+                          prefix_list=prefix_list, description=description)
 
-        if from_port != 0 and to_port == 0:
-            to_port = from_port
-
-        if prefix_list is not None:
-            peer = _ec2.Peer.prefix_list(prefix_list)
-            rule_id = f'{sg_id}_{protocol.name}_prefixlist_{from_port}_{to_port}'
-        else:
-            peer = _ec2.Peer.ipv4(cidr_range)
-            rule_id = f'{sg_id}_{protocol.name}_{cidr_range}_{from_port}_{to_port}'
-
-        if is_ingress:
-            self._security_groups[sg_id].add_ingress_rule(
-                peer=peer,
-                connection=_ec2.Port(
-                    string_representation=rule_id,
-                    protocol=protocol,
-                    from_port=from_port,
-                    to_port=to_port
-                ),
-                description=description
-            )
-        else:
-            self._security_groups[sg_id].add_egress_rule(
-                peer=peer,
-                connection=_ec2.Port(
-                    string_representation=rule_id,
-                    protocol=protocol,
-                    from_port=from_port,
-                    to_port=to_port
-                ),
-                description=description
-            )
+    # pylint: disable=too-many-arguments
+    def add_security_group_connection(self, source_sg_id: str, target_sg_id: str,
+                                      protocol: _ec2.Protocol, from_port: int,
+                                      to_port: int = None, description: str = None,
+                                      name: str = None):
+        """add the egress rule of the source and the ingress rule of the target security
+        group to the rule table, see apply_security_group_rules. The name is the string
+        representation of the port, in the construct id of the rules"""
+        self._rules.connect(source_sg_id, target_sg_id, protocol, from_port, to_port,
+                            description, name)
+
+    def apply_security_group_rules(self) -> List[str]:
+        """compile the rule table (see security.rule_compiler) and add the rules to the
+        security groups, once all the rules are in the table. Returns the rule entries of
+        each security group against the security_group_rule_quota context, raising
+        ValueError over it"""
+        rules, prefix_lists = self._rules.compile()
+        prefix_list_ids = {}
+        for name, cidrs in prefix_lists.items():
+            prefix_list_ids[name] = _ec2.CfnPrefixList(
+                self, name, address_family="IPv4", max_entries=len(cidrs),
+                prefix_list_name=name,
+                entries=[_ec2.CfnPrefixList.EntryProperty(cidr=cidr) for cidr in cidrs]
+            ).attr_prefix_list_id
+
+        for rule in rules:
+            if rule.cidr is not None:
+                peer = _ec2.Peer.ipv4(rule.cidr)
+            elif rule.prefix_list is not None:
+                peer = _ec2.Peer.prefix_list(prefix_list_ids.get(rule.prefix_list,
+                                                                 rule.prefix_list))
+            else:
+                peer = self._security_groups[rule.peer_group]
+            port = _ec2.Port(protocol=rule.protocol, from_port=rule.from_port,
+                             to_port=rule.to_port,
+                             string_representation=rule.string_representation())
+            if rule.direction == INGRESS:
+                self._security_groups[rule.group].add_ingress_rule(
+                    peer=peer, connection=port, description=rule.description)
+            else:
+                self._security_groups[rule.group].add_egress_rule(
+                    peer=peer, connection=port, description=rule.description)
+
+        quota = int(self.node.try_get_context("security_group_rule_quota") or DEFAULT_RULE_QUOTA)
+        counts = count_entries(rules, {name: len(cidrs) for name, cidrs in prefix_lists.items()})
+        for (group, direction), count in counts.items():
+            if count > quota:
+                raise ValueError(f"{group} has {count} {direction} rule entries, over the "
+                                 f"quota of {quota}")
+            if count > quota * QUOTA_WARNING_RATIO:
+                Annotations.of(self._security_groups[group]).add_warning(
+                    f"{count} {direction} rule entries of the quota of {quota}")
+        report = format_quota_report(counts, quota)
+        for line in report:
+            Annotations.of(self).add_info(line)
+        return report
 
     def get_security_group_id(self, sg_id: str) -> str:
         """get security group id"""
@@ -0,0 +1,254 @@
+"""Declarative security group rules, compiled at synth time.
+
+Rules are collected in a RuleTable and compiled before they are added to the security
+groups: duplicates are dropped, rules covered by an all traffic rule to the same peer are
+dropped, overlapping or adjacent port ranges to the same peer are merged, and so are the
+CIDR ranges of rules on the same ports. A set of CIDR ranges repeated on several rules is
+moved to a shared managed prefix list, one rule per use instead of one per range.
+
+A prefix list counts its max entries against the rules quota of each security group that
+references it, so it saves template resources and updates, not quota: the quota report
+counts it that way.
+"""
+import ipaddress
+from typing import Dict, List, Optional, Tuple
+
+from aws_cdk import aws_ec2 as _ec2
+from aws_cdk import Token
+
+INGRESS = "ingress"
+EGRESS = "egress"
+# inbound and outbound rules per security group, each, the default VPC quota
+DEFAULT_RULE_QUOTA = 60
+# share of the quota above which the report warns
+QUOTA_WARNING_RATIO = 0.8
+# rules (security group, direction, ports) a set of CIDR ranges is repeated in
+# before it is moved to a prefix list
+PREFIX_LIST_MIN_USES = 2
+MAX_DESCRIPTION_LENGTH = 255
+ALL_PORTS = (0, 65535)
+
+
+class SecurityGroupRule:
+    """One rule of a security group, the peer is a CIDR range, a prefix list or
+    another security group, by name"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, group: str, direction: str, protocol: _ec2.Protocol,
+                 from_port: int = 0, to_port: int = None,
+                 cidr: str = None, prefix_list: str = None, peer_group: str = None,
+                 description: str = None, name: str = None) -> None:
+        if [cidr, prefix_list, peer_group].count(None) != 2:
+            raise ValueError(f"{group} {direction} rule needs one of cidr, prefix_list "
+                             "and peer_group")
+        self.group = group
+        self.direction = direction
+        self.protocol = protocol
+        if protocol == _ec2.Protocol.ALL:
+            from_port, to_port = ALL_PORTS
+        self.from_port = from_port
+        self.to_port = from_port if to_port in (None, 0) else to_port
+        self.cidr = cidr
+        self.prefix_list = prefix_list
+        self.peer_group = peer_group
+        self.descriptions = [description] if description else []
+        # string representation of a rule between security groups, kept from the
+        # allow_from/allow_to calls the rule replaces as it names the rule resources
+        self.name = name
+
+    @property
+    def peer(self) -> Tuple[str, str]:
+        """kind and value of the peer"""
+        if self.cidr is not None:
+            return "cidr", self.cidr
+        if self.prefix_list is not None:
+            return "prefix_list", self.prefix_list
+        return "group", self.peer_group
+
+    @property
+    def description(self) -> Optional[str]:
+        """descriptions of the merged rules"""
+        if not self.descriptions:
+            return None
+        return "; ".join(dict.fromkeys(self.descriptions))[:MAX_DESCRIPTION_LENGTH]
+
+    def key(self) -> str:
+        """string representation of the rule, unique per security group"""
+        return f"{self.direction} {self.protocol.name} {self.from_port}-{self.to_port} " \
+               f"{self.peer[0]} {self.peer[1]}"
+
+    def string_representation(self) -> str:
+        """string representation of the port of the rule, part of the construct id of
+        the rule resources. A rule to a CIDR range or a prefix list is named as
+        add_security_group_rule named it, a rule between security groups by its name"""
+        if self.peer_group is not None:
+            return self.name or self.key()
+        peer = self.cidr if self.cidr is not None else "prefixlist"
+        return f"{self.group}_{self.protocol.name}_{peer}_{self.from_port}_{self.to_port}"
+
+    def copy(self, **changes) -> "SecurityGroupRule":
+        """a copy of the rule with other ports or peer"""
+        rule = SecurityGroupRule(self.group, self.direction, self.protocol, self.from_port,
+                                 self.to_port, self.cidr, self.prefix_list, self.peer_group,
+                                 name=self.name)
+        rule.descriptions = list(self.descriptions)
+        for name, value in changes.items():
+            setattr(rule, name, value)
+        return rule
+
+
+class RuleTable:
+    """Rules of the security groups, added in any order and compiled once"""
+
+    def __init__(self) -> None:
+        self.rules: List[SecurityGroupRule] = []
+
+    # pylint: disable=too-many-arguments
+    def allow(self, group: str, direction: str, protocol: _ec2.Protocol,
+              from_port: int = 0, to_port: int = None, cidr: str = None,
+              prefix_list: str = None, peer_group: str = None,
+              description: str = None, name: str = None) -> None:
+        """allow traffic between a security group and a peer"""
+        self.rules.append(SecurityGroupRule(group, direction, protocol, from_port, to_port,
+                                            cidr, prefix_list, peer_group, description, name))
+
+    # pylint: disable=too-many-arguments
+    def connect(self, source: str, target: str, protocol: _ec2.Protocol,
+                from_port: int, to_port: int = None, description: str = None,
+                name: str = None) -> None:
+        """allow traffic from the source to the target security group, the egress rule
+        of the source and the ingress rule of the target"""
+        self.allow(source, EGRESS, protocol, from_port, to_port, peer_group=target,
+                   description=description, name=name)
+        self.allow(target, INGRESS, protocol, from_port, to_port, peer_group=source,
+                   description=description, name=name)
+
+    def compile(self) -> Tuple[List[SecurityGroupRule], Dict[str, List[str]]]:
+        """the compiled rules, and the CIDR ranges of the prefix lists they reference
+        by prefix list name"""
+        rules = merge_port_ranges(drop_covered(self.rules))
+        return extract_prefix_lists(merge_cidrs(rules))
+
+
+def is_concrete_cidr(cidr: Optional[str]) -> bool:
+    """an IPv4 CIDR range known at synth time"""
+    return cidr is not None and not Token.is_unresolved(cidr)
+
+
+def drop_covered(rules: List[SecurityGroupRule]) -> List[SecurityGroupRule]:
+    """drop the duplicates and the rules to a peer that has an all traffic rule,
+    keeping their descriptions"""
+    kept: Dict[str, SecurityGroupRule] = {}
+    all_traffic = {(rule.group, rule.direction, rule.peer): rule for rule in rules
+                   if rule.protocol == _ec2.Protocol.ALL}
+    for rule in rules:
+        target = all_traffic.get((rule.group, rule.direction, rule.peer), rule)
+        key = target.group + " " + target.key()
+        if key not in kept:
+            kept[key] = target.copy(descriptions=[])
+        kept[key].descriptions += rule.descriptions
+    return list(kept.values())
+
+
+def merge_port_ranges(rules: List[SecurityGroupRule]) -> List[SecurityGroupRule]:
+    """merge the overlapping or adjacent port ranges of rules to the same peer"""
+    grouped: Dict[tuple, List[SecurityGroupRule]] = {}
+    for rule in rules:
+        grouped.setdefault((rule.group, rule.direction, rule.protocol.name, rule.peer),
+                           []).append(rule)
+    merged = []
+    for group_rules in grouped.values():
+        current = None
+        for rule in sorted(group_rules, key=lambda item: (item.from_port, item.to_port)):
+            if current is not None and rule.from_port <= current.to_port + 1:
+                if rule.to_port > current.to_port:
+                    # new ports, the rule is no longer the one it was named after
+                    current.to_port = rule.to_port
+                    current.name = None
+                current.descriptions += rule.descriptions
+            else:
+                current = rule.copy()
+                merged.append(current)
+    return merged
+
+
+def merge_cidrs(rules: List[SecurityGroupRule]) -> List[SecurityGroupRule]:
+    """merge the overlapping, contained or adjacent CIDR ranges of rules on the same
+    ports, CIDR ranges only known at deployment are left as they are"""
+    grouped: Dict[tuple, List[SecurityGroupRule]] = {}
+    merged = []
+    for rule in rules:
+        if is_concrete_cidr(rule.cidr):
+            grouped.setdefault((rule.group, rule.direction, rule.protocol.name,
+                                rule.from_port, rule.to_port), []).append(rule)
+        else:
+            merged.append(rule)
+    for group_rules in grouped.values():
+        networks = ipaddress.collapse_addresses(
+            ipaddress.ip_network(rule.cidr, strict=False) for rule in group_rules)
+        for network in networks:
+            covered = [rule for rule in group_rules
+                       if ipaddress.ip_network(rule.cidr, strict=False).subnet_of(network)]
+            rule = covered[0].copy(cidr=str(network))
+            rule.descriptions = [description for item in covered
+                                 for description in item.descriptions]
+            merged.append(rule)
+    return merged
+
+
+def extract_prefix_lists(rules: List[SecurityGroupRule]) \
+        -> Tuple[List[SecurityGroupRule], Dict[str, List[str]]]:
+    """move the sets of CIDR ranges repeated in PREFIX_LIST_MIN_USES rules to prefix lists"""
+    grouped: Dict[tuple, List[SecurityGroupRule]] = {}
+    for rule in rules:
+        if is_concrete_cidr(rule.cidr):
+            grouped.setdefault((rule.group, rule.direction, rule.protocol.name,
+                                rule.from_port, rule.to_port), []).append(rule)
+    uses: Dict[tuple, List[tuple]] = {}
+    for key, group_rules in grouped.items():
+        cidrs = tuple(sorted(rule.cidr for rule in group_rules))
+        if len(cidrs) > 1:
+            uses.setdefault(cidrs, []).append(key)
+
+    prefix_lists = {}
+    replaced = {}
+    for cidrs, keys in uses.items():
+        if len(keys) < PREFIX_LIST_MIN_USES:
+            continue
+        name = f"SharedPeers{len(prefix_lists) + 1}"
+        prefix_lists[name] = list(cidrs)
+        for key in keys:
+            replaced[key] = name
+
+    compiled = []
+    added = set()
+    for rule in rules:
+        key = (rule.group, rule.direction, rule.protocol.name, rule.from_port, rule.to_port)
+        if not is_concrete_cidr(rule.cidr) or key not in replaced:
+            compiled.append(rule)
+        elif key not in added:
+            added.add(key)
+            prefix_rule = rule.copy(cidr=None, prefix_list=replaced[key])
+            prefix_rule.descriptions = [description for item in grouped[key]
+                                        for description in item.descriptions]
+            compiled.append(prefix_rule)
+    return compiled, prefix_lists
+
+
+def count_entries(rules: List[SecurityGroupRule],
+                  prefix_list_sizes: Dict[str, int]) -> Dict[Tuple[str, str], int]:
+    """quota entries by security group and direction, a prefix list counting its size"""
+    counts = {}
+    for rule in rules:
+        entries = prefix_list_sizes.get(rule.prefix_list, 1) if rule.prefix_list else 1
+        key = (rule.group, rule.direction)
+        counts[key] = counts.get(key, 0) + entries
+    return counts
+
+
+def format_quota_report(counts: Dict[Tuple[str, str], int],
+                        quota: int = DEFAULT_RULE_QUOTA) -> List[str]:
+    """rule entries of each security group against the quota"""
+    groups = sorted({group for group, _ in counts})
+    return [f"{group}: ingress {counts.get((group, INGRESS), 0)}/{quota}, "
+            f"egress {counts.get((group, EGRESS), 0)}/{quota}" for group in groups]
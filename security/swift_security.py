@@ -1,9 +1,9 @@
 """Class for SWIFT specific security"""
-import boto3
 from aws_cdk import (
     aws_ec2 as _ec2,
 )
 from constructs import Construct
+from utilities.cached_lookup import lookup_prefix_list_id
 from utilities.swift_components import SwiftComponents
 from security.generic_security import GenericSecurity
 
@@ -23,113 +23,56 @@ class SWIFTSecurity(GenericSecurity):
         self.create_security_group("VPCEndpointSG")
 
     def enforce_security_groups_rules(self) -> None:
-        """enforcing security group rule. ie creating security group rule """
-        sagsnl_sg = self.get_security_group(SwiftComponents.SAGSNL + "SG")
-        rds_sg = self.get_security_group("RDSSG")
-        mq_sg = self.get_security_group("MQSG")
-        amh_sg = self.get_security_group(SwiftComponents.AMH + "SG")
+        """enforcing security group rule. ie creating security group rule, the rules are
+        compiled by apply_security_group_rules, see security.rule_compiler"""
+        sagsnl = SwiftComponents.SAGSNL + "SG"
+        amh = SwiftComponents.AMH + "SG"
+        tcp = _ec2.Protocol.TCP
 
-        boto = boto3.client("ec2")
-        prefix_lists = boto.describe_prefix_lists(
-            Filters=[{"Name": "prefix-list-name", "Values": ["com.amazonaws.*.s3"]}])
-        s3_prefix_list = prefix_lists["PrefixLists"][0]["PrefixListId"]
+        s3_prefix_list = lookup_prefix_list_id(self)
 
-        sagsnl_sg.connections.allow_from(other=amh_sg,
-                                         port_range=_ec2.Port(
-                                             protocol=_ec2.Protocol.TCP,
-                                             string_representation="SAGSNL- AMH (48002,48003)",
-                                             from_port=48002,
-                                             to_port=48003
-                                         ),
-                                         description="Incoming connection from AMH")
-
-        self.add_security_group_rule(SwiftComponents.SAGSNL + "SG", protocol=_ec2.Protocol.TCP,
+        self.add_security_group_connection(amh, sagsnl, tcp, 48002, 48003,
+                                           description="AMH to SAGSNL connection",
+                                           name="AMH - SAGSNL (48002, 48003)")
+        self.add_security_group_rule(sagsnl, protocol=tcp,
                                      cidr_range=self._workstation_ip_range,
-                                     from_port=2443, to_port=2443, is_ingress=True,
-                                     description="SWP Web GUI Interface Ingress from workstation"
-                                     )
-        self.add_security_group_rule(SwiftComponents.SAGSNL + "SG", protocol=_ec2.Protocol.TCP,
-                                     prefix_list=s3_prefix_list,
-                                     from_port=443, to_port=443, is_ingress=False,
-                                     description="Egress to S3 VPC Gateway Endpoint"
-                                     )
-        self.add_security_group_rule(SwiftComponents.SAGSNL + "SG", protocol=_ec2.Protocol.ALL,
-                                     cidr_range=self._swift_ip_range,
-                                     from_port=0, to_port=65535, is_ingress=False,
-                                     description="To SWIFT via VGW and VPN"
-                                     )
-        self.add_security_group_rule(SwiftComponents.SAGSNL + "SG", protocol=_ec2.Protocol.TCP,
-                                     cidr_range=self._hsm_ip,
-                                     from_port=1792, to_port=1792, is_ingress=False,
-                                     description="To HSM via VGW"
-                                     )
-        self.add_security_group_rule(SwiftComponents.SAGSNL + "SG", protocol=_ec2.Protocol.TCP,
-                                     cidr_range=self._hsm_ip,
-                                     from_port=22, to_port=22, is_ingress=False,
-                                     description="To HSM (SSH) via VGW"
-                                     )
-        self.add_security_group_rule(SwiftComponents.SAGSNL + "SG", protocol=_ec2.Protocol.TCP,
-                                     cidr_range=self._hsm_ip,
-                                     from_port=48321, to_port=48321, is_ingress=False,
-                                     description="TO HSM (Remote PED) via VGW "
-                                     )
+                                     from_port=2443, is_ingress=True,
+                                     description="SWP Web GUI Interface Ingress from workstation")
+        self.add_security_group_rule(sagsnl, protocol=tcp, prefix_list=s3_prefix_list,
+                                     from_port=443, is_ingress=False,
+                                     description="Egress to S3 VPC Gateway Endpoint")
+        self.add_security_group_rule(sagsnl, protocol=_ec2.Protocol.ALL,
+                                     cidr_range=self._swift_ip_range, is_ingress=False,
+                                     description="To SWIFT via VGW and VPN")
+        self.add_security_group_rule(sagsnl, protocol=tcp, cidr_range=self._hsm_ip,
+                                     from_port=1792, is_ingress=False,
+                                     description="To HSM via VGW")
+        self.add_security_group_rule(sagsnl, protocol=tcp, cidr_range=self._hsm_ip,
+                                     from_port=22, is_ingress=False,
+                                     description="To HSM (SSH) via VGW")
+        self.add_security_group_rule(sagsnl, protocol=tcp, cidr_range=self._hsm_ip,
+                                     from_port=48321, is_ingress=False,
+                                     description="TO HSM (Remote PED) via VGW")
 
-        amh_sg.connections.allow_to(other=sagsnl_sg,
-                                    port_range=_ec2.Port(
-                                        protocol=_ec2.Protocol.TCP,
-                                        string_representation="AMH - SAGSNL (48002, 48003)",
-                                        from_port=48002,
-                                        to_port=48003
-                                    ),
-                                    description="AMH to SAGSNL connection")
+        self.add_security_group_connection(amh, "RDSSG", tcp, 1521,
+                                           description="AMH - RDS (1521)", name="RDS (1521)")
+        self.add_security_group_connection(amh, "MQSG", tcp, 61617,
+                                           description="AMH - MQ (61617)", name="MQ (61617)")
+        self.add_security_group_rule(amh, protocol=tcp, prefix_list=s3_prefix_list,
+                                     from_port=443, is_ingress=False,
+                                     description="AMH Egress to S3")
+        self.add_security_group_rule(amh, protocol=tcp, cidr_range=self._workstation_ip_range,
+                                     from_port=8443, is_ingress=True)
 
-        amh_sg.connections.allow_to(other=rds_sg,
-                                    port_range=_ec2.Port(
-                                        protocol=_ec2.Protocol.TCP,
-                                        string_representation="RDS (1521)",
-                                        from_port=1521,
-                                        to_port=1521
-                                    ),
-                                    description="AMH - RDS (1521)")
-        amh_sg.connections.allow_to(other=mq_sg,
-                                    port_range=_ec2.Port(
-                                        protocol=_ec2.Protocol.TCP,
-                                        string_representation="MQ (61617)",
-                                        from_port=61617,
-                                        to_port=61617
-                                    ),
-                                    description="AMH - MQ (61617)")
-        self.add_security_group_rule(SwiftComponents.AMH + "SG", protocol=_ec2.Protocol.TCP,
-                                     prefix_list=s3_prefix_list,
-                                     from_port=443, to_port=443,
-                                     is_ingress=False,
-                                     description="AMH Egress to S3"
-                                     )
-        self.add_security_group_rule(SwiftComponents.AMH + "SG", protocol=_ec2.Protocol.TCP,
-                                     cidr_range=self._workstation_ip_range,
-                                     from_port=8443, to_port=8443, is_ingress=True
-                                     )
-        rds_sg.connections.allow_from(other=amh_sg,
-                                      port_range=_ec2.Port(
-                                          protocol=_ec2.Protocol.TCP,
-                                          string_representation="RDS (1521)",
-                                          from_port=1521,
-                                          to_port=1521
-                                      ),
-                                      description="AMH - RDS (1521)")
+        # read replicas of the AMH database, for reporting, search and audit queries
+        if self.get_security_group("RDSReplicaSG"):
+            self.add_security_group_connection(amh, "RDSReplicaSG", tcp, 1521,
+                                               description="AMH - RDS Replica (1521)",
+                                               name="RDS Replica (1521)")
 
-        mq_sg.connections.allow_from(other=amh_sg,
-                                     port_range=_ec2.Port(
-                                         protocol=_ec2.Protocol.TCP,
-                                         string_representation="MQ (61617)",
-                                         from_port=61617,
-                                         to_port=61617
-                                     ),
-                                     description="AMH - MQ (61617)")
-        self.add_security_group_rule("MQSG", protocol=_ec2.Protocol.TCP,
-                                     cidr_range=self._workstation_ip_range,
-                                     from_port=8162, to_port=8162, is_ingress=True
-                                     )
+        self.add_security_group_rule("MQSG", protocol=tcp, cidr_range=self._workstation_ip_range,
+                                     from_port=8162, is_ingress=True)
+        self.apply_security_group_rules()
 
     def create_nacls(self) -> None:
         """creating nacl and rules"""
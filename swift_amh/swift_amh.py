@@ -1,9 +1,13 @@
 """AMH Instance"""
-from aws_cdk import aws_kms as _kms
+from aws_cdk import (
+    aws_kms as _kms,
+    aws_ec2 as _ec2,
+)
 from cdk_ec2_key_pair import KeyPair
 from constructs import Construct
 
 from base_host_group.host_group import HostGroup
+from base_host_group.performance_tier import PerformanceTier
 from network.generic_network import GenericNetwork
 from security.generic_security import GenericSecurity
 from utilities.swift_components import SwiftComponents
@@ -18,8 +22,11 @@ class SwiftAMH(HostGroup):
                  security: GenericSecurity,
                  workload_key: _kms.Key,
                  ops_key: KeyPair,
+                 vpc_subnets: _ec2.SubnetSelection = None,
                  ami_id: str = None,
                  private_ip: str = None,
+                 performance_tier: PerformanceTier = None,
+                 placement_group: _ec2.CfnPlacementGroup = None,
                  **kwargs) -> None:
         super().__init__(scope, cid=cid,
                          component=SwiftComponents.AMH,
@@ -27,7 +34,10 @@ class SwiftAMH(HostGroup):
                          security=security,
                          workload_key=workload_key,
                          ops_key=ops_key,
+                         vpc_subnets=vpc_subnets,
                          ami_id=ami_id,
                          private_ip=private_ip,
+                         performance_tier=performance_tier,
+                         placement_group=placement_group,
                          **kwargs
                          )
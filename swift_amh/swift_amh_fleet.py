@@ -0,0 +1,160 @@
+"""AMH Auto Scaling group, scaled on the Amazon MQ backlog"""
+from typing import Dict
+
+from aws_cdk import (
+    aws_autoscaling as _autoscaling,
+    aws_cloudwatch as _cw,
+    aws_ec2 as _ec2,
+)
+from aws_cdk import NestedStack, CfnWaitConditionHandle, Duration, Tags
+from cdk_ec2_key_pair import KeyPair
+from constructs import Construct
+
+from base_host_group.boot_readiness import create_ready_handle
+from base_host_group.host_group import create_user_data, get_endpoint_cidrs, \
+    get_host_instance_role, get_host_security_group, get_machine_image
+from base_host_group.network_tuning import NetworkTuning
+from base_host_group.performance_tier import PerformanceTier
+from base_host_group.storage_layout import StorageLayout
+from network.generic_network import GenericNetwork, get_vpn_cidrs
+from security.generic_security import GenericSecurity
+from swift_mq.swift_mq import SwiftMQ
+from utilities.context_values import get_context_object
+from utilities.swift_components import SwiftComponents
+
+DEFAULT_FLEET_SETTINGS = {
+    "min_capacity": 2,
+    "max_capacity": 6,
+    "queue_name": "AMH.INBOUND",
+    # messages waiting per in service instance that the fleet is sized for
+    "backlog_per_instance": 1000,
+    # enqueued messages per minute above which an instance is added ahead of the backlog
+    "enqueue_rate_per_minute": 6000,
+}
+
+
+class SwiftAMHFleet(NestedStack):
+    """AMH instances launched from a launch template by an Auto Scaling group spread
+    across the AMH subnets of every availability zone.
+
+    Instances are tagged SwiftComponent=AMH, the instance ids are not known at synth time.
+    Additional volumes of the storage layout are part of the launch template and encrypted
+    with the default EBS key, so the Auto Scaling service linked role needs no grant on the
+    workload key."""
+
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-locals
+    def __init__(self, scope: Construct, cid: str,
+                 network: GenericNetwork,
+                 security: GenericSecurity,
+                 mq_broker: SwiftMQ,
+                 ops_key: KeyPair = None,
+                 ami_id: str = None,
+                 performance_tier: PerformanceTier = None,
+                 storage_layout: StorageLayout = None,
+                 placement_group: _ec2.CfnPlacementGroup = None,
+                 log_groups: Dict[str, str] = None,
+                 network_tuning: NetworkTuning = None,
+                 **kwargs) -> None:
+        super().__init__(scope, cid, **kwargs)
+        component = SwiftComponents.AMH
+        settings = dict(DEFAULT_FLEET_SETTINGS, **get_context_object(self, "amh_fleet", {}))
+
+        if performance_tier is None:
+            performance_tier = PerformanceTier.from_context(self, component, cid)
+        if storage_layout is None:
+            storage_layout = StorageLayout.from_context(self, component, cid)
+        if network_tuning is None:
+            network_tuning = NetworkTuning.from_context(self, component, cid)
+        network_tuning.check(cid, performance_tier)
+
+        # every instance signals the handle, the parent stack waits for min_capacity of them
+        self._ready_handle = create_ready_handle(self)
+        self.ready_count = int(settings["min_capacity"])
+        endpoint_cidrs = get_endpoint_cidrs(
+            self, network,
+            network.get_vpc().select_subnets(subnet_group_name=component).subnets)
+        user_data = create_user_data(self, component, cid, storage_layout,
+                                     storage_layout.get_mount_commands(), ami_id, log_groups,
+                                     self._ready_handle.ref, endpoint_cidrs,
+                                     network_tuning.get_commands(get_vpn_cidrs(self)))
+
+        security_group = get_host_security_group(security, component)
+        launch_template = _ec2.LaunchTemplate(
+            self, "LaunchTemplate",
+            instance_type=performance_tier.get_instance_type(),
+            machine_image=get_machine_image(ami_id),
+            block_devices=storage_layout.get_launch_template_block_devices(),
+            role=get_host_instance_role(security, component),
+            security_group=security_group,
+            key_name=ops_key.key_pair_name if ops_key is not None else None,
+            user_data=user_data, **network_tuning.get_launch_template_options())
+        performance_tier.apply_to_launch_template(launch_template)
+        network_tuning.apply_to_launch_template(launch_template, security_group)
+        storage_layout.apply_throughput(launch_template)
+        if placement_group is not None:
+            if placement_group.strategy == "cluster":
+                raise ValueError(f"{cid}: the fleet spans availability zones, "
+                                 "it cannot use a cluster placement group")
+            cfn_launch_template: _ec2.CfnLaunchTemplate = launch_template.node.default_child
+            cfn_launch_template.add_property_override(
+                "LaunchTemplateData.Placement.GroupName", placement_group.ref)
+
+        self._asg = _autoscaling.AutoScalingGroup(
+            self, cid, vpc=network.get_vpc(), launch_template=launch_template,
+            vpc_subnets=_ec2.SubnetSelection(subnet_group_name=component),
+            min_capacity=int(settings["min_capacity"]),
+            max_capacity=int(settings["max_capacity"]),
+            group_metrics=[_autoscaling.GroupMetrics.all()])
+        Tags.of(self._asg).add("SwiftComponent", component, apply_to_launched_instances=True)
+
+        self.scale_on_backlog(mq_broker, settings)
+
+    def scale_on_backlog(self, mq_broker: SwiftMQ, settings: dict) -> None:
+        """step scaling on the queue backlog per instance, and scaling out early
+        when the enqueue rate climbs before the backlog builds up"""
+        queue_name = settings["queue_name"]
+        backlog_per_instance = float(settings["backlog_per_instance"])
+        enqueue_rate = float(settings["enqueue_rate_per_minute"])
+
+        in_service = _cw.Metric(
+            namespace="AWS/AutoScaling", metric_name="GroupInServiceInstances",
+            statistic="Average", period=Duration.minutes(1),
+            dimensions_map={"AutoScalingGroupName": self._asg.auto_scaling_group_name})
+        backlog = _cw.MathExpression(
+            expression="queue / IF(instances > 0, instances, 1)",
+            using_metrics={"queue": mq_broker.metric_queue("QueueSize", queue_name),
+                           "instances": in_service},
+            label="BacklogPerInstance", period=Duration.minutes(1))
+
+        self._asg.scale_on_metric(
+            "BacklogScaling", metric=backlog,
+            adjustment_type=_autoscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            scaling_steps=[
+                _autoscaling.ScalingInterval(upper=backlog_per_instance * 0.5, change=-1),
+                _autoscaling.ScalingInterval(lower=backlog_per_instance, change=1),
+                _autoscaling.ScalingInterval(lower=backlog_per_instance * 2, change=2)],
+            evaluation_periods=3, datapoints_to_alarm=2,
+            cooldown=Duration.minutes(5))
+
+        # no negative step, so no lower alarm: scaling in is left to the backlog policy
+        _autoscaling.StepScalingPolicy(
+            self, "EnqueueRateScaling", auto_scaling_group=self._asg,
+            metric=mq_broker.metric_queue("EnqueueCount", queue_name, statistic="Sum"),
+            adjustment_type=_autoscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            scaling_steps=[
+                _autoscaling.ScalingInterval(upper=enqueue_rate, change=0),
+                _autoscaling.ScalingInterval(lower=enqueue_rate, change=1)],
+            evaluation_periods=2, cooldown=Duration.minutes(5))
+
+    def get_auto_scaling_group_name(self) -> str:
+        """getting the Auto Scaling group name"""
+        return self._asg.auto_scaling_group_name
+
+    def get_auto_scaling_group(self) -> _autoscaling.AutoScalingGroup:
+        """getting the Auto Scaling group reference"""
+        return self._asg
+
+    def get_ready_handle(self) -> CfnWaitConditionHandle:
+        """get the wait condition handle the instances signal when ready"""
+        return self._ready_handle
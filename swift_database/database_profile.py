@@ -0,0 +1,156 @@
+"""Performance profiles for the AMH Oracle database"""
+from typing import TYPE_CHECKING
+
+from aws_cdk import Duration
+from constructs import Construct
+
+from utilities.context_values import get_component_setting
+
+if TYPE_CHECKING:
+    from aws_cdk import aws_rds as _rds
+
+# Oracle parameters for OLTP messaging, AMH persists every message in small transactions.
+# Memory is split between SGA and PGA explicitly instead of automatic memory management,
+# so the buffer cache cannot be shrunk in favour of sort areas under load
+OLTP_PARAMETERS = {
+    "memory_target": "0",
+    "memory_max_target": "0",
+    "sga_target": "{DBInstanceClassMemory*3/5}",
+    "sga_max_size": "{DBInstanceClassMemory*3/5}",
+    "pga_aggregate_target": "{DBInstanceClassMemory*1/5}",
+    "open_cursors": "1000",
+    "session_cached_cursors": "200",
+    "db_writer_processes": "4",
+    # bounded crash recovery time with the larger redo logs below
+    "fast_start_mttr_target": "300",
+    "archive_lag_target": "900",
+}
+
+
+class DatabaseProfile:
+    """Instance class, storage, parameters and diagnostics of the database"""
+
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, name: str,
+                 instance_class: str = None,
+                 storage_type: str = None,
+                 allocated_storage: int = None,
+                 iops: int = None,
+                 storage_throughput: int = None,
+                 max_allocated_storage: int = None,
+                 parameters: dict = None,
+                 redo_log_size_mb: int = None,
+                 statspack: bool = False,
+                 performance_insights_retention: str = None,
+                 monitoring_interval_seconds: int = None) -> None:
+        self.name = name
+        self.instance_class = instance_class
+        self.storage_type = storage_type
+        self.allocated_storage = allocated_storage
+        self.iops = iops
+        self.storage_throughput = storage_throughput
+        self.max_allocated_storage = max_allocated_storage
+        self.parameters = parameters or {}
+        self.redo_log_size_mb = redo_log_size_mb
+        self.statspack = statspack
+        self.performance_insights_retention = performance_insights_retention
+        self.monitoring_interval_seconds = monitoring_interval_seconds
+
+        if storage_type in ("io1", "io2") and iops is None:
+            raise ValueError(f"Database profile {name}: {storage_type} storage needs "
+                             "provisioned iops")
+        if storage_throughput is not None and storage_type != "gp3":
+            raise ValueError(f"Database profile {name}: throughput can only be set on gp3")
+        if storage_type == "gp3" and (iops or storage_throughput) \
+                and (allocated_storage or 0) < 200:
+            raise ValueError(f"Database profile {name}: Oracle gp3 iops and throughput "
+                             "can only be set from 200 GiB")
+        if max_allocated_storage is not None and allocated_storage is not None \
+                and max_allocated_storage <= allocated_storage:
+            raise ValueError(f"Database profile {name}: max_allocated_storage must be above "
+                             "allocated_storage for storage autoscaling")
+        if monitoring_interval_seconds not in (None, 1, 5, 10, 15, 30, 60):
+            raise ValueError(f"Database profile {name}: monitoring interval must be "
+                             "1, 5, 10, 15, 30 or 60 seconds")
+
+    def get_instance_options(self, scope: Construct,
+                             engine: "_rds.IInstanceEngine") -> dict:
+        """DatabaseInstance properties of the profile, creating its parameter and option group.
+        Settings left unset keep the DatabaseInstance defaults"""
+        # pylint: disable=import-outside-toplevel
+        from aws_cdk import aws_ec2 as _ec2, aws_rds as _rds
+
+        options = {}
+        if self.instance_class is not None:
+            options["instance_type"] = _ec2.InstanceType(self.instance_class)
+        if self.storage_type is not None:
+            options["storage_type"] = _rds.StorageType[self.storage_type.upper()]
+        for key in ("allocated_storage", "iops", "storage_throughput", "max_allocated_storage"):
+            if getattr(self, key) is not None:
+                options[key] = getattr(self, key)
+        if self.parameters:
+            options["parameter_group"] = _rds.ParameterGroup(
+                scope, "OracleParameterGroup", engine=engine, parameters=self.parameters,
+                description=f"AMH Oracle {self.name} profile")
+        if self.statspack:
+            # statistics snapshots for latency analysis, without the Diagnostics Pack license
+            options["option_group"] = _rds.OptionGroup(
+                scope, "OracleOptionGroup", engine=engine,
+                configurations=[_rds.OptionConfiguration(name="STATSPACK")],
+                description=f"AMH Oracle {self.name} profile")
+        if self.performance_insights_retention is not None:
+            options["enable_performance_insights"] = True
+            options["performance_insight_retention"] = \
+                _rds.PerformanceInsightRetention[self.performance_insights_retention]
+        if self.monitoring_interval_seconds is not None:
+            options["monitoring_interval"] = Duration.seconds(self.monitoring_interval_seconds)
+        return options
+
+    def get_redo_log_statements(self) -> list:
+        """statements resizing the online redo logs, which RDS does not expose as a parameter:
+        run them as the master user once the instance is available"""
+        if self.redo_log_size_mb is None:
+            return []
+        return [f"EXEC rdsadmin.rdsadmin_util.add_logfile(p_size => '{self.redo_log_size_mb}M');"
+                for _ in range(4)] + [
+                    "EXEC rdsadmin.rdsadmin_util.switch_logfile;",
+                    "EXEC rdsadmin.rdsadmin_util.checkpoint;",
+                    "-- then drop the INACTIVE default groups with "
+                    "rdsadmin.rdsadmin_util.drop_logfile(<group#>)"]
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "DatabaseProfile":
+        """creating a profile from a context object"""
+        return cls(name, **spec)
+
+    @classmethod
+    def from_context(cls, scope: Construct, cid: str) -> "DatabaseProfile":
+        """selecting the profile of a database from the database_profiles context,
+        by database id first, then "default"."""
+        selected = get_component_setting(scope, "database_profiles", [cid], "legacy")
+        if isinstance(selected, dict):
+            return cls.from_spec(cid, selected)
+        if selected not in DATABASE_PROFILES:
+            raise ValueError(f"Unknown database profile {selected} for {cid}, "
+                             f"choose from {', '.join(DATABASE_PROFILES)}")
+        return DATABASE_PROFILES[selected]
+
+
+DATABASE_PROFILES = {
+    # nothing set, DatabaseInstance creates an m5.large on 100 GiB of gp2
+    "legacy": DatabaseProfile("legacy"),
+    # memory optimized instance on io2, for production message volumes
+    "oltp": DatabaseProfile("oltp", instance_class="r5.2xlarge", storage_type="io2",
+                            allocated_storage=500, iops=12000, max_allocated_storage=2000,
+                            parameters=OLTP_PARAMETERS, redo_log_size_mb=2048, statspack=True,
+                            performance_insights_retention="DEFAULT",
+                            monitoring_interval_seconds=1),
+    # gp3 with provisioned iops and throughput, cheaper for moderate volumes
+    "oltp_gp3": DatabaseProfile("oltp_gp3", instance_class="r5.xlarge", storage_type="gp3",
+                                allocated_storage=400, iops=12000, storage_throughput=500,
+                                max_allocated_storage=2000, parameters=OLTP_PARAMETERS,
+                                redo_log_size_mb=1024, statspack=True,
+                                performance_insights_retention="DEFAULT",
+                                monitoring_interval_seconds=1),
+}
@@ -1,7 +1,8 @@
 """Nested Stack for RDS Oracle database used for AMH"""
+from typing import TYPE_CHECKING, List
+
 from aws_cdk import (
     aws_kms as _kms,
-    aws_rds as _rds,
     aws_ec2 as _ec2
 )
 from constructs import Construct
@@ -9,6 +10,18 @@ from aws_cdk import NestedStack
 
 from security.generic_security import GenericSecurity
 from network.generic_network import GenericNetwork
+from swift_database.database_profile import DatabaseProfile
+from utilities.context_values import get_context_object
+
+if TYPE_CHECKING:
+    from aws_cdk import aws_rds as _rds
+
+DEFAULT_READ_REPLICA_SETTINGS = {
+    "count": 0,
+    # None follows the instance class of the database profile
+    "instance_class": None,
+    "multi_az": False,
+}
 
 
 class SwiftDatabase(NestedStack):
@@ -23,11 +36,20 @@ class SwiftDatabase(NestedStack):
 
         rds_sg = security.create_security_group("RDSSG")
         self._oracle_rds = None
+        self._read_replicas = []
+        self.profile = DatabaseProfile.from_context(self, cid)
         if not self.node.try_get_context("skip_oracle") == "true":
+            # aws_rds is only loaded when oracle is not skipped
+            # pylint: disable=import-outside-toplevel
+            from aws_cdk import aws_rds as _rds
             resource_name = "AMHRDSOracleInstance"
+            engine = _rds.DatabaseInstanceEngine.oracle_ee(
+                version=_rds.OracleEngineVersion.VER_12_2_0_1_2020_07_R1)
+            profile_options = self.profile.get_instance_options(self, engine)
+            if profile_options.get("enable_performance_insights"):
+                profile_options["performance_insight_encryption_key"] = workload_key
             self._oracle_rds = _rds.DatabaseInstance(
-                self, resource_name, engine=_rds.DatabaseInstanceEngine.oracle_ee(
-                    version=_rds.OracleEngineVersion.VER_12_2_0_1_2020_07_R1),
+                self, resource_name, engine=engine,
                 vpc=network.get_vpc(),
                 multi_az=True, storage_encryption_key=workload_key,
                 security_groups=[rds_sg],
@@ -35,8 +57,48 @@ class SwiftDatabase(NestedStack):
                                          'audit',
                                          'alert',
                                          'listener'],
-                vpc_subnets=_ec2.SubnetSelection(subnet_name="Database"))
+                vpc_subnets=_ec2.SubnetSelection(subnet_group_name="Database"),
+                **profile_options)
 
-    def get_db_instance(self) -> _rds.DatabaseInstance:
+            self.create_read_replicas(network, security, workload_key, profile_options)
+
+    def create_read_replicas(self, network: GenericNetwork, security: GenericSecurity,
+                             workload_key: _kms.Key, profile_options: dict) -> None:
+        """create the read replicas for AMH reporting, search and audit queries, with
+        the storage, parameters and diagnostics of the primary. Oracle read replicas
+        need the Active Data Guard license"""
+        settings = dict(DEFAULT_READ_REPLICA_SETTINGS,
+                        **get_context_object(self, "database_read_replicas", {}))
+        if int(settings["count"]) == 0:
+            return
+        # pylint: disable=import-outside-toplevel
+        from aws_cdk import aws_rds as _rds
+        replica_sg = security.create_security_group("RDSReplicaSG")
+        # the replica size follows the primary, its instance class is set separately
+        replica_options = {key: value for key, value in profile_options.items()
+                           if key not in ("instance_type", "allocated_storage")}
+        instance_class = settings["instance_class"] or self.profile.instance_class \
+            or "m5.large"
+        for i in range(1, int(settings["count"]) + 1):
+            self._read_replicas.append(_rds.DatabaseInstanceReadReplica(
+                self, "AMHRDSOracleReadReplica" + str(i),
+                source_database_instance=self._oracle_rds,
+                instance_type=_ec2.InstanceType(instance_class),
+                vpc=network.get_vpc(),
+                multi_az=settings["multi_az"] in (True, "true"),
+                storage_encryption_key=workload_key,
+                security_groups=[replica_sg],
+                cloudwatch_logs_exports=['trace',
+                                         'audit',
+                                         'alert',
+                                         'listener'],
+                vpc_subnets=_ec2.SubnetSelection(subnet_group_name="Database"),
+                **replica_options))
+
+    def get_db_instance(self) -> "_rds.DatabaseInstance":
         """get reference of the database instance"""
         return self._oracle_rds
+
+    def get_read_replicas(self) -> List["_rds.DatabaseInstanceReadReplica"]:
+        """get references of the read replicas"""
+        return self._read_replicas
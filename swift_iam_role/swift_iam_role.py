@@ -12,15 +12,30 @@ class SwiftIAMRole(NestedStack):
     """Nested Stack for the sample IAM Role creation for Managing SWIFT components"""
 
     # pylint: disable=too-many-arguments
-    def __init__(self, scope: Construct, cid: str, instance_ids: List[str], mq_broker_arn: str,
-                 database_instance: _rds.DatabaseInstance, **kwargs):
+    def __init__(self, scope: Construct, cid: str, instance_ids: List[str],
+                 mq_broker_arns: List[str],
+                 database_instance: _rds.DatabaseInstance,
+                 fleet_components: List[str] = None,
+                 read_replicas: List[_rds.DatabaseInstanceReadReplica] = None, **kwargs):
         super().__init__(scope, cid, **kwargs)
+        self._fleet_components = fleet_components or []
 
         self.create_swift_instance_operator_role(instance_ids)
 
         self.create_swift_infrastructure_role(
             database_instance=database_instance, instance_ids=instance_ids,
-            mq_broker_arn=mq_broker_arn)
+            mq_broker_arns=mq_broker_arns, read_replicas=read_replicas or [])
+
+    def fleet_instance_statements(self, actions: List[str]) -> List[_iam.PolicyStatement]:
+        """statements for instances of Auto Scaling groups, which have no ids at synth time
+        and are matched by their SwiftComponent tag"""
+        if not self._fleet_components:
+            return []
+        return [_iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW, actions=actions,
+            resources=["arn:aws:ec2:" + self.region + ":" + self.account + ":instance/*"],
+            conditions={"StringEquals": {
+                "aws:ResourceTag/SwiftComponent": self._fleet_components}})]
 
     def create_swift_instance_operator_role(self, instance_ids):
         """create swift instance operator role"""
@@ -57,6 +72,7 @@ class SwiftIAMRole(NestedStack):
                 actions=["ssm:TerminateSession"],
                 resources=[
                     "arn:aws:ssm:*:*:session/${aws:username}-*"])]
+        statements += self.fleet_instance_statements(["ssm:StartSession", "ssm:SendCommand"])
         _iam.Policy(
             self, "SSMInstanceAccessPolicy", policy_name="SSMInstanceAccessPolicy",
             roles=[swift_instance_operator_role], statements=statements,
@@ -64,7 +80,7 @@ class SwiftIAMRole(NestedStack):
 
     def create_swift_infrastructure_role(
             self, database_instance: _rds.DatabaseInstance, instance_ids: List[str],
-            mq_broker_arn: str):
+            mq_broker_arns: List[str], read_replicas: List[_rds.DatabaseInstanceReadReplica]):
         """create swift infrastructure role"""
         swift_infrastructure_role = \
             _iam.Role(self, "SWIFTInfrastructureRole",
@@ -92,10 +108,16 @@ class SwiftIAMRole(NestedStack):
                 resources=instances_resource),
             _iam.PolicyStatement(
                 effect=_iam.Effect.ALLOW, actions=["mq:List*", "mq:Describe*", "mq:RebootBroker"],
-                resources=[mq_broker_arn]),
+                resources=mq_broker_arns),
             _iam.PolicyStatement(
                 effect=_iam.Effect.ALLOW, actions=["logs:List*", "logs:Describe*", "logs:Get*"],
                 resources=["*"])]
+        statements += self.fleet_instance_statements(["ec2:Start*", "ec2:Stop*"])
+        if read_replicas:
+            # read replicas cannot be stopped, only rebooted
+            statements.append(_iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW, actions=["rds:RebootDBInstance"],
+                resources=[replica.instance_arn for replica in read_replicas]))
 
         _iam.Policy(
             self, "SwiftInfrastructurePolicy", policy_name="SwiftInfrastructurePolicy",
@@ -1,16 +1,21 @@
 """main swift stack"""
 from constructs import Construct
-from aws_cdk import App, Stack, CfnOutput 
+from aws_cdk import Stack, CfnOutput
 from aws_cdk import aws_ec2 as _ec2
 from cdk_ec2_key_pair import KeyPair
 
+from base_host_group.boot_readiness import create_ready_condition
+from base_host_group.log_collection import create_log_groups
+from base_host_group.placement import create_placement_group, get_placement_strategy
 from cmk.generic_cmk import GenericCMK
-from network.generic_network import GenericNetwork
-from network.swift_vpc_endpoints import SwiftVPCEndpoints
+from network.generic_network import GenericNetwork, get_connectivity_settings, \
+    get_network_settings, get_vpn_cidrs
+from network.swift_vpc_endpoints import SwiftVPCEndpoints, get_endpoint_settings, \
+    get_interface_services
 from security.swift_security import SWIFTSecurity
 from swift_amh.swift_amh import SwiftAMH
+from swift_amh.swift_amh_fleet import SwiftAMHFleet
 from swift_database.swift_database import SwiftDatabase
-from swift_iam_role.swift_iam_role import SwiftIAMRole
 from swift_mq.swift_mq import SwiftMQ
 from swift_sagsnl.swift_sagsnl import SwiftSAGSNL
 from utilities.swift_components import SwiftComponents
@@ -30,11 +35,23 @@ class SwiftMain(Stack):
         # Create networking constructs
         network_stack = GenericNetwork(
             self, "SwiftConnectivityVPC", cidr_range=self.node.try_get_context("vpc_cidr"))
-        network_stack.set_vgw(True)
-        network_stack.add_isolated_subnets(SwiftComponents.SAGSNL)
-        network_stack.add_isolated_subnets(SwiftComponents.AMH)
-        network_stack.add_isolated_subnets("Database")
-        network_stack.add_isolated_subnets("MQ")
+        connectivity_settings = get_connectivity_settings(self)
+        if connectivity_settings["mode"] == "transit_gateway":
+            network_stack.set_transit_gateway(dict(
+                connectivity_settings, destination_cidrs=get_vpn_cidrs(self)))
+        else:
+            network_stack.set_vgw(True)
+        network_settings = get_network_settings(self)
+        network_stack.set_max_azs(network_settings["max_azs"])
+        network_stack.set_reserved_azs(network_settings["reserved_azs"])
+        for reserved_range in network_settings["reserved_ranges"]:
+            network_stack.add_reserved_range(reserved_range)
+        subnet_groups = network_settings["subnet_groups"]
+        for group_name in [SwiftComponents.SAGSNL, SwiftComponents.AMH, "Database", "MQ"]:
+            network_stack.add_isolated_subnets(group_name, **subnet_groups.get(group_name, {}))
+        endpoint_settings = get_endpoint_settings(self)
+        if endpoint_settings["dedicated_subnets"]:
+            network_stack.add_endpoint_subnets(**subnet_groups.get("Endpoints", {}))
         network_stack.set_vgw_propagation_subnet(
             _ec2.SubnetSelection(subnet_group_name=SwiftComponents.SAGSNL))
         network_stack.generate()
@@ -53,69 +70,158 @@ class SwiftMain(Stack):
                     description="KeyPair for the systems operator, just in case."
                     )
 
+        # Create RDS Oracle for AMH to use
+        database_stack = SwiftDatabase(self, "Database", network_stack,
+                                       security_stack, workload_key)
+        # Create Amazon MQ broker for AMH as jms integration, created ahead of the hosts
+        # so an AMH fleet can scale on its queues
+        mq_broker = SwiftMQ(self, "MQMessageBroker", network_stack,
+                            security_stack, workload_key)
+
+        amh_deployment = self.node.try_get_context("amh_deployment") or "instances"
+        if amh_deployment not in ("instances", "fleet"):
+            raise ValueError(f"Unknown amh_deployment {amh_deployment}, "
+                             "choose from instances, fleet")
+
+        # Log groups with retention for the log files shipped by the CloudWatch agents
+        log_groups = {component: create_log_groups(self, component)
+                      for component in [SwiftComponents.SAGSNL, SwiftComponents.AMH]}
+
+        # Placement groups, cluster co-locates each AMH with the SAGSNL of its AZ,
+        # partition and spread keep the instances of a component on separate hardware
+        placement_strategy = get_placement_strategy(self)
+        placement_groups = {}
+        if placement_strategy == "cluster":
+            for i in range(1, 3):
+                pair_group = create_placement_group(self, "PlacementGroupPair" + str(i),
+                                                    placement_strategy)
+                placement_groups[SwiftComponents.SAGSNL + str(i)] = pair_group
+                placement_groups[SwiftComponents.AMH + str(i)] = pair_group
+        elif placement_strategy in ("partition", "spread"):
+            for component in [SwiftComponents.SAGSNL, SwiftComponents.AMH]:
+                component_group = create_placement_group(
+                    self, component + "PlacementGroup", placement_strategy)
+                for i in range(1, 3):
+                    placement_groups[component + str(i)] = component_group
+
         # Create SAGSNL instance , should deploy
         # the instance to the AZ that's according to the provided IP
         sagsnl_ami = self.node.try_get_context("sagsnl_ami")
         if not sagsnl_ami:
             sagsnl_ami = None
         sag_snls = []
+        host_stacks = []
         for i in range(1, 3):
+            sagsnl_ip = self.node.try_get_context("sagsnl" + str(i) + "_ip")
+            if sagsnl_ip:
+                network_stack.check_private_ip(SwiftComponents.SAGSNL, i - 1, sagsnl_ip)
             sag_snl = SwiftSAGSNL(
                 self, cid=SwiftComponents.SAGSNL + str(i),
                 network=network_stack, security=security_stack,
                 workload_key=workload_key, ops_key=ops_key_pair,
-                private_ip=self.node.try_get_context("sagsnl" + str(i) + "_ip"),
+                private_ip=sagsnl_ip,
                 ami_id=sagsnl_ami,
                 vpc_subnets=_ec2.SubnetSelection(
                     availability_zones=[self.availability_zones[i - 1]],
-                    subnet_group_name=SwiftComponents.SAGSNL)
+                    subnet_group_name=SwiftComponents.SAGSNL),
+                placement_group=placement_groups.get(SwiftComponents.SAGSNL + str(i)),
+                log_groups=log_groups[SwiftComponents.SAGSNL]
             )
             sag_snls.append(sag_snl.get_instance_id())
+            host_stacks.append(sag_snl)
 
         amh_ami = self.node.try_get_context("amh_ami")
         if not amh_ami:
             amh_ami = None
-        # Create AMH instance
+        # Create AMH as an Auto Scaling group spread over the AZs, the cluster
+        # placement groups of the SAGSNL pairs are single AZ and not used by the fleet
+        amh_fleet = None
+        amh_count = 2
+        if amh_deployment == "fleet":
+            amh_fleet = SwiftAMHFleet(
+                self, SwiftComponents.AMH + "Fleet",
+                network=network_stack, security=security_stack, mq_broker=mq_broker,
+                ops_key=ops_key_pair, ami_id=amh_ami,
+                placement_group=None if placement_strategy == "cluster"
+                else placement_groups.get(SwiftComponents.AMH + "1"),
+                log_groups=log_groups[SwiftComponents.AMH])
+            amh_count = 0
+        # Create AMH instance, a cluster placement group needs it in the AZ of its SAGSNL
         amhs = []
-        for i in range(1, 3):
+        for i in range(1, amh_count + 1):
+            amh_subnets = None
+            if placement_strategy == "cluster":
+                amh_subnets = _ec2.SubnetSelection(
+                    availability_zones=[self.availability_zones[i - 1]],
+                    subnet_group_name=SwiftComponents.AMH)
             amh = SwiftAMH(self, cid=SwiftComponents.AMH + str(i),
                            network=network_stack, security=security_stack,
                            ami_id=amh_ami,
                            workload_key=workload_key,
-                           ops_key=ops_key_pair
+                           ops_key=ops_key_pair,
+                           vpc_subnets=amh_subnets,
+                           placement_group=placement_groups.get(SwiftComponents.AMH + str(i)),
+                           log_groups=log_groups[SwiftComponents.AMH]
                            )
             amhs.append(amh.get_instance_id())
-
-        # Create RDS Oracle for AMH to use
-        database_stack = SwiftDatabase(self, "Database", network_stack,
-                                       security_stack, workload_key)
-        # Create Amazon MQ broker for AMH as jms integration
-        mq_broker = SwiftMQ(self, "MQMessageBroker", network_stack,
-                            security_stack, workload_key)
+            host_stacks.append(amh)
 
         # enforce Security group and rule and nacls after the components are created
         security_stack.enforce_security_groups_rules()
         security_stack.create_nacls()
 
-        # Create VPC endpoints and VPC Endpoints policy
-        SwiftVPCEndpoints(self, "VPCEndPointStack",
-                          application_names=[SwiftComponents.AMH, SwiftComponents.SAGSNL],
-                          instance_roles_map=security_stack.get_instance_roles(),
-                          endpoint_sg=security_stack.get_security_group("VPCEndpointSG"),
-                          vpc=network_stack.get_vpc(),
-                          instance_ids={SwiftComponents.AMH: amhs,
-                                        SwiftComponents.SAGSNL: sag_snls}
-                          )
+        # Create VPC endpoints and VPC Endpoints policy. With parallel_deploy the policies
+        # match the instance roles instead of the instance ids, so the endpoints do not wait
+        # for the instances and deploy alongside them. The hosts are ready sooner, the MQ
+        # broker still bounds a first deployment (see utilities/deploy_graph.py)
+        parallel_deploy = self.node.try_get_context("parallel_deploy") == "true"
+        endpoint_stack = SwiftVPCEndpoints(
+            self, "VPCEndPointStack",
+            application_names=[SwiftComponents.AMH, SwiftComponents.SAGSNL],
+            instance_roles_map=security_stack.get_instance_roles(),
+            endpoint_sg=security_stack.get_security_group("VPCEndpointSG"),
+            vpc=network_stack.get_vpc(),
+            instance_ids={SwiftComponents.AMH: None if amh_fleet or parallel_deploy else amhs,
+                          SwiftComponents.SAGSNL: None if parallel_deploy else sag_snls},
+            policy_mode=self.node.try_get_context("endpoint_policy_mode") or "instances",
+            subnets=network_stack.get_endpoint_subnets(),
+            services=get_interface_services(endpoint_settings)
+        )
+        # the hosts are complete once they signal ready, through the endpoints above
+        for host_stack in host_stacks:
+            create_ready_condition(self, host_stack.node.id, host_stack.get_ready_handle(), 1,
+                                   [endpoint_stack])
+        if amh_fleet is not None:
+            create_ready_condition(self, amh_fleet.node.id, amh_fleet.get_ready_handle(),
+                                   amh_fleet.ready_count, [endpoint_stack])
         for count, value in enumerate(sag_snls):
             CfnOutput(self, "SAGSNL" + str(count + 1) + "InstanceID", value=value)
         for count, value in enumerate(amhs):
             CfnOutput(self, "AMH" + str(count + 1) + "InstanceID", value=value)
+        if amh_fleet is not None:
+            CfnOutput(self, "AMHAutoScalingGroupName",
+                      value=amh_fleet.get_auto_scaling_group_name())
         CfnOutput(self, "VPCID", value=network_stack.get_vpc().vpc_id)
+        if network_stack.get_transit_gateway() is not None:
+            CfnOutput(self, "TransitGatewayId", value=network_stack.get_transit_gateway().ref)
+        for count, replica in enumerate(database_stack.get_read_replicas()):
+            CfnOutput(self, "DatabaseReadReplica" + str(count + 1) + "Endpoint",
+                      value=replica.instance_endpoint.socket_address,
+                      description="Read only endpoint for AMH reporting and audit queries")
+        redo_log_statements = database_stack.profile.get_redo_log_statements()
+        if redo_log_statements and database_stack.get_db_instance() is not None:
+            CfnOutput(self, "DatabaseRedoLogStatements", value=" ".join(redo_log_statements),
+                      description="Run as the master user to resize the online redo logs")
 
         # Create sample role for accessing the components created
         if self.node.try_get_context("create_sample_iam_role") == "true":
+            # only loaded when enabled, see utilities/import_report.py
+            # pylint: disable=import-outside-toplevel
+            from swift_iam_role.swift_iam_role import SwiftIAMRole
             SwiftIAMRole(self, "IAMRole",
                          instance_ids=sag_snls + amhs,
                          database_instance=database_stack.get_db_instance(),
-                         mq_broker_arn=mq_broker.get_arn()
+                         read_replicas=database_stack.get_read_replicas(),
+                         mq_broker_arns=mq_broker.get_arns(),
+                         fleet_components=[SwiftComponents.AMH] if amh_fleet else None
                          )
@@ -0,0 +1,233 @@
+"""ActiveMQ broker XML for Amazon MQ configurations, generated from tuning profiles and
+validated locally against the elements and attributes Amazon MQ accepts"""
+from typing import List, Tuple
+from xml.etree import ElementTree
+
+from constructs import Construct
+
+from utilities.context_values import get_context_object
+
+BROKER_XML_NAMESPACE = "http://activemq.apache.org/schema/core"
+
+# elements Amazon MQ accepts in the broker XML used here, with their attributes and children
+ALLOWED_ELEMENTS = {
+    "broker": ({"schedulePeriodForDestinationPurge", "schedulerSupport", "advisorySupport",
+                "persistent", "populateJMSXUserID", "useVirtualDestSubs",
+                "offlineDurableSubscriberTimeout", "offlineDurableSubscriberTaskSchedule",
+                "networkConnectorStartAsync"},
+               {"destinationPolicy", "persistenceAdapter", "networkConnectors", "systemUsage"}),
+    "destinationPolicy": (set(), {"policyMap"}),
+    "policyMap": (set(), {"policyEntries"}),
+    "policyEntries": (set(), {"policyEntry"}),
+    "policyEntry": ({"queue", "topic", "producerFlowControl", "memoryLimit", "queuePrefetch",
+                     "topicPrefetch", "durableTopicPrefetch", "optimizedDispatch", "useCache",
+                     "maxPageSize", "lazyDispatch", "prioritizedMessages",
+                     "cursorMemoryHighWaterMark", "storeUsageHighWaterMark",
+                     "advisoryForSlowConsumers"}, set()),
+    "persistenceAdapter": (set(), {"kahaDB"}),
+    "kahaDB": ({"checkpointInterval", "cleanupInterval", "concurrentStoreAndDispatchQueues",
+                "journalDiskSyncInterval", "journalDiskSyncStrategy", "preallocationStrategy",
+                "indexCacheSize", "indexWriteBatchSize", "compactAcksAfterNoGC",
+                "compactAcksIgnoresStoreGrowth"}, set()),
+    "networkConnectors": (set(), {"networkConnector"}),
+    "networkConnector": ({"name", "uri", "userName", "duplex", "conduitSubscriptions",
+                          "networkTTL", "messageTTL", "consumerTTL", "prefetchSize",
+                          "decreaseNetworkConsumerPriority",
+                          "suppressDuplicateQueueSubscriptions", "dynamicOnly"}, set()),
+    # <systemUsage><systemUsage sendFailIfNoSpace=.../></systemUsage>
+    "systemUsage": ({"sendFailIfNoSpace", "sendFailIfNoSpaceAfterTimeout"}, {"systemUsage"}),
+}
+BOOLEAN_ATTRIBUTES = {"schedulerSupport", "advisorySupport", "persistent", "populateJMSXUserID",
+                      "useVirtualDestSubs", "networkConnectorStartAsync", "producerFlowControl",
+                      "optimizedDispatch", "useCache", "lazyDispatch", "prioritizedMessages",
+                      "advisoryForSlowConsumers", "concurrentStoreAndDispatchQueues",
+                      "compactAcksIgnoresStoreGrowth", "duplex", "conduitSubscriptions",
+                      "decreaseNetworkConsumerPriority", "suppressDuplicateQueueSubscriptions",
+                      "dynamicOnly", "sendFailIfNoSpace"}
+INTEGER_ATTRIBUTES = {"schedulePeriodForDestinationPurge", "offlineDurableSubscriberTimeout",
+                      "offlineDurableSubscriberTaskSchedule", "queuePrefetch", "topicPrefetch",
+                      "durableTopicPrefetch", "maxPageSize", "cursorMemoryHighWaterMark",
+                      "storeUsageHighWaterMark", "checkpointInterval", "cleanupInterval",
+                      "journalDiskSyncInterval", "indexCacheSize", "indexWriteBatchSize",
+                      "compactAcksAfterNoGC", "networkTTL", "messageTTL", "consumerTTL",
+                      "prefetchSize", "sendFailIfNoSpaceAfterTimeout"}
+ENUM_ATTRIBUTES = {
+    "journalDiskSyncStrategy": {"always", "periodic", "never"},
+    "preallocationStrategy": {"sparse_file", "os_kernel_copy", "zeros", "chunked_zeros"},
+}
+
+
+class BrokerTuning:
+    """Destination policy, KahaDB and system usage settings of a broker configuration"""
+
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, name: str,
+                 producer_flow_control: bool = True,
+                 queue_prefetch: int = None,
+                 topic_prefetch: int = None,
+                 queue_memory_limit_mb: int = None,
+                 topic_memory_limit_mb: int = None,
+                 concurrent_store_and_dispatch: bool = None,
+                 journal_disk_sync_strategy: str = None,
+                 journal_disk_sync_interval: int = None,
+                 preallocation_strategy: str = None,
+                 index_cache_size: int = None,
+                 send_fail_if_no_space_after_timeout: int = None) -> None:
+        self.name = name
+        self.producer_flow_control = producer_flow_control
+        self.queue_prefetch = queue_prefetch
+        self.topic_prefetch = topic_prefetch
+        self.queue_memory_limit_mb = queue_memory_limit_mb
+        self.topic_memory_limit_mb = topic_memory_limit_mb
+        self.concurrent_store_and_dispatch = concurrent_store_and_dispatch
+        self.journal_disk_sync_strategy = journal_disk_sync_strategy
+        self.journal_disk_sync_interval = journal_disk_sync_interval
+        self.preallocation_strategy = preallocation_strategy
+        self.index_cache_size = index_cache_size
+        self.send_fail_if_no_space_after_timeout = send_fail_if_no_space_after_timeout
+
+    def _policy_entry(self, destination: str, prefetch: int, memory_limit_mb: int) -> dict:
+        attributes = {destination: ">",
+                      "producerFlowControl": _xml_value(self.producer_flow_control)}
+        if prefetch is not None:
+            attributes[destination + "Prefetch"] = str(prefetch)
+        if memory_limit_mb is not None:
+            attributes["memoryLimit"] = f"{memory_limit_mb} mb"
+        return attributes
+
+    def _kahadb(self) -> dict:
+        settings = {"concurrentStoreAndDispatchQueues": self.concurrent_store_and_dispatch,
+                    "journalDiskSyncStrategy": self.journal_disk_sync_strategy,
+                    "journalDiskSyncInterval": self.journal_disk_sync_interval,
+                    "preallocationStrategy": self.preallocation_strategy,
+                    "indexCacheSize": self.index_cache_size}
+        return {key: _xml_value(value) for key, value in settings.items() if value is not None}
+
+    def to_xml(self, network_connectors: List[Tuple[str, str]] = None,
+               user_name: str = None) -> str:
+        """broker XML with the tuning and a duplex network connector per (name, uri),
+        the children of <broker> in the alphabetical order the ActiveMQ schema requires"""
+        ElementTree.register_namespace("", BROKER_XML_NAMESPACE)
+        broker = _element(None, "broker", {"schedulePeriodForDestinationPurge": "10000"})
+
+        entries = _element(_element(_element(broker, "destinationPolicy"), "policyMap"),
+                           "policyEntries")
+        _element(entries, "policyEntry",
+                 self._policy_entry("queue", self.queue_prefetch, self.queue_memory_limit_mb))
+        _element(entries, "policyEntry",
+                 self._policy_entry("topic", self.topic_prefetch, self.topic_memory_limit_mb))
+
+        if network_connectors:
+            connectors = _element(broker, "networkConnectors")
+            for name, uri in network_connectors:
+                _element(connectors, "networkConnector", {
+                    "name": name, "uri": uri, "userName": user_name, "duplex": "true",
+                    "conduitSubscriptions": "false", "networkTTL": "2"})
+
+        kahadb = self._kahadb()
+        if kahadb:
+            _element(_element(broker, "persistenceAdapter"), "kahaDB", kahadb)
+
+        if self.send_fail_if_no_space_after_timeout is not None:
+            _element(_element(broker, "systemUsage"), "systemUsage", {
+                "sendFailIfNoSpaceAfterTimeout": str(self.send_fail_if_no_space_after_timeout)})
+
+        return "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>\n" + \
+            ElementTree.tostring(broker, encoding="unicode")
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "BrokerTuning":
+        """creating a tuning from a context object"""
+        return cls(name, **spec)
+
+    @classmethod
+    def from_context(cls, scope: Construct) -> "BrokerTuning":
+        """selecting the tuning from the configuration of the mq_broker context,
+        None keeps the default Amazon MQ configuration"""
+        selected = get_context_object(scope, "mq_broker", {}).get("configuration", "default")
+        if isinstance(selected, dict):
+            return cls.from_spec("custom", selected)
+        if selected not in BROKER_TUNINGS:
+            raise ValueError(f"Unknown broker configuration {selected}, "
+                             f"choose from {', '.join(BROKER_TUNINGS)}")
+        return BROKER_TUNINGS[selected]
+
+
+def _xml_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _element(parent, tag: str, attributes: dict = None) -> ElementTree.Element:
+    tag = "{" + BROKER_XML_NAMESPACE + "}" + tag
+    if parent is None:
+        return ElementTree.Element(tag, attributes or {})
+    return ElementTree.SubElement(parent, tag, attributes or {})
+
+
+def validate_broker_xml(xml: str) -> None:
+    """raising ValueError for XML Amazon MQ would reject when the configuration is created"""
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError as error:
+        raise ValueError(f"Broker configuration is not well-formed: {error}") from error
+    if root.tag != "{" + BROKER_XML_NAMESPACE + "}broker":
+        raise ValueError(f"Broker configuration root must be <broker xmlns=\""
+                         f"{BROKER_XML_NAMESPACE}\">, found {root.tag}")
+
+    errors = []
+    _validate_element(root, errors)
+    if errors:
+        raise ValueError("Invalid broker configuration:\n  " + "\n  ".join(errors))
+
+
+def _validate_element(element: ElementTree.Element, errors: List[str]) -> None:
+    tag = element.tag.split("}")[-1]
+    if not element.tag.startswith("{" + BROKER_XML_NAMESPACE + "}") \
+            or tag not in ALLOWED_ELEMENTS:
+        errors.append(f"<{tag}> is not supported by Amazon MQ")
+        return
+    attributes, children = ALLOWED_ELEMENTS[tag]
+    for name, value in element.attrib.items():
+        if name not in attributes:
+            errors.append(f"<{tag} {name}> is not supported by Amazon MQ")
+        elif name in BOOLEAN_ATTRIBUTES and value not in ("true", "false"):
+            errors.append(f"<{tag} {name}=\"{value}\"> must be true or false")
+        elif name in INTEGER_ATTRIBUTES and not value.isdigit():
+            errors.append(f"<{tag} {name}=\"{value}\"> must be a positive integer")
+        elif name in ENUM_ATTRIBUTES and value not in ENUM_ATTRIBUTES[name]:
+            errors.append(f"<{tag} {name}=\"{value}\"> must be one of "
+                          f"{', '.join(sorted(ENUM_ATTRIBUTES[name]))}")
+    child_tags = [child.tag.split("}")[-1] for child in element]
+    if tag == "broker" and child_tags != sorted(child_tags):
+        errors.append("children of <broker> must be in alphabetical order: "
+                      + ", ".join(child_tags))
+    for child in element:
+        if child.tag.split("}")[-1] not in children:
+            errors.append(f"<{child.tag.split('}')[-1]}> is not allowed in <{tag}>")
+        else:
+            _validate_element(child, errors)
+
+
+BROKER_TUNINGS = {
+    # no configuration, Amazon MQ applies the default one of the engine version
+    "default": None,
+    # sustained AMH traffic: no producer flow control stalls, larger destination memory,
+    # KahaDB storing and dispatching concurrently. Every message is still synced to disk,
+    # a periodic journal sync would trade SWIFT message durability for throughput
+    "throughput": BrokerTuning("throughput", producer_flow_control=False,
+                               queue_prefetch=500, topic_prefetch=1000,
+                               queue_memory_limit_mb=256, topic_memory_limit_mb=64,
+                               concurrent_store_and_dispatch=True,
+                               journal_disk_sync_strategy="always",
+                               preallocation_strategy="zeros",
+                               index_cache_size=100000,
+                               send_fail_if_no_space_after_timeout=30000),
+    # many slow AMH consumers: small prefetch so messages are not parked on one consumer
+    "fair_dispatch": BrokerTuning("fair_dispatch", producer_flow_control=True,
+                                  queue_prefetch=10, topic_prefetch=100,
+                                  queue_memory_limit_mb=128,
+                                  concurrent_store_and_dispatch=True),
+}
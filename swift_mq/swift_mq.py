@@ -1,13 +1,28 @@
 """Nested Stack for creating Amazon MQ"""
+from typing import List
+
 from aws_cdk import (
     aws_kms as _kms,
     aws_amazonmq as _mq,
+    aws_cloudwatch as _cw,
+    aws_ec2 as _ec2,
     aws_secretsmanager as _secrets
 )
 from constructs import Construct
-from aws_cdk import NestedStack
+from aws_cdk import NestedStack, Duration, Fn
 from security.generic_security import GenericSecurity
 from network.generic_network import GenericNetwork
+from swift_mq.broker_config import BrokerTuning, validate_broker_xml
+from utilities.context_values import get_context_object
+
+MQ_ADMIN_USERNAME = "admin"
+DEFAULT_BROKER_SETTINGS = {
+    "instance_type": "mq.m5.large",
+    "engine_version": "5.15.13",
+    "deployment_mode": "ACTIVE_STANDBY_MULTI_AZ",
+    # number of brokers in a network of brokers, 1 is a single broker
+    "mesh_size": 1,
+}
 
 
 class SwiftMQ(NestedStack):
@@ -21,35 +36,111 @@ class SwiftMQ(NestedStack):
         super().__init__(scope, cid, **kwargs)
 
         mq_sg = security.create_security_group("MQSG")
+        settings = dict(DEFAULT_BROKER_SETTINGS, **get_context_object(self, "mq_broker", {}))
+        self._deployment_mode = settings["deployment_mode"]
+        mesh_size = int(settings["mesh_size"])
+        if mesh_size < 1:
+            raise ValueError(f"mq_broker mesh_size must be at least 1, got {mesh_size}")
 
         secret_name = cid + "Secret"
         sec = _secrets.Secret(self, secret_name, encryption_key=workload_key,
                               generate_secret_string=_secrets.SecretStringGenerator(
                                   exclude_characters="%+~`#$&*()|[]{}=:, ;<>?!'/@",
                                   password_length=20,
-                                  secret_string_template="{\"username\":\"admin\"}",
+                                  secret_string_template="{\"username\":\"" +
+                                                         MQ_ADMIN_USERNAME + "\"}",
                                   generate_string_key="password"))
         sec_cfn = sec.node.default_child
         sec_cfn.override_logical_id(secret_name)
 
-        self._mq = _mq.CfnBroker(
-            self, cid, auto_minor_version_upgrade=False, broker_name=cid,
-            deployment_mode="ACTIVE_STANDBY_MULTI_AZ",
-            logs=_mq.CfnBroker.LogListProperty(audit=True, general=True),
-            encryption_options=
-            _mq.CfnBroker.EncryptionOptionsProperty(use_aws_owned_key=False,
-                                                    kms_key_id=workload_key.key_id),
-            engine_type="ACTIVEMQ",
-            engine_version="5.15.13",
-            host_instance_type="mq.m5.large",
-            publicly_accessible=False,
-            subnet_ids=network.get_isolated_subnets("MQ").subnet_ids,
-            security_groups=[mq_sg.security_group_id],
-            users=[
-                _mq.CfnBroker.UserProperty(
-                    username=sec.secret_value_from_json("username").to_string(),
-                    password=sec.secret_value_from_json("password").to_string())])
+        tuning = BrokerTuning.from_context(self)
+        if tuning is None and mesh_size > 1:
+            tuning = BrokerTuning("default")
+        if mesh_size > 1:
+            # network connectors between the brokers of the mesh
+            mq_sg.connections.allow_internally(
+                _ec2.Port.tcp(61617), description="MQ network of brokers (61617)")
+
+        # a broker of the mesh connects to the brokers created before it, the connectors are
+        # duplex so every pair is connected both ways without a circular dependency
+        self._brokers = []
+        for index in range(mesh_size):
+            broker_id = cid if index == 0 else cid + str(index + 1)
+            configuration = None
+            if tuning is not None:
+                configuration = self.create_configuration(broker_id, tuning, settings)
+            self._brokers.append(_mq.CfnBroker(
+                self, broker_id, auto_minor_version_upgrade=False, broker_name=broker_id,
+                deployment_mode=self._deployment_mode,
+                logs=_mq.CfnBroker.LogListProperty(audit=True, general=True),
+                encryption_options=
+                _mq.CfnBroker.EncryptionOptionsProperty(use_aws_owned_key=False,
+                                                        kms_key_id=workload_key.key_id),
+                engine_type="ACTIVEMQ",
+                engine_version=settings["engine_version"],
+                host_instance_type=settings["instance_type"],
+                publicly_accessible=False,
+                subnet_ids=self.get_broker_subnet_ids(network),
+                security_groups=[mq_sg.security_group_id],
+                configuration=configuration,
+                users=[
+                    _mq.CfnBroker.UserProperty(
+                        username=sec.secret_value_from_json("username").to_string(),
+                        password=sec.secret_value_from_json("password").to_string())]))
+        self._mq = self._brokers[0]
+
+    def get_broker_subnet_ids(self, network: GenericNetwork) -> List[str]:
+        """an active/standby broker spans two subnets in two AZs, a single instance broker
+        uses one, whatever the max_azs of the network"""
+        subnet_ids = network.get_isolated_subnets("MQ").subnet_ids
+        if self._deployment_mode == "SINGLE_INSTANCE":
+            return subnet_ids[:1]
+        return subnet_ids[:2]
+
+    def create_configuration(self, broker_id: str, tuning: BrokerTuning,
+                             settings: dict) -> _mq.CfnBroker.ConfigurationIdProperty:
+        """create the broker configuration, validated before anything is deployed"""
+        connectors = []
+        for broker in self._brokers:
+            transport = "static" if self._deployment_mode == "SINGLE_INSTANCE" \
+                else "masterslave"
+            connectors.append(
+                ("To" + broker.broker_name,
+                 transport + ":(" + Fn.join(",", broker.attr_open_wire_endpoints) + ")"))
+        xml = tuning.to_xml(connectors, MQ_ADMIN_USERNAME)
+        validate_broker_xml(xml)
+
+        configuration = _mq.CfnConfiguration(
+            self, broker_id + "Configuration", name=broker_id + "-" + tuning.name,
+            engine_type="ACTIVEMQ", engine_version=settings["engine_version"],
+            data=Fn.base64(xml),
+            description=f"{tuning.name} broker configuration of {broker_id}")
+        return _mq.CfnBroker.ConfigurationIdProperty(id=configuration.attr_id,
+                                                      revision=configuration.attr_revision)
 
     def get_arn(self) -> str:
         """getting mq instance reference"""
         return self._mq.attr_arn
+
+    def get_arns(self) -> List[str]:
+        """getting the arn of every broker of the mesh"""
+        return [broker.attr_arn for broker in self._brokers]
+
+    def get_broker_instance_names(self) -> List[str]:
+        """getting the names the broker instances publish CloudWatch metrics under"""
+        suffixes = ["-1"] if self._deployment_mode == "SINGLE_INSTANCE" else ["-1", "-2"]
+        return [broker.broker_name + suffix for broker in self._brokers for suffix in suffixes]
+
+    def metric_queue(self, metric_name: str, queue_name: str,
+                     statistic: str = "Maximum") -> _cw.IMetric:
+        """getting a queue metric (QueueSize, EnqueueCount...) summed over the brokers of
+        the mesh, the standby instance of an active/standby broker reports no traffic"""
+        using_metrics = {}
+        for index, instance_name in enumerate(self.get_broker_instance_names()):
+            using_metrics["broker" + str(index)] = _cw.Metric(
+                namespace="AWS/AmazonMQ", metric_name=metric_name, statistic=statistic,
+                dimensions_map={"Broker": instance_name, "Queue": queue_name},
+                period=Duration.minutes(1))
+        return _cw.MathExpression(expression="SUM([" + ",".join(using_metrics) + "])",
+                                  using_metrics=using_metrics, label=metric_name,
+                                  period=Duration.minutes(1))
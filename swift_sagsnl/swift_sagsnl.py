@@ -6,6 +6,7 @@ from aws_cdk import (
 from cdk_ec2_key_pair import KeyPair
 from constructs import Construct
 from base_host_group.host_group import HostGroup
+from base_host_group.performance_tier import PerformanceTier
 from network.generic_network import GenericNetwork
 from security.generic_security import GenericSecurity
 from utilities.swift_components import SwiftComponents
@@ -23,6 +24,8 @@ class SwiftSAGSNL(HostGroup):
                  vpc_subnets: _ec2.SubnetSelection,
                  ami_id: str = None,
                  private_ip: str = None,
+                 performance_tier: PerformanceTier = None,
+                 placement_group: _ec2.CfnPlacementGroup = None,
                  **kwargs) -> None:
         super().__init__(scope, cid=cid,
                          component=SwiftComponents.SAGSNL,
@@ -33,5 +36,7 @@ class SwiftSAGSNL(HostGroup):
                          vpc_subnets=vpc_subnets,
                          ami_id=ami_id,
                          private_ip=private_ip,
+                         performance_tier=performance_tier,
+                         placement_group=placement_group,
                          **kwargs
                          )
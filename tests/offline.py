@@ -0,0 +1,138 @@
+"""Offline test mode: the tests run against moto, seeded from the synthesized templates.
+
+Set SWIFT_TEST_OFFLINE=true to run tests/ without a deployed stack or AWS access:
+
+    SWIFT_TEST_OFFLINE=true python -m pytest tests
+
+SwiftMain is synthesized with stubbed lookups (see utilities.stubbed_app), then the
+resources the tests look at (VPC, gateways, secrets, instances) are created in moto and
+their ids stand in for the stack outputs. Checks needing running instances (agent metrics,
+Session Manager) are skipped offline. Needs moto 5 or later (pip install moto).
+
+tests/test_templates.py checks the templates themselves and runs without moto.
+"""
+import os
+from functools import lru_cache
+from typing import Dict
+
+import boto3
+from aws_cdk import App, Environment, NestedStack
+from aws_cdk.assertions import Template
+
+from golden_ami.golden_ami_pipeline import SwiftGoldenAMI
+from utilities.stubbed_app import STUB_ACCOUNT, build_stubbed_app, stub_context
+
+# secret of the operator key pair, created by the cdk_ec2_key_pair custom resource
+KEY_PAIR_RESOURCE = "Custom::EC2-Key-Pair"
+DEFAULT_VPC_CIDR = "10.10.0.0/16"
+
+
+# context the template tests synthesize SwiftMain with on top of cdk.json, by variant.
+# Every variant is a synthesis of the whole app, so the features under test are combined
+# into as few variants as their assertions allow
+CONTEXT_VARIANTS = {
+    "default": {},
+    # Oracle on the oltp_gp3 profile with a read replica, data volumes on the hosts and
+    # the endpoints in their own subnets, resolved in the AZ of the hosts
+    "components": {
+        "skip_oracle": "false",
+        "database_profiles": {"Database": "oltp_gp3"},
+        "database_read_replicas": {"count": 1},
+        "storage_layouts": {"SAGSNL": "sagsnl", "AMH": "amh"},
+        "vpc_endpoints": {"dedicated_subnets": True, "az_local_dns": True,
+                          "extra_services": []},
+    },
+    # the transit gateway with two BGP VPN connections over three AZs, and hosts on the
+    # network tier launched from launch templates with ENA Express
+    "network": {
+        "network": {"max_azs": 3},
+        "connectivity": {
+            "mode": "transit_gateway",
+            "vpn_connections": [{"ip_address": "203.0.113.10", "bgp_asn": 65010},
+                                {"ip_address": "203.0.113.20", "bgp_asn": 65010}]},
+        "performance_tiers": {"SAGSNL": "network", "AMH": "network"},
+        "network_tunings": {"SAGSNL": "ena_express", "AMH": "ena_express"},
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def get_templates(region: str, variant: str = "default") -> Dict[str, Template]:
+    """templates of SwiftMain and of its nested stacks with the context of a variant of
+    CONTEXT_VARIANTS, by construct id"""
+    return synth_templates(region, CONTEXT_VARIANTS[variant])
+
+
+def synth_templates(region: str, context: dict = None) -> Dict[str, Template]:
+    """templates of SwiftMain and of its nested stacks, by construct id, with the
+    context values overriding those of cdk.json"""
+    _, main_stack = build_stubbed_app(context=context, region=region)
+    templates = {"SwiftMain": Template.from_stack(main_stack)}
+    for construct in main_stack.node.find_all():
+        if isinstance(construct, NestedStack):
+            templates[construct.node.id] = Template.from_stack(construct)
+    return templates
+
+
+def synth_golden_ami_template(region: str, context: dict = None) -> Template:
+    """template of the golden AMI pipeline stack, with the context values overriding
+    those of cdk.json"""
+    app = App(context=stub_context(STUB_ACCOUNT, region, context))
+    return Template.from_stack(SwiftGoldenAMI(
+        app, "SWIFTGoldenAMI-" + region, env=Environment(account=STUB_ACCOUNT, region=region)))
+
+
+def find_resources(templates: Dict[str, Template], resource_type: str) -> Dict[str, dict]:
+    """resources of a type across the templates, by nested stack id and logical id"""
+    resources = {}
+    for stack_id, template in templates.items():
+        for logical_id, resource in template.to_json().get("Resources", {}).items():
+            if resource["Type"] == resource_type:
+                resources[stack_id + "/" + logical_id] = resource
+    return resources
+
+
+@lru_cache(maxsize=None)
+def start_offline_aws(region: str) -> Dict[str, str]:
+    """start moto for every service and seed it from the templates,
+    returns the stack outputs of the seeded resources"""
+    # pylint: disable=import-outside-toplevel
+    from moto import mock_aws
+
+    for key in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ.setdefault(key, "testing")
+    mock_aws().start()
+    return seed_resources(get_templates(region), region)
+
+
+def seed_resources(templates: Dict[str, Template], region: str) -> Dict[str, str]:
+    """create the VPC, its gateways, the secrets and the instances of the templates"""
+    ec2_client = boto3.client("ec2", region_name=region)
+    secrets_client = boto3.client("secretsmanager", region_name=region)
+    outputs = {}
+
+    for vpc in find_resources(templates, "AWS::EC2::VPC").values():
+        cidr = vpc["Properties"].get("CidrBlock")
+        vpc_id = ec2_client.create_vpc(
+            CidrBlock=cidr if isinstance(cidr, str) else DEFAULT_VPC_CIDR)["Vpc"]["VpcId"]
+        outputs["VPCID"] = vpc_id
+        for _ in find_resources(templates, "AWS::EC2::VPNGateway"):
+            vgw_id = ec2_client.create_vpn_gateway(Type="ipsec.1")["VpnGateway"]["VpnGatewayId"]
+            ec2_client.attach_vpn_gateway(VpcId=vpc_id, VpnGatewayId=vgw_id)
+        for _ in find_resources(templates, "AWS::EC2::InternetGateway"):
+            igw_id = ec2_client.create_internet_gateway()["InternetGateway"]["InternetGatewayId"]
+            ec2_client.attach_internet_gateway(VpcId=vpc_id, InternetGatewayId=igw_id)
+
+    secret_names = [name.replace("/", "-") for name in
+                    find_resources(templates, "AWS::SecretsManager::Secret")]
+    secret_names += ["ec2-ssh-key/" + name.replace("/", "-") + "/private"
+                     for name in find_resources(templates, KEY_PAIR_RESOURCE)]
+    for name in secret_names:
+        secrets_client.create_secret(Name=name, SecretString="offline")
+
+    image_id = ec2_client.describe_images()["Images"][0]["ImageId"]
+    for name in find_resources(templates, "AWS::EC2::Instance"):
+        instance = ec2_client.run_instances(ImageId=image_id, MinCount=1, MaxCount=1,
+                                            InstanceType="m5.large")["Instances"][0]
+        outputs[name.split("/")[0] + "InstanceID"] = instance["InstanceId"]
+    return outputs
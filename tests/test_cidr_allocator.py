@@ -0,0 +1,104 @@
+"""Testing the CIDR allocation of the subnet groups, no deployed stack or AWS access needed"""
+import unittest
+
+from aws_cdk import App, Stack
+
+from network.cidr_allocator import CidrAllocationError, CidrAllocator, SubnetGroupPlan
+from network.generic_network import GenericNetwork
+
+VPC_CIDR = "10.10.0.0/16"
+
+
+def allocate(azs: int, plans: list, reserved_azs: int = None, reserved: list = None,
+             vpc_cidr: str = VPC_CIDR) -> dict:
+    """CIDR ranges of the subnet groups of plans"""
+    allocator = CidrAllocator(vpc_cidr, azs, reserved_azs)
+    for cidr in reserved or []:
+        allocator.reserve(cidr)
+    for plan in plans:
+        allocator.add_group(plan)
+    return allocator.allocate()
+
+
+class TestCidrAllocator(unittest.TestCase):
+    """Testing CidrAllocator on subnet group plans"""
+
+    def test_spare(self):
+        """should keep the spare subnets of a group free after it"""
+        self.assertEqual(allocate(2, [SubnetGroupPlan("SAGSNL", spare=2),
+                                      SubnetGroupPlan("AMH")]),
+                         {"SAGSNL": ["10.10.0.0/24", "10.10.1.0/24"],
+                          "AMH": ["10.10.4.0/24", "10.10.5.0/24"]})
+
+    def test_reserved_azs(self):
+        """should not move the later groups when an AZ is added within reserved_azs"""
+        plans = [SubnetGroupPlan("SAGSNL"), SubnetGroupPlan("Endpoint", cidr_mask=27)]
+        two_azs = allocate(2, plans, reserved_azs=3)
+        three_azs = allocate(3, plans, reserved_azs=3)
+        self.assertEqual(two_azs["SAGSNL"], three_azs["SAGSNL"][:2])
+        self.assertEqual(two_azs["Endpoint"], three_azs["Endpoint"][:2])
+        self.assertEqual(three_azs["SAGSNL"][2], "10.10.2.0/24")
+        self.assertEqual(three_azs["Endpoint"], ["10.10.3.0/27", "10.10.3.32/27",
+                                                 "10.10.3.64/27"])
+
+    def test_reserved_ranges(self):
+        """should allocate around the reserved ranges"""
+        self.assertEqual(allocate(2, [SubnetGroupPlan("SAGSNL"), SubnetGroupPlan("AMH")],
+                                  reserved=["10.10.1.0/24", "10.10.2.128/25"]),
+                         {"SAGSNL": ["10.10.0.0/24", "10.10.3.0/24"],
+                          "AMH": ["10.10.4.0/24", "10.10.5.0/24"]})
+
+    def test_pinned(self):
+        """should keep the pinned ranges and allocate the other groups around them"""
+        self.assertEqual(allocate(2, [SubnetGroupPlan("SAGSNL"),
+                                      SubnetGroupPlan("AMH", cidrs=["10.10.0.0/24",
+                                                                    "10.10.8.0/24"])]),
+                         {"SAGSNL": ["10.10.1.0/24", "10.10.2.0/24"],
+                          "AMH": ["10.10.0.0/24", "10.10.8.0/24"]})
+
+    def test_pinned_collisions(self):
+        """should refuse pinned ranges colliding with each other, a reserved range,
+        or outside of the VPC, and a pin per AZ"""
+        with self.assertRaisesRegex(CidrAllocationError, "collides with SAGSNL AZ1"):
+            allocate(2, [SubnetGroupPlan("SAGSNL", cidrs=["10.10.0.0/24", "10.10.1.0/24"]),
+                         SubnetGroupPlan("AMH", cidrs=["10.10.0.128/25", "10.10.2.0/24"])])
+        with self.assertRaisesRegex(CidrAllocationError, "collides with reserved"):
+            allocate(2, [SubnetGroupPlan("AMH", cidrs=["10.10.0.0/24", "10.10.1.0/24"])],
+                     reserved=["10.10.1.0/24"])
+        with self.assertRaisesRegex(CidrAllocationError, "outside of the VPC"):
+            allocate(2, [SubnetGroupPlan("AMH", cidrs=["10.10.0.0/24", "10.11.0.0/24"])])
+        with self.assertRaisesRegex(CidrAllocationError, "pins 1 CIDR ranges for 2 AZs"):
+            allocate(2, [SubnetGroupPlan("AMH", cidrs=["10.10.0.0/24"])])
+
+    def test_does_not_fit(self):
+        """should refuse groups that do not fit in the VPC"""
+        with self.assertRaisesRegex(CidrAllocationError, "AMH /24 does not fit"):
+            allocate(2, [SubnetGroupPlan("SAGSNL", spare=1), SubnetGroupPlan("AMH")],
+                     vpc_cidr="10.10.0.0/22")
+
+
+class TestPrivateIpCheck(unittest.TestCase):
+    """Testing GenericNetwork.check_private_ip on the allocated subnets"""
+
+    def setUp(self):
+        stack = Stack(App(), "CidrTest")
+        self.network = GenericNetwork(stack, "VPC", cidr_range=VPC_CIDR)
+        self.network.add_isolated_subnets("SAGSNL")
+        self.network.add_isolated_subnets("AMH")
+        self.network.generate()
+
+    def test_in_subnet(self):
+        """should accept an address of the subnet of the group in the AZ"""
+        self.network.check_private_ip("SAGSNL", 0, "10.10.0.10")
+        self.network.check_private_ip("SAGSNL", 1, "10.10.1.10")
+
+    def test_outside_subnet(self):
+        """should refuse an address of another AZ or group"""
+        with self.assertRaisesRegex(CidrAllocationError, "outside of the SAGSNL subnet"):
+            self.network.check_private_ip("SAGSNL", 0, "10.10.1.10")
+        with self.assertRaisesRegex(CidrAllocationError, "outside of the SAGSNL subnet"):
+            self.network.check_private_ip("SAGSNL", 1, "10.10.2.10")
+
+
+if __name__ == "__main__":
+    unittest.main()
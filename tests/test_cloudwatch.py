@@ -1,7 +1,11 @@
 """Testing for cloudwatch stack"""
+import unittest
+
 from tests.parent_testcase import ParentTestCase
+from tests.verification import is_offline
 
 
+@unittest.skipIf(is_offline(), "needs running instances")
 class TestCloudWatch(ParentTestCase):
     """Testing for cloudwatch stack"""
 
@@ -0,0 +1,69 @@
+"""Testing the SSM parameter of the CloudWatch agent configuration, no deployed stack or
+AWS access needed"""
+import json
+import unittest
+from typing import Dict, Tuple
+
+from aws_cdk import App, NestedStack, Stack
+from aws_cdk.assertions import Template
+
+from base_host_group.cw_agent_config import AGENT_PROFILES, STANDARD_PARAMETER_BYTES, \
+    create_agent_config_parameter
+from base_host_group.log_collection import create_log_groups, get_collect_list, \
+    get_log_group_names
+
+# enough log sources for the log group names to make up a good part of the configuration
+LOG_SOURCES = [{"name": "app" + str(i), "file_path": "/swift/AMH/log/app" + str(i) + ".log"}
+               for i in range(20)]
+
+
+def config_size(scope: NestedStack, log_groups: Dict[str, str]) -> int:
+    """size of the agent configuration with the log groups"""
+    config = AGENT_PROFILES["standard"].build(
+        collect_list=get_collect_list(scope, "AMH", log_groups))
+    return len(json.dumps(config, separators=(",", ":"), sort_keys=True))
+
+
+def create_parameter(stack_name: str, token_values: bool = True) -> Tuple[str, int, int]:
+    """tier of the agent configuration parameter of AMH1 shipping to the log groups of the
+    parent stack, with the values of the log group tokens when token_values,
+    and the size of the configuration with the log group tokens and with the names"""
+    parent = Stack(App(context={"log_sources": {"AMH": LOG_SOURCES}}), stack_name)
+    log_groups = create_log_groups(parent, "AMH")
+    names = get_log_group_names(parent, "AMH")
+    scope = NestedStack(parent, "AMH1")
+    config = AGENT_PROFILES["standard"].build(
+        collect_list=get_collect_list(scope, "AMH", log_groups))
+    create_agent_config_parameter(
+        scope, "AMH1", config,
+        {token: names[name] for name, token in log_groups.items()} if token_values else None)
+    parameters = Template.from_stack(scope).find_resources("AWS::SSM::Parameter")
+    return list(parameters.values())[0]["Properties"]["Tier"], \
+        config_size(scope, log_groups), config_size(scope, names)
+
+
+class TestAgentConfigParameter(unittest.TestCase):
+    """Testing the tier of the agent configuration parameter"""
+
+    def test_standard(self):
+        """should keep a configuration within 4 KB with its log group names on standard"""
+        tier, _, size = create_parameter("SWIFTMain")
+        self.assertLessEqual(size, STANDARD_PARAMETER_BYTES)
+        self.assertEqual(tier, "Standard")
+
+    def test_resolved_names(self):
+        """should size the configuration on the log group names, not on their tokens"""
+        tier, token_size, size = create_parameter("SWIFTMain-" + "x" * 100)
+        self.assertLessEqual(token_size, STANDARD_PARAMETER_BYTES)
+        self.assertGreater(size, STANDARD_PARAMETER_BYTES)
+        self.assertEqual(tier, "Advanced")
+
+    def test_unresolved_tokens(self):
+        """should pick advanced when the values of the log group tokens are not known"""
+        tier, _, size = create_parameter("SWIFTMain", token_values=False)
+        self.assertLessEqual(size, STANDARD_PARAMETER_BYTES)
+        self.assertEqual(tier, "Advanced")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Testing the deployment dependency graph of the synthesized templates,
+no deployed stack or AWS access needed"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from utilities.deploy_graph import TemplateGraph, load_graph, synth_assembly
+
+HOST_STACKS = ["SAGSNL1", "SAGSNL2", "AMH1", "AMH2"]
+
+
+def get_graph(context: dict) -> TemplateGraph:
+    """graph of SwiftMain synthesized with the context"""
+    with tempfile.TemporaryDirectory() as outdir:
+        return load_graph(Path(outdir), synth_assembly(outdir, context))
+
+
+def nested_stack_id(graph: TemplateGraph, cid: str) -> str:
+    """logical id of a nested stack resource by construct id"""
+    return [logical_id for logical_id in graph.nested
+            if logical_id.startswith(cid + "NestedStack")][0]
+
+
+class TestTemplateGraph(unittest.TestCase):
+    """Testing the critical path of a template built by hand"""
+
+    def test_critical_path(self):
+        """should follow Ref, Fn::GetAtt, Fn::Sub and DependsOn to the longest path"""
+        graph = TemplateGraph("Test", {"Resources": {
+            "Vpc": {"Type": "AWS::EC2::VPC"},
+            "Broker": {"Type": "AWS::AmazonMQ::Broker",
+                       "Properties": {"SubnetIds": [{"Fn::GetAtt": ["Vpc", "Subnet"]}]}},
+            "Role": {"Type": "AWS::IAM::Role"},
+            "Instance": {"Type": "AWS::EC2::Instance", "DependsOn": "Role",
+                         "Properties": {"UserData": {"Fn::Sub": "${Vpc} ${AWS::Region}"}}},
+        }}, Path("."), {"AWS::EC2::VPC": 20, "AWS::AmazonMQ::Broker": 1200,
+                        "AWS::IAM::Role": 20, "AWS::EC2::Instance": 60})
+        self.assertEqual(graph.dependencies["Instance"], {"Role", "Vpc"})
+        self.assertEqual(graph.critical_path(), (["Vpc", "Broker"], 1220))
+        self.assertEqual(graph.total(), 1300)
+
+
+class TestParallelDeploy(unittest.TestCase):
+    """Testing the dependencies of the endpoint stack with and without parallel_deploy"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.serial = get_graph({})
+        cls.parallel = get_graph({"parallel_deploy": "true"})
+
+    def test_endpoint_dependencies(self):
+        """should deploy the endpoint stack after the hosts, alongside them with
+        parallel_deploy"""
+        for graph, waits in ((self.serial, True), (self.parallel, False)):
+            dependencies = graph.dependencies[nested_stack_id(graph, "VPCEndPointStack")]
+            for host in HOST_STACKS:
+                self.assertEqual(nested_stack_id(graph, host) in dependencies, waits, host)
+
+    def test_critical_path(self):
+        """should have the hosts ready sooner with parallel_deploy, the MQ broker still
+        bounding the deployment"""
+        for graph in (self.serial, self.parallel):
+            self.assertEqual(graph.critical_path()[0][-1],
+                             nested_stack_id(graph, "MQMessageBroker"))
+        for host in HOST_STACKS:
+            self.assertLess(self.parallel.finish(host + "Ready"),
+                            self.serial.finish(host + "Ready"), host)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,8 +22,23 @@ class TestNetworking(ParentTestCase):
 
     def test_vgw(self):
         """should have vgw attached """
+        if "TransitGatewayId" in self.cdk_output_map:
+            self.skipTest("connectivity through the transit gateway")
         result = self.ec2_client.describe_vpn_gateways(Filters=[{'Name': 'attachment.vpc-id',
                                                                  'Values': [
                                                                      self.vpc_id,
                                                                  ]}])
         self.assertTrue(result["VpnGateways"])
+
+    def test_transit_gateway(self):
+        """should have the transit gateway attached, with ECMP over the VPN tunnels"""
+        transit_gateway_id = self.cdk_output_map.get("TransitGatewayId")
+        if not transit_gateway_id:
+            self.skipTest("connectivity through the vgw")
+        result = self.ec2_client.describe_transit_gateways(
+            TransitGatewayIds=[transit_gateway_id])
+        self.assertEqual(result["TransitGateways"][0]["Options"]["VpnEcmpSupport"], "enable")
+        result = self.ec2_client.describe_transit_gateway_attachments(
+            Filters=[{"Name": "transit-gateway-id", "Values": [transit_gateway_id]},
+                     {"Name": "resource-id", "Values": [self.vpc_id]}])
+        self.assertTrue(result["TransitGatewayAttachments"])
@@ -0,0 +1,56 @@
+"""Testing the reachability between the components in the synthesized templates,
+no deployed stack or AWS access needed"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from network.reachability import load_model
+from utilities.deploy_graph import synth_assembly
+
+# the database and a read replica are placed, skip_oracle of cdk.json leaves them out
+CONTEXT = {"skip_oracle": "false", "database_read_replicas": {"count": 1}}
+# hsm_ip and workstation_ip_range of cdk.json
+HSM_IP = "10.20.1.10/32"
+WORKSTATION_IP_RANGE = "10.1.0.0/16"
+# allowed tcp ports between components, every other pair and port is denied
+EXPECTED_FLOWS = {
+    ("AMH", "SAGSNL"): [48002, 48003],
+    ("AMH", "RDS"): [1521],
+    ("AMH", "RDSReplica"): [1521],
+    ("AMH", "MQ"): [61617],
+    ("AMH", "VPCEndpoint"): [443],
+    ("SAGSNL", "VPCEndpoint"): [443],
+}
+
+
+class TestReachability(unittest.TestCase):
+    """Testing the reachability between the components in the synthesized templates"""
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as outdir:
+            cls.model = load_model(Path(outdir), synth_assembly(outdir, CONTEXT))
+
+    def test_matrix(self):
+        """should allow exactly the expected ports between every pair of components"""
+        placed = set(self.model.components)
+        for source, target in EXPECTED_FLOWS:
+            self.assertIn(source, placed)
+            self.assertIn(target, placed)
+        for (source, target), ports in self.model.matrix().items():
+            self.assertEqual(ports, EXPECTED_FLOWS.get((source, target), []),
+                             f"{source} -> {target}")
+
+    def test_hsm(self):
+        """should reach the HSM from SAGSNL only"""
+        self.assertTrue(self.model.can_reach("SAGSNL", HSM_IP, 1792).allowed)
+        self.assertFalse(self.model.can_reach("AMH", HSM_IP, 1792).allowed)
+
+    def test_workstation(self):
+        """should reach the SAG web interface from the workstations, not the database"""
+        self.assertTrue(self.model.can_reach(WORKSTATION_IP_RANGE, "SAGSNL", 2443).allowed)
+        self.assertFalse(self.model.can_reach(WORKSTATION_IP_RANGE, "RDS", 1521).allowed)
+
+
+if __name__ == "__main__":
+    unittest.main()
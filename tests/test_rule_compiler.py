@@ -0,0 +1,143 @@
+"""Testing the security group rule compiler, no deployed stack or AWS access needed"""
+import unittest
+
+from aws_cdk import App, Stack
+from aws_cdk import aws_ec2 as _ec2
+
+from security.generic_security import GenericSecurity
+from security.rule_compiler import EGRESS, INGRESS, RuleTable, count_entries
+
+TCP = _ec2.Protocol.TCP
+
+
+def rule_keys(rules) -> list:
+    """group and key of every compiled rule, sorted"""
+    return sorted(rule.group + " " + rule.key() for rule in rules)
+
+
+class TestRuleCompiler(unittest.TestCase):
+    """Testing RuleTable.compile on rule tables built by hand"""
+
+    def test_duplicates(self):
+        """should add a repeated rule once, with the descriptions of every copy"""
+        table = RuleTable()
+        table.connect("AMHSG", "SAGSNLSG", TCP, 48002, 48003, "AMH to SAG")
+        table.connect("AMHSG", "SAGSNLSG", TCP, 48002, 48003, "AMH to SAG")
+        table.connect("AMHSG", "SAGSNLSG", TCP, 48002, 48003, "SAG listener")
+        rules, prefix_lists = table.compile()
+        self.assertEqual(rule_keys(rules), [
+            "AMHSG egress TCP 48002-48003 group SAGSNLSG",
+            "SAGSNLSG ingress TCP 48002-48003 group AMHSG"])
+        self.assertEqual(rules[0].description, "AMH to SAG; SAG listener")
+        self.assertEqual(prefix_lists, {})
+
+    def test_all_traffic(self):
+        """should drop the rules to a peer that has an all traffic rule"""
+        table = RuleTable()
+        table.allow("MQSG", INGRESS, TCP, 61617, cidr="10.10.2.0/24")
+        table.allow("MQSG", INGRESS, _ec2.Protocol.ALL, cidr="10.10.2.0/24")
+        rules, _ = table.compile()
+        self.assertEqual(rule_keys(rules), ["MQSG ingress ALL 0-65535 cidr 10.10.2.0/24"])
+
+    def test_port_ranges(self):
+        """should merge the overlapping and adjacent port ranges to the same peer only"""
+        table = RuleTable()
+        table.allow("SAGSNLSG", INGRESS, TCP, 48002, 48003, cidr="10.1.0.0/16")
+        table.allow("SAGSNLSG", INGRESS, TCP, 48004, cidr="10.1.0.0/16")
+        table.allow("SAGSNLSG", INGRESS, TCP, 48003, 48010, cidr="10.1.0.0/16")
+        table.allow("SAGSNLSG", INGRESS, TCP, 48020, cidr="10.1.0.0/16")
+        table.allow("SAGSNLSG", INGRESS, _ec2.Protocol.UDP, 48011, cidr="10.1.0.0/16")
+        rules, _ = table.compile()
+        self.assertEqual(rule_keys(rules), [
+            "SAGSNLSG ingress TCP 48002-48010 cidr 10.1.0.0/16",
+            "SAGSNLSG ingress TCP 48020-48020 cidr 10.1.0.0/16",
+            "SAGSNLSG ingress UDP 48011-48011 cidr 10.1.0.0/16"])
+
+    def test_cidrs(self):
+        """should collapse the adjacent and contained CIDR ranges on the same ports"""
+        table = RuleTable()
+        table.allow("SAGSNLSG", EGRESS, TCP, 1792, cidr="10.20.1.0/25")
+        table.allow("SAGSNLSG", EGRESS, TCP, 1792, cidr="10.20.1.128/25")
+        table.allow("SAGSNLSG", EGRESS, TCP, 1792, cidr="10.20.1.10/32")
+        table.allow("SAGSNLSG", EGRESS, TCP, 1792, cidr="10.30.0.0/16")
+        table.allow("SAGSNLSG", EGRESS, TCP, 443, cidr="10.20.1.0/25")
+        rules, _ = table.compile()
+        self.assertEqual(rule_keys(rules), [
+            "SAGSNLSG egress TCP 1792-1792 cidr 10.20.1.0/24",
+            "SAGSNLSG egress TCP 1792-1792 cidr 10.30.0.0/16",
+            "SAGSNLSG egress TCP 443-443 cidr 10.20.1.0/25"])
+
+    def test_prefix_lists(self):
+        """should move a set of CIDR ranges repeated in several rules to a prefix list,
+        counted at its size against the quota"""
+        table = RuleTable()
+        for group, port in [("SAGSNLSG", 2443), ("AMHSG", 8443)]:
+            for cidr in ["10.1.0.0/16", "10.3.0.0/16", "192.168.0.0/24"]:
+                table.allow(group, INGRESS, TCP, port, cidr=cidr)
+        table.allow("AMHSG", INGRESS, TCP, 22, cidr="10.1.0.0/16")
+        rules, prefix_lists = table.compile()
+        self.assertEqual(prefix_lists,
+                         {"SharedPeers1": ["10.1.0.0/16", "10.3.0.0/16", "192.168.0.0/24"]})
+        self.assertEqual(rule_keys(rules), [
+            "AMHSG ingress TCP 22-22 cidr 10.1.0.0/16",
+            "AMHSG ingress TCP 8443-8443 prefix_list SharedPeers1",
+            "SAGSNLSG ingress TCP 2443-2443 prefix_list SharedPeers1"])
+        self.assertEqual(count_entries(rules, {"SharedPeers1": 3}),
+                         {("AMHSG", INGRESS): 4, ("SAGSNLSG", INGRESS): 3})
+
+    def test_string_representations(self):
+        """should keep the name of a rule between security groups unless its ports change,
+        and name the other rules as add_security_group_rule did"""
+        table = RuleTable()
+        table.connect("AMHSG", "RDSSG", TCP, 1521, name="RDS (1521)")
+        table.connect("AMHSG", "RDSSG", TCP, 1521, name="Oracle (1521)")
+        table.connect("AMHSG", "MQSG", TCP, 61617, name="MQ (61617)")
+        table.connect("AMHSG", "MQSG", TCP, 61618, name="MQ (61618)")
+        table.allow("AMHSG", EGRESS, TCP, 443, prefix_list="pl-63a5400a")
+        table.allow("MQSG", INGRESS, TCP, 8162, cidr="10.1.0.0/16")
+        rules, _ = table.compile()
+        self.assertEqual(sorted(rule.group + " " + rule.string_representation()
+                                for rule in rules), [
+            "AMHSG AMHSG_TCP_prefixlist_443_443",
+            "AMHSG RDS (1521)",
+            "AMHSG egress TCP 61617-61618 group MQSG",
+            "MQSG MQSG_TCP_10.1.0.0/16_8162_8162",
+            "MQSG ingress TCP 61617-61618 group AMHSG",
+            "RDSSG RDS (1521)"])
+
+
+class TestRuleQuota(unittest.TestCase):
+    """Testing the rule quota of GenericSecurity.apply_security_group_rules"""
+
+    @staticmethod
+    def create_security(rule_count: int) -> GenericSecurity:
+        """security stack with rule_count ingress rules on AMHSG, none of them merged"""
+        app = App(context={"security_group_rule_quota": "60"})
+        stack = Stack(app, "QuotaTest")
+        security = GenericSecurity(stack, "Security", _ec2.Vpc(stack, "VPC"))
+        security.create_security_group("AMHSG")
+        for i in range(rule_count):
+            security.add_security_group_rule("AMHSG", TCP, "10.1.0.0/16", from_port=1000 + 2 * i,
+                                             to_port=1000 + 2 * i)
+        return security
+
+    def test_quota_exceeded(self):
+        """should refuse more rule entries than the quota"""
+        security = self.create_security(61)
+        with self.assertRaisesRegex(ValueError, "AMHSG has 61 ingress rule entries"):
+            security.apply_security_group_rules()
+
+    def test_quota_warning(self):
+        """should warn above 80% of the quota"""
+        security = self.create_security(50)
+        self.assertEqual(security.apply_security_group_rules(),
+                         ["AMHSG: ingress 50/60, egress 0/60"])
+        warnings = [str(entry.data) for entry in
+                    security.get_security_group("AMHSG").node.metadata
+                    if entry.type == "aws:cdk:warning"]
+        self.assertTrue([warning for warning in warnings
+                         if "50 ingress rule entries of the quota of 60" in warning], warnings)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,21 +1,14 @@
 """test SSM session manager connection with ec2 instances"""
+import unittest
+
 from tests.parent_testcase import ParentTestCase
+from tests.verification import check_ssm_session, is_offline, run_checks
 
 
+@unittest.skipIf(is_offline(), "needs running instances")
 class TestSSMSessionConnection(ParentTestCase):
     """test SSM session manager connection with ec2 instances"""
 
-    def __init__(self, methodName='runTest'):
-        super().__init__(methodName)
-        self.snl_session_id = None
-        self.amh_session_id = None
-        self.session_ids = []
-
-    def tearDown(self) -> None:
-
-        for session_id in self.session_ids:
-            self.ssm_client.terminate_session(SessionId=session_id)
-
     def test_snl_ssm_connection(self):
         """test SSM session manager connection with sag snl ec2 instances"""
         self.common_test_ssm_connection("SAGSNL")
@@ -25,10 +18,12 @@ class TestSSMSessionConnection(ParentTestCase):
         self.common_test_ssm_connection("AMH")
 
     def common_test_ssm_connection(self, component: str):
-        """test SSM session manager connection with any instances"""
-        for i in range(1, 3):
-            result = self.ssm_client.start_session(
-                Target=self.cdk_output_map.get(component + str(i) + "InstanceID"))
-            session_id = result.get("SessionId")
-            self.assertIsNotNone(session_id)
-            self.session_ids.append(session_id)
+        """test SSM session manager connection with any instances, the sessions
+        are opened concurrently and terminated by the check"""
+        instance_ids = [self.cdk_output_map.get(component + str(i) + "InstanceID")
+                        for i in range(1, 3)]
+        results = run_checks({instance_id: lambda instance_id=instance_id:
+                              check_ssm_session(instance_id, self.region)
+                              for instance_id in instance_ids})
+        for result in results:
+            self.assertTrue(result.passed, f"{result.name}: {result.detail}")
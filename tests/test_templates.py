@@ -0,0 +1,423 @@
+"""Testing the synthesized SwiftMain templates, no deployed stack or AWS access needed"""
+import json
+import unittest
+from unittest import mock
+
+from aws_cdk import App, Environment, Stack
+from aws_cdk import aws_ec2 as _ec2
+from aws_cdk import aws_iam as _iam
+from aws_cdk.assertions import Match, Template
+
+from base_host_group.boot_readiness import DEFAULT_READY_TIMEOUT, READY_CHECK_SECONDS, \
+    SIGNAL_SECONDS
+from base_host_group.host_group import ENDPOINT_HOSTS_SCRIPT
+from base_host_group.network_tuning import NETWORK_TUNINGS, TUNING_SCRIPT, VPN_MSS, VPN_MTU
+from base_host_group.performance_tier import PERFORMANCE_TIERS
+from golden_ami import golden_ami_pipeline
+from network.swift_vpc_endpoints import ENDPOINT_POLICY_LIMIT, SwiftVPCEndpoints
+from swift_database.database_profile import DatabaseProfile
+from tests.offline import find_resources, get_templates, synth_golden_ami_template
+from utilities.stubbed_app import STUB_ACCOUNT, STUB_REGION, stub_context
+from utilities.swift_components import SwiftComponents
+
+
+def as_list(value) -> list:
+    """a policy element, which is a single value or a list"""
+    return value if isinstance(value, list) else [value]
+
+
+def synth_endpoint_template(policy_mode: str, instance_count: int) -> Template:
+    """template of the endpoint stack alone, for instance_count instances of SAGSNL and AMH"""
+    stack = Stack(App(context=stub_context()), "EndpointTest",
+                  env=Environment(account=STUB_ACCOUNT, region=STUB_REGION))
+    vpc = _ec2.Vpc(stack, "VPC", max_azs=2)
+    components = [SwiftComponents.AMH, SwiftComponents.SAGSNL]
+    roles = {component: _iam.Role(stack, component + "Role",
+                                  assumed_by=_iam.ServicePrincipal("ec2.amazonaws.com"))
+             for component in components}
+    return Template.from_stack(SwiftVPCEndpoints(
+        stack, "VPCEndPointStack", application_names=components,
+        instance_ids={component: [f"i-{index:017x}" for index in range(instance_count)]
+                      for component in components},
+        instance_roles_map=roles, endpoint_sg=_ec2.SecurityGroup(stack, "SG", vpc=vpc),
+        vpc=vpc, policy_mode=policy_mode))
+
+
+def get_interface_policies(template: Template) -> dict:
+    """policy documents of the interface endpoints, by logical id"""
+    return {logical_id: endpoint["Properties"]["PolicyDocument"] for logical_id, endpoint in
+            template.find_resources("AWS::EC2::VPCEndpoint").items()
+            if endpoint["Properties"]["VpcEndpointType"] == "Interface"}
+
+
+class TestNetworkTemplates(unittest.TestCase):
+    """Testing the VPC, its subnets and the connectivity to SWIFT"""
+
+    def test_no_igw(self):
+        """should not have an internet gateway in any stack"""
+        templates = get_templates(STUB_REGION)
+        self.assertFalse(find_resources(templates, "AWS::EC2::InternetGateway"))
+        self.assertFalse(find_resources(templates, "AWS::EC2::NatGateway"))
+
+    def test_vgw(self):
+        """should have a vgw attached to the VPC"""
+        templates = get_templates(STUB_REGION)
+        network = templates["SwiftConnectivityVPC"]
+        network.resource_count_is("AWS::EC2::VPNGateway", 1)
+        network.has_resource_properties("AWS::EC2::VPCGatewayAttachment",
+                                        {"VpnGatewayId": Match.any_value()})
+
+    def test_subnet_cidrs(self):
+        """should allocate the default subnet groups as the CDK Vpc does"""
+        templates = get_templates(STUB_REGION)
+        cidrs = sorted(subnet["Properties"]["CidrBlock"] for subnet in
+                       find_resources(templates, "AWS::EC2::Subnet").values())
+        self.assertEqual(cidrs, [f"10.10.{i}.0/24" for i in range(8)])
+
+    def test_transit_gateway(self):
+        """should have a transit gateway with ECMP over BGP VPN connections, no vgw"""
+        templates = get_templates(STUB_REGION, "network")
+        network = templates["SwiftConnectivityVPC"]
+        network.has_resource_properties("AWS::EC2::TransitGateway",
+                                        {"VpnEcmpSupport": "enable"})
+        network.resource_count_is("AWS::EC2::VPNConnection", 2)
+        network.all_resources_properties("AWS::EC2::VPNConnection",
+                                         {"StaticRoutesOnly": False})
+        self.assertFalse(find_resources(templates, "AWS::EC2::VPNGateway"))
+        self.assertFalse(find_resources(templates, "AWS::EC2::VPCGatewayAttachment"))
+
+    def test_attachment_subnets(self):
+        """should attach the transit gateway in the SAGSNL subnet of every AZ"""
+        templates = get_templates(STUB_REGION, "network")
+        attachments = list(find_resources(
+            templates, "AWS::EC2::TransitGatewayAttachment").values())
+        self.assertEqual(len(attachments), 1)
+        subnets = attachments[0]["Properties"]["SubnetIds"]
+        self.assertEqual(len(subnets), 3)
+        for subnet in subnets:
+            self.assertIn("SAGSNLSubnet", subnet["Ref"])
+
+    def test_static_routes(self):
+        """should route the SWIFT and HSM ranges of the SAGSNL subnets to the transit
+        gateway"""
+        templates = get_templates(STUB_REGION, "network")
+        routes = [route["Properties"] for route in
+                  find_resources(templates, "AWS::EC2::Route").values()
+                  if "TransitGatewayId" in route["Properties"]]
+        self.assertEqual(sorted((route["RouteTableId"]["Ref"].split("RouteTable")[0],
+                                 route["DestinationCidrBlock"]) for route in routes),
+                         sorted((f"SwiftVPCSAGSNLSubnet{i}", cidr) for i in (1, 2, 3)
+                                for cidr in ("149.134.0.0/16", "10.20.1.10/32")))
+
+    def test_mq_subnets(self):
+        """should place the active/standby broker in two of the three AZs of the network"""
+        templates = get_templates(STUB_REGION, "network")
+        self.assertEqual(len(find_resources(templates, "AWS::EC2::Subnet")), 12)
+        brokers = list(find_resources(templates, "AWS::AmazonMQ::Broker").values())
+        self.assertTrue(brokers)
+        for broker in brokers:
+            self.assertEqual(broker["Properties"]["DeploymentMode"], "ACTIVE_STANDBY_MULTI_AZ")
+            subnets = [subnet["Ref"] for subnet in broker["Properties"]["SubnetIds"]]
+            self.assertEqual(len(subnets), 2)
+            for i, subnet in enumerate(subnets, 1):
+                self.assertIn(f"MQSubnet{i}", subnet)
+
+
+class TestSecurityTemplates(unittest.TestCase):
+    """Testing the security group rules between the components"""
+
+    def test_amh_to_sagsnl_rule(self):
+        """should only allow AMH into SAGSNL on the SAG ports"""
+        templates = get_templates(STUB_REGION)
+        rules = [rule["Properties"] for rule in
+                 find_resources(templates, "AWS::EC2::SecurityGroupIngress").values()
+                 if "SAGSNLSG" in json.dumps(rule["Properties"]["GroupId"])
+                 and "AMHSG" in json.dumps(rule["Properties"].get("SourceSecurityGroupId"))]
+        self.assertEqual([(rule["IpProtocol"], rule["FromPort"], rule["ToPort"])
+                          for rule in rules], [("tcp", 48002, 48003)])
+
+    def test_amh_to_replica_rule(self):
+        """should allow AMH into the read replica on the Oracle port"""
+        templates = get_templates(STUB_REGION, "components")
+        security = templates["SwiftConnectivitySecurity"]
+        security.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+            "IpProtocol": "tcp", "FromPort": 1521, "ToPort": 1521,
+            "GroupId": {"Fn::GetAtt": [Match.string_like_regexp("RDSReplicaSG"), "GroupId"]},
+            "SourceSecurityGroupId": {
+                "Fn::GetAtt": [Match.string_like_regexp("AMHSG"), "GroupId"]}})
+
+    def test_no_duplicate_rules(self):
+        """should add every security group rule once, see security/rule_compiler.py"""
+        templates = get_templates(STUB_REGION)
+        for resource_type in ("AWS::EC2::SecurityGroupIngress", "AWS::EC2::SecurityGroupEgress"):
+            rules = [json.dumps({key: value for key, value in rule["Properties"].items()
+                                 if key != "Description"}, sort_keys=True)
+                     for rule in find_resources(templates, resource_type).values()]
+            self.assertEqual(len(rules), len(set(rules)), resource_type)
+
+    def test_rule_ids(self):
+        """should keep the logical ids the rules had before the rule compiler, a rule
+        under a new id is added before the old one is removed and fails as a duplicate"""
+        templates = get_templates(STUB_REGION)
+        names = ["AMHSAGSNL4800248003", "RDS1521", "MQ61617", "AMHEndpoint443",
+                 "SAGSNLEndpoint443", "TCPprefixlist443443"]
+        for resource_type in ("AWS::EC2::SecurityGroupIngress", "AWS::EC2::SecurityGroupEgress"):
+            for logical_id in find_resources(templates, resource_type):
+                self.assertTrue(any(name in logical_id for name in names), logical_id)
+
+    def test_no_open_egress(self):
+        """should not allow egress to anywhere from any security group"""
+        templates = get_templates(STUB_REGION)
+        egress_rules = [rule for group in
+                        find_resources(templates, "AWS::EC2::SecurityGroup").values()
+                        for rule in group["Properties"].get("SecurityGroupEgress", [])]
+        egress_rules += [rule["Properties"] for rule in
+                         find_resources(templates, "AWS::EC2::SecurityGroupEgress").values()]
+        for rule in egress_rules:
+            self.assertNotIn(rule.get("CidrIp"), ["0.0.0.0/0"], rule)
+            self.assertNotIn(rule.get("CidrIpv6"), ["::/0"], rule)
+
+
+class TestEndpointTemplates(unittest.TestCase):
+    """Testing the VPC endpoints, their policies and how the hosts resolve them"""
+
+    def test_endpoint_policies(self):
+        """should have a policy on every endpoint, never allowing anyone everything"""
+        templates = get_templates(STUB_REGION)
+        endpoints = find_resources(templates, "AWS::EC2::VPCEndpoint")
+        self.assertTrue(endpoints)
+        for name, endpoint in endpoints.items():
+            statements = endpoint["Properties"].get("PolicyDocument", {}).get("Statement")
+            self.assertTrue(statements, name + " has no endpoint policy")
+            for statement in statements:
+                actions = as_list(statement["Action"])
+                self.assertNotIn("*", actions, name)
+                self.assertFalse([action for action in actions if action.endswith(":*")], name)
+                anyone = statement.get("Principal") in ("*", {"AWS": "*"})
+                if anyone and "*" in as_list(statement.get("Resource", "*")):
+                    self.assertIn("Condition", statement,
+                                  name + " allows any principal on any resource")
+
+    def test_s3_endpoint_buckets(self):
+        """should limit the S3 gateway endpoint to the agent and waitcondition buckets"""
+        templates = get_templates(STUB_REGION)
+        endpoints = templates["VPCEndPointStack"]
+        endpoints.has_resource_properties("AWS::EC2::VPCEndpoint", {
+            "VpcEndpointType": "Gateway",
+            "PolicyDocument": {"Statement": [Match.object_like({
+                "Resource": Match.array_with([
+                    "arn:aws:s3:::amazoncloudwatch-agent-" + STUB_REGION + "/*",
+                    "arn:aws:s3:::cloudformation-waitcondition-" + STUB_REGION + "/*"])})]}})
+
+    def test_policy_modes(self):
+        """should allow the EC2 instance sessions of the application roles, or of the roles
+        tagged with the applications, in a single statement"""
+        for policy_mode in ("roles", "tags"):
+            policies = get_interface_policies(synth_endpoint_template(policy_mode, 2))
+            self.assertTrue(policies)
+            for name, policy in policies.items():
+                self.assertEqual(len(policy["Statement"]), 1, name)
+                statement = policy["Statement"][0]
+                self.assertEqual(statement["Principal"], {"AWS": "*"}, name)
+                self.assertIn("ec2:SourceInstanceARN", statement["Condition"]["ArnLike"], name)
+                if policy_mode == "roles":
+                    self.assertEqual(len(statement["Condition"]["ArnEquals"]
+                                         ["aws:PrincipalArn"]), 2, name)
+                else:
+                    self.assertEqual(statement["Condition"]["StringEquals"], {
+                        "aws:PrincipalAccount": STUB_ACCOUNT,
+                        "aws:PrincipalTag/SwiftComponent": [SwiftComponents.AMH,
+                                                            SwiftComponents.SAGSNL]}, name)
+
+    def test_policy_size(self):
+        """should keep the roles and tags policies the same as instances are added, and
+        refuse an instances policy over the size limit"""
+        for policy_mode in ("roles", "tags"):
+            self.assertEqual(get_interface_policies(synth_endpoint_template(policy_mode, 2)),
+                             get_interface_policies(synth_endpoint_template(policy_mode, 100)),
+                             policy_mode)
+        with self.assertRaisesRegex(ValueError, f"over the limit of {ENDPOINT_POLICY_LIMIT}"):
+            synth_endpoint_template("instances", 100)
+
+    def test_endpoint_hosts_refresh(self):
+        """should pin the endpoints of the AZ of every instance and refresh the pins"""
+        templates = get_templates(STUB_REGION, "components")
+        instances = find_resources(templates, "AWS::EC2::Instance")
+        self.assertTrue(instances)
+        for name, instance in instances.items():
+            user_data = json.dumps(instance["Properties"]["UserData"])
+            self.assertIn(ENDPOINT_HOSTS_SCRIPT, user_data, name)
+            self.assertIn("systemctl enable --now swift-endpoint-hosts.timer", user_data, name)
+
+
+class TestHostTemplates(unittest.TestCase):
+    """Testing the SAGSNL and AMH instances, their volumes, user data and launch templates"""
+
+    def test_endpoint_wait_budget(self):
+        """should end the endpoint waits of every instance in time for the readiness
+        checks and the signal to fit in the ready_timeout"""
+        templates = get_templates(STUB_REGION)
+        wait_ms = (DEFAULT_READY_TIMEOUT - READY_CHECK_SECONDS - SIGNAL_SECONDS) * 1000
+        instances = find_resources(templates, "AWS::EC2::Instance")
+        self.assertTrue(instances)
+        for name, instance in instances.items():
+            user_data = json.dumps(instance["Properties"]["UserData"])
+            self.assertIn(f"- boot_start )) -lt {wait_ms} ]", user_data, name)
+
+    def test_root_volumes(self):
+        """should launch every instance on a gp3 root volume"""
+        templates = get_templates(STUB_REGION, "components")
+        instances = find_resources(templates, "AWS::EC2::Instance")
+        self.assertTrue(instances)
+        for name, instance in instances.items():
+            root = instance["Properties"]["BlockDeviceMappings"][0]["Ebs"]
+            self.assertEqual(root["VolumeType"], "gp3", name)
+
+    def test_data_volumes(self):
+        """should attach the data and log volumes of every instance, encrypted"""
+        templates = get_templates(STUB_REGION, "components")
+        volumes = find_resources(templates, "AWS::EC2::Volume").values()
+        self.assertEqual(sorted((volume["Properties"]["VolumeType"],
+                                 volume["Properties"]["Size"]) for volume in volumes),
+                         sorted([("gp3", 200), ("gp3", 100)] * 2
+                                + [("io2", 500), ("gp3", 200)] * 2))
+        for volume in volumes:
+            self.assertTrue(volume["Properties"]["Encrypted"])
+        self.assertEqual(len(find_resources(templates, "AWS::EC2::VolumeAttachment")),
+                         len(volumes))
+
+    def test_legacy_network_tuning(self):
+        """should launch the instances without launch template with the legacy tuning,
+        attaching one replaces the instance"""
+        templates = get_templates(STUB_REGION)
+        for instance in find_resources(templates, "AWS::EC2::Instance").values():
+            self.assertNotIn("LaunchTemplate", instance["Properties"])
+
+    def test_launch_templates(self):
+        """should set IMDSv2 and ENA Express on the network interface of the launch
+        templates, which holds the security group"""
+        templates = get_templates(STUB_REGION, "network")
+        launch_templates = find_resources(templates, "AWS::EC2::LaunchTemplate")
+        self.assertEqual(len(launch_templates), 4)
+        for name, launch_template in launch_templates.items():
+            data = launch_template["Properties"]["LaunchTemplateData"]
+            self.assertEqual(data["MetadataOptions"],
+                             {"HttpPutResponseHopLimit": 1, "HttpTokens": "required"}, name)
+            self.assertNotIn("SecurityGroupIds", data, name)
+            interface = data["NetworkInterfaces"][0]
+            self.assertEqual(interface["EnaSrdSpecification"]["EnaSrdEnabled"], True, name)
+            self.assertTrue(interface["Groups"], name)
+            self.assertIn("SubnetId", interface, name)
+
+    def test_instances(self):
+        """should launch the instances from their launch template, with the subnet,
+        security group and private IP address left to its network interface"""
+        templates = get_templates(STUB_REGION, "network")
+        instances = find_resources(templates, "AWS::EC2::Instance")
+        self.assertEqual(len(instances), 4)
+        for name, instance in instances.items():
+            properties = instance["Properties"]
+            self.assertEqual(properties["InstanceType"], "c6in.12xlarge", name)
+            self.assertIn("LaunchTemplate", properties, name)
+            for key in ("SubnetId", "SecurityGroupIds", "PrivateIpAddress"):
+                self.assertNotIn(key, properties, name)
+            user_data = json.dumps(properties["UserData"])
+            self.assertIn(TUNING_SCRIPT, user_data, name)
+            self.assertIn(f"mtu lock {VPN_MTU} advmss {VPN_MSS}", user_data, name)
+
+    def test_private_ips(self):
+        """should keep the fixed private IP addresses of the SAGSNL instances"""
+        templates = get_templates(STUB_REGION, "network")
+        addresses = sorted(
+            launch_template["Properties"]["LaunchTemplateData"]["NetworkInterfaces"][0]
+            .get("PrivateIpAddress", "") for launch_template in
+            find_resources(templates, "AWS::EC2::LaunchTemplate").values())
+        self.assertEqual(addresses, ["", "", "10.10.0.10", "10.10.1.10"])
+
+    def test_tier_check(self):
+        """should refuse ENA Express on the built-in tiers without it"""
+        for tier in ("dev", "standard", "compute", "latency", "memory"):
+            with self.assertRaises(ValueError):
+                NETWORK_TUNINGS["ena_express"].check("AMH1", PERFORMANCE_TIERS[tier])
+        NETWORK_TUNINGS["ena_express"].check("AMH1", PERFORMANCE_TIERS["network"])
+
+
+class TestDatabaseTemplates(unittest.TestCase):
+    """Testing the Oracle database, its profile and read replicas"""
+
+    def test_read_replica(self):
+        """should replicate the database in the Database subnets"""
+        templates = get_templates(STUB_REGION, "components")
+        database = templates["Database"]
+        database.resource_count_is("AWS::RDS::DBInstance", 2)
+        database.has_resource_properties("AWS::RDS::DBInstance", {
+            "SourceDBInstanceIdentifier": Match.any_value(),
+            "StorageEncrypted": True})
+        for name, subnet_group in find_resources(
+                templates, "AWS::RDS::DBSubnetGroup").items():
+            for subnet in subnet_group["Properties"]["SubnetIds"]:
+                self.assertIn("DatabaseSubnet", subnet["Ref"], name)
+
+    def test_gp3_storage(self):
+        """should provision the gp3 iops and throughput of the profile"""
+        templates = get_templates(STUB_REGION, "components")
+        templates["Database"].has_resource_properties("AWS::RDS::DBInstance", {
+            "StorageType": "gp3", "AllocatedStorage": "400", "Iops": 12000,
+            "StorageThroughput": 500, "MaxAllocatedStorage": 2000,
+            "DBParameterGroupName": Match.any_value(), "OptionGroupName": Match.any_value()})
+
+    def test_gp3_threshold(self):
+        """should only provision gp3 iops on Oracle from 200 GiB"""
+        DatabaseProfile("gp3", storage_type="gp3", allocated_storage=200, iops=12000)
+        with self.assertRaises(ValueError):
+            DatabaseProfile("gp3", storage_type="gp3", allocated_storage=100, iops=12000)
+
+
+class TestGoldenAMITemplates(unittest.TestCase):
+    """Testing the template of the golden AMI pipeline"""
+
+    @staticmethod
+    def get_versions(template) -> dict:
+        """versions of the component and of the recipe"""
+        return {resource_type: list(template.find_resources(resource_type).values())[0]
+                ["Properties"]["Version"] for resource_type in
+                ("AWS::ImageBuilder::Component", "AWS::ImageBuilder::ImageRecipe")}
+
+    def test_pipeline(self):
+        """should build the recipe of the baseline component on the RHEL image"""
+        template = synth_golden_ami_template(STUB_REGION)
+        template.has_resource_properties("AWS::ImageBuilder::ImageRecipe", {
+            "ParentImage": Match.string_like_regexp("^ami-"),
+            "Components": [{"ComponentArn": {"Fn::GetAtt": [
+                Match.string_like_regexp("SwiftHostBaseline"), "Arn"]}}]})
+        template.has_resource_properties("AWS::ImageBuilder::InfrastructureConfiguration", {
+            "InstanceMetadataOptions": {"HttpTokens": "required"}})
+        template.has_resource_properties("AWS::ImageBuilder::ImagePipeline", {
+            "ImageTestsConfiguration": {"ImageTestsEnabled": True, "TimeoutMinutes": 60},
+            "Schedule": Match.object_like({"ScheduleExpression": "cron(0 3 1 * ? *)"})})
+
+    def test_content_versions(self):
+        """should version the component and the recipe on their content, they are
+        immutable and replaced on any change"""
+        versions = self.get_versions(synth_golden_ami_template(STUB_REGION))
+        for version in versions.values():
+            self.assertRegex(version, r"^1\.0\.\d+$")
+        self.assertEqual(self.get_versions(synth_golden_ami_template(STUB_REGION)), versions)
+
+        with mock.patch.object(golden_ami_pipeline, "OS_SETTINGS_COMMANDS",
+                               golden_ami_pipeline.OS_SETTINGS_COMMANDS + ["true"]):
+            changed = self.get_versions(synth_golden_ami_template(STUB_REGION))
+        for resource_type, version in versions.items():
+            self.assertNotEqual(changed[resource_type], version, resource_type)
+
+        with mock.patch.object(golden_ami_pipeline, "get_machine_image", lambda: _ec2.
+                               MachineImage.generic_linux({STUB_REGION: "ami-0abcdef"})):
+            changed = self.get_versions(synth_golden_ami_template(STUB_REGION))
+        self.assertEqual(changed["AWS::ImageBuilder::Component"],
+                         versions["AWS::ImageBuilder::Component"])
+        self.assertNotEqual(changed["AWS::ImageBuilder::ImageRecipe"],
+                            versions["AWS::ImageBuilder::ImageRecipe"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,16 @@
+"""Testing the deployed stack with every check of tests/verification.py"""
+import time
+
+from tests.parent_testcase import ParentTestCase
+from tests.verification import format_report, get_checks, run_checks
+
+
+class TestVerification(ParentTestCase):
+    """Testing the deployed stack with every check of tests/verification.py"""
+
+    def test_all_checks(self):
+        """every check passes, run concurrently"""
+        start = time.perf_counter()
+        results = run_checks(get_checks(self.region))
+        report = format_report(results, time.perf_counter() - start)
+        self.assertTrue(all(result.passed for result in results), report)
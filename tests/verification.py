@@ -0,0 +1,241 @@
+"""Post deploy verification of a SWIFTMain stack, running the checks concurrently.
+
+The stack outputs are loaded once and the boto3 clients are shared by every check,
+boto3 clients are thread safe. Run all the checks with a timing report:
+
+    python -m tests.verification [region]
+
+With SWIFT_TEST_OFFLINE=true the checks run against moto instead, see tests/offline.py.
+"""
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import boto3
+from botocore.config import Config
+
+# connections per client, one per concurrent check
+MAX_WORKERS = 16
+# set to true to run against moto seeded from the synthesized templates
+OFFLINE_ENV = "SWIFT_TEST_OFFLINE"
+# secrets of the stack, two when the Oracle database is skipped
+EXPECTED_SECRETS = 2
+
+
+class CheckResult:
+    """Outcome and duration of one check"""
+
+    def __init__(self, name: str, passed: bool, duration: float, detail: str = "") -> None:
+        self.name = name
+        self.passed = passed
+        self.duration = duration
+        self.detail = detail
+
+
+def is_offline() -> bool:
+    """whether the tests run against moto instead of the deployed stack"""
+    return os.environ.get(OFFLINE_ENV) == "true"
+
+
+def get_region() -> str:
+    """region of the stack under test"""
+    return os.environ.get("AWS_DEFAULT_REGION") or "us-east-1"
+
+
+@lru_cache(maxsize=None)
+def get_stack_outputs(region: str) -> Dict[str, str]:
+    """outputs of the SWIFTMain stack from <region>_outputs.json, read once,
+    or the ids of the resources seeded in moto offline"""
+    if is_offline():
+        # pylint: disable=import-outside-toplevel
+        from tests.offline import start_offline_aws
+        return start_offline_aws(region)
+    filename = region + "_outputs.json"
+    with open(Path(__file__).parent / ".." / filename, "r", encoding="utf-8") as output_file:
+        return json.load(output_file).get("SWIFTMain-" + region, {})
+
+
+@lru_cache(maxsize=None)
+def get_client(service: str, region: str):
+    """boto3 client shared by the checks, pooled for MAX_WORKERS concurrent calls.
+    Offline, moto is started first so the client is mocked"""
+    if is_offline():
+        get_stack_outputs(region)
+    return boto3.client(service, region_name=region,
+                        config=Config(max_pool_connections=MAX_WORKERS,
+                                      retries={"mode": "adaptive", "max_attempts": 10}))
+
+
+def get_instance_ids(outputs: Dict[str, str], region: str) -> List[str]:
+    """instance ids of the outputs, and the instances of the AMH Auto Scaling group"""
+    instance_ids = [value for key, value in outputs.items() if key.endswith("InstanceID")]
+    group_name = outputs.get("AMHAutoScalingGroupName")
+    if group_name:
+        groups = get_client("autoscaling", region).describe_auto_scaling_groups(
+            AutoScalingGroupNames=[group_name])["AutoScalingGroups"]
+        instance_ids += [instance["InstanceId"] for group in groups
+                         for instance in group["Instances"]]
+    return instance_ids
+
+
+def check_no_igw(outputs: Dict[str, str], region: str) -> str:
+    """no internet gateway attached to the VPC"""
+    result = get_client("ec2", region).describe_internet_gateways(
+        Filters=[{"Name": "attachment.vpc-id", "Values": [outputs["VPCID"]]}])
+    assert not result["InternetGateways"], "internet gateway attached"
+    return "no internet gateway"
+
+
+def check_vgw(outputs: Dict[str, str], region: str) -> str:
+    """virtual private gateway attached to the VPC"""
+    result = get_client("ec2", region).describe_vpn_gateways(
+        Filters=[{"Name": "attachment.vpc-id", "Values": [outputs["VPCID"]]}])
+    assert result["VpnGateways"], "no virtual private gateway attached"
+    return result["VpnGateways"][0]["VpnGatewayId"]
+
+
+def check_transit_gateway(outputs: Dict[str, str], region: str) -> str:
+    """transit gateway attached to the VPC, with ECMP over its VPN connections, each with
+    a tunnel up, or attached to a Direct Connect gateway"""
+    ec2_client = get_client("ec2", region)
+    transit_gateway_id = outputs["TransitGatewayId"]
+    transit_gateway = ec2_client.describe_transit_gateways(
+        TransitGatewayIds=[transit_gateway_id])["TransitGateways"][0]
+    assert transit_gateway["Options"]["VpnEcmpSupport"] == "enable", "ECMP not enabled"
+    attachments = ec2_client.describe_transit_gateway_attachments(Filters=[
+        {"Name": "transit-gateway-id", "Values": [transit_gateway_id]},
+        {"Name": "resource-id", "Values": [outputs["VPCID"]]},
+        {"Name": "state", "Values": ["available"]}])["TransitGatewayAttachments"]
+    assert attachments, "no transit gateway attachment available"
+    connections = ec2_client.describe_vpn_connections(Filters=[
+        {"Name": "transit-gateway-id", "Values": [transit_gateway_id]}])["VpnConnections"]
+    direct_connect = ec2_client.describe_transit_gateway_attachments(Filters=[
+        {"Name": "transit-gateway-id", "Values": [transit_gateway_id]},
+        {"Name": "resource-type", "Values": ["direct-connect-gateway"]}]
+    )["TransitGatewayAttachments"]
+    assert connections or direct_connect, "no VPN connection nor Direct Connect gateway"
+    tunnels = 0
+    for connection in connections:
+        up = [tunnel for tunnel in connection.get("VgwTelemetry", [])
+              if tunnel["Status"] == "UP"]
+        assert up, f"no tunnel up on {connection['VpnConnectionId']}"
+        tunnels += len(up)
+    return f"{transit_gateway_id}, {len(connections)} VPN connections, {tunnels} tunnels up"
+
+
+def check_secrets(outputs: Dict[str, str], region: str) -> str:  # pylint: disable=unused-argument
+    """secrets created by the stack"""
+    secrets = get_client("secretsmanager", region).list_secrets()["SecretList"]
+    assert len(secrets) == EXPECTED_SECRETS, \
+        f"{len(secrets)} secrets, expected {EXPECTED_SECRETS}"
+    return f"{len(secrets)} secrets"
+
+
+def check_cw_metrics(instance_id: str, region: str) -> str:
+    """the CloudWatch agent of the instance publishes metrics"""
+    paginator = get_client("cloudwatch", region).get_paginator("list_metrics")
+    pages = paginator.paginate(Namespace="CWAgent", MetricName="cpu_usage_system",
+                               Dimensions=[{"Name": "InstanceId", "Value": instance_id}])
+    count = sum(len(page["Metrics"]) for page in pages)
+    assert count, "no CWAgent metrics"
+    return f"{count} metrics"
+
+
+def check_ssm_session(instance_id: str, region: str) -> str:
+    """a Session Manager session can be opened to the instance"""
+    ssm_client = get_client("ssm", region)
+    session_id = ssm_client.start_session(Target=instance_id).get("SessionId")
+    assert session_id, "no session started"
+    ssm_client.terminate_session(SessionId=session_id)
+    return session_id
+
+
+def check_endpoint_azs(outputs: Dict[str, str], region: str) -> str:
+    """every interface endpoint has an ENI in the AZ of every instance"""
+    ec2_client = get_client("ec2", region)
+    instance_ids = get_instance_ids(outputs, region)
+    reservations = ec2_client.describe_instances(InstanceIds=instance_ids)["Reservations"]
+    instance_azs = {instance["Placement"]["AvailabilityZone"]
+                    for reservation in reservations for instance in reservation["Instances"]}
+    endpoints = ec2_client.describe_vpc_endpoints(Filters=[
+        {"Name": "vpc-id", "Values": [outputs["VPCID"]]},
+        {"Name": "vpc-endpoint-type", "Values": ["Interface"]}])["VpcEndpoints"]
+    subnet_azs = {subnet["SubnetId"]: subnet["AvailabilityZone"] for subnet in
+                  ec2_client.describe_subnets(Filters=[
+                      {"Name": "vpc-id", "Values": [outputs["VPCID"]]}])["Subnets"]}
+    missing = [f"{endpoint['ServiceName']} in {zone}" for endpoint in endpoints
+               for zone in instance_azs - {subnet_azs[subnet_id]
+                                           for subnet_id in endpoint["SubnetIds"]}]
+    assert not missing, "no endpoint ENI for " + ", ".join(missing)
+    return f"{len(endpoints)} endpoints in {', '.join(sorted(instance_azs))}"
+
+
+def get_checks(region: str) -> Dict[str, Callable[[], str]]:
+    """checks of the deployed stack by name, one per instance for the instance checks,
+    which need running agents and are left out offline"""
+    outputs = get_stack_outputs(region)
+    checks = {
+        "no_igw": lambda: check_no_igw(outputs, region),
+        "secrets": lambda: check_secrets(outputs, region),
+    }
+    if "TransitGatewayId" in outputs:
+        checks["transit_gateway"] = lambda: check_transit_gateway(outputs, region)
+    else:
+        checks["vgw"] = lambda: check_vgw(outputs, region)
+    if is_offline():
+        return checks
+    checks["endpoint_azs"] = lambda: check_endpoint_azs(outputs, region)
+    for instance_id in get_instance_ids(outputs, region):
+        checks["cw_metrics " + instance_id] = \
+            lambda instance_id=instance_id: check_cw_metrics(instance_id, region)
+        checks["ssm_session " + instance_id] = \
+            lambda instance_id=instance_id: check_ssm_session(instance_id, region)
+    return checks
+
+
+def run_check(name: str, check: Callable[[], str]) -> CheckResult:
+    """run one check, timing it and catching its failure"""
+    start = time.perf_counter()
+    try:
+        detail = check()
+        passed = True
+    except Exception as error:  # pylint: disable=broad-except
+        detail = f"{type(error).__name__}: {error}"
+        passed = False
+    return CheckResult(name, passed, time.perf_counter() - start, detail)
+
+
+def run_checks(checks: Dict[str, Callable[[], str]],
+               max_workers: int = MAX_WORKERS) -> List[CheckResult]:
+    """run the checks concurrently, results in the order of the checks"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda item: run_check(*item), checks.items()))
+
+
+def format_report(results: List[CheckResult], elapsed: float) -> str:
+    """one line per check with its duration, then the totals"""
+    width = max([len(result.name) for result in results] + [5])
+    lines = [f"{'PASS' if result.passed else 'FAIL'}  {result.name:<{width}}  "
+             f"{result.duration:7.2f}s  {result.detail}" for result in results]
+    failed = sum(1 for result in results if not result.passed)
+    lines.append(f"{len(results)} checks, {failed} failed, {elapsed:.2f}s elapsed, "
+                 f"{sum(result.duration for result in results):.2f}s of calls")
+    return "\n".join(lines)
+
+
+def main(region: str = None) -> int:
+    """run every check of the stack in region and print the report"""
+    region = region or get_region()
+    start = time.perf_counter()
+    results = run_checks(get_checks(region))
+    print(format_report(results, time.perf_counter() - start))
+    return 0 if all(result.passed for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:2]))
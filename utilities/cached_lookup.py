@@ -0,0 +1,168 @@
+"""Cached lookups persisted in cdk.context.json, the same way CDK context providers do.
+
+Synthesis only reads the cache: the CDK CLI owns cdk.context.json while it synthesizes,
+so a missing or expired entry is resolved for the current synthesis only.
+Run ``python -m utilities.cached_lookup refresh [KEY ...]`` to resolve and persist entries
+(every cached one by default), ``python -m utilities.cached_lookup show`` to list them
+and ``python -m utilities.cached_lookup clear`` to drop them.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from aws_cdk import Stack
+from constructs import Construct
+
+CONTEXT_FILE = Path(__file__).parent / ".." / "cdk.context.json"
+DEFAULT_TTL_SECONDS = 86400
+PREFIX_LIST_KEY_PREFIX = "swift-prefix-list:"
+S3_PREFIX_LIST_NAME = "com.amazonaws.*.s3"
+
+# values resolved during this synthesis, by context key
+_resolved = {}
+
+
+class LookupUnavailableException(Exception):
+    """Exception for a lookup that is neither cached nor resolvable"""
+
+
+def prefix_list_key(account: str, region: str, name: str) -> str:
+    """context key of a prefix list lookup"""
+    return f"{PREFIX_LIST_KEY_PREFIX}account={account}:region={region}:name={name}"
+
+
+def parse_prefix_list_key(key: str) -> dict:
+    """split a prefix list context key back to account, region and name"""
+    fields = {}
+    for part in key[len(PREFIX_LIST_KEY_PREFIX):].split(":", 2):
+        name, _, value = part.partition("=")
+        fields[name] = value
+    return fields
+
+
+def fetch_prefix_list_id(region: str, name: str) -> str:
+    """resolve the prefix list id from EC2, boto3 is only loaded here"""
+    # pylint: disable=import-outside-toplevel
+    import boto3
+
+    client = boto3.client("ec2", region_name=region)
+    prefix_lists = client.describe_prefix_lists(
+        Filters=[{"Name": "prefix-list-name", "Values": [name]}])
+    return prefix_lists["PrefixLists"][0]["PrefixListId"]
+
+
+def read_context_file(context_file: Path = CONTEXT_FILE) -> dict:
+    """read cdk.context.json, empty if it does not exist"""
+    if not context_file.exists():
+        return {}
+    with open(context_file, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_context_file(context: dict, context_file: Path = CONTEXT_FILE) -> None:
+    """write cdk.context.json in the format the CDK CLI uses"""
+    with open(context_file, "w", encoding="utf-8") as file:
+        json.dump(context, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def store_entry(key: str, value: str, context_file: Path = CONTEXT_FILE) -> dict:
+    """persist one lookup result with its timestamp"""
+    entry = {"value": value, "timestamp": int(time.time())}
+    context = read_context_file(context_file)
+    context[key] = entry
+    write_context_file(context, context_file)
+    return entry
+
+
+def is_expired(entry: dict, ttl: int) -> bool:
+    """whether a cached entry is older than the ttl, entries without a timestamp are"""
+    return time.time() - entry.get("timestamp", 0) >= ttl
+
+
+def cached_lookup(scope: Construct, key: str, fetcher: Callable[[], str]) -> str:
+    """return the cached value of key, calling fetcher only when the entry is missing
+    or older than the ttl. Stale entries are used when fetcher fails,
+    and fetcher is never called when offline_lookups is true.
+    Fetched values are not persisted, see the refresh command"""
+    ttl = int(scope.node.try_get_context("lookup_cache_ttl") or DEFAULT_TTL_SECONDS)
+    offline = scope.node.try_get_context("offline_lookups") == "true"
+
+    entry = scope.node.try_get_context(key)
+    if not isinstance(entry, dict):
+        entry = read_context_file().get(key)
+
+    if entry and (offline or not is_expired(entry, ttl)):
+        return entry["value"]
+    if offline:
+        raise LookupUnavailableException(
+            f"{key} is not cached and offline_lookups is true, run "
+            f"'python -m utilities.cached_lookup refresh \"{key}\"' with network access first")
+    if key in _resolved:
+        return _resolved[key]
+
+    try:
+        _resolved[key] = fetcher()
+    except Exception as err:  # pylint: disable=broad-except
+        if not entry:
+            raise LookupUnavailableException(f"Unable to resolve {key}: {err}") from err
+        print(f"Warning: using stale cache for {key}: {err}", file=sys.stderr)
+        return entry["value"]
+
+    print(f"Warning: {key} is not cached or expired, run "
+          f"'python -m utilities.cached_lookup refresh \"{key}\"' to cache it", file=sys.stderr)
+    return _resolved[key]
+
+
+def lookup_prefix_list_id(scope: Construct, name: str = S3_PREFIX_LIST_NAME) -> str:
+    """getting the prefix list id by name through the lookup cache"""
+    stack = Stack.of(scope)
+    return cached_lookup(scope, prefix_list_key(stack.account, stack.region, name),
+                         lambda: fetch_prefix_list_id(stack.region, name))
+
+
+def refresh(keys: List[str] = None, context_file: Path = CONTEXT_FILE) -> None:
+    """resolve and persist the given prefix list keys, every cached one by default"""
+    for key in keys or list(read_context_file(context_file)):
+        if key.startswith(PREFIX_LIST_KEY_PREFIX):
+            fields = parse_prefix_list_key(key)
+            entry = store_entry(key, fetch_prefix_list_id(fields["region"], fields["name"]),
+                                context_file)
+            print(f"{key} = {entry['value']}")
+
+
+def show(context_file: Path = CONTEXT_FILE) -> None:
+    """print every cached prefix list and its age"""
+    for key, entry in read_context_file(context_file).items():
+        if key.startswith(PREFIX_LIST_KEY_PREFIX):
+            if "timestamp" in entry:
+                print(f"{key} = {entry['value']} (age {int(time.time()) - entry['timestamp']}s)")
+            else:
+                print(f"{key} = {entry['value']} (no timestamp, expired)")
+
+
+def clear(context_file: Path = CONTEXT_FILE) -> None:
+    """drop every cached prefix list"""
+    context = read_context_file(context_file)
+    write_context_file({key: value for key, value in context.items()
+                        if not key.startswith(PREFIX_LIST_KEY_PREFIX)}, context_file)
+
+
+def main() -> None:
+    """command line entry for managing the lookup cache"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["refresh", "show", "clear"])
+    parser.add_argument("keys", nargs="*", help="context keys to refresh, every cached one "
+                                               "by default")
+    args = parser.parse_args()
+    if args.command == "refresh":
+        refresh(args.keys)
+    else:
+        {"show": show, "clear": clear}[args.command]()
+
+
+if __name__ == "__main__":
+    main()
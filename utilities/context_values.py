@@ -0,0 +1,24 @@
+"""Helpers for reading structured context values"""
+import json
+
+from constructs import Construct
+
+
+def get_context_object(scope: Construct, key: str, default=None):
+    """getting a JSON context value, which is a string when passed with cdk -c key=value"""
+    value = scope.node.try_get_context(key)
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def get_component_setting(scope: Construct, key: str, names: list, default=None):
+    """getting the first setting of a context object matching one of names,
+    used for per instance (AMH1) over per component (AMH) over "default" settings"""
+    settings = get_context_object(scope, key, {})
+    for name in names + ["default"]:
+        if name in settings:
+            return settings[name]
+    return default
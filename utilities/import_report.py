@@ -0,0 +1,95 @@
+"""Import time report for synthesizing the app, a summary of python -X importtime.
+
+python -m utilities.import_report [--top 20] [--depth 1] [-c key=value ...]
+
+app.py is run in a child interpreter with stubbed lookups and a temporary output
+directory, so the report does not need AWS access and does not touch cdk.out.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Tuple
+
+from utilities.stubbed_app import STUB_ACCOUNT, STUB_REGION, stub_context
+
+APP_DIR = Path(__file__).parent / ".."
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_import_times(stderr: str) -> list:
+    """parse python -X importtime output to (module, self us, cumulative us, level)"""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(1)), int(match.group(2)),
+                            (len(match.group(3)) - 1) // 2))
+    return entries
+
+
+def group_by_package(entries: list, depth: int = 1) -> dict:
+    """sum the self time of every module per package prefix"""
+    packages = {}
+    for module, self_us, _, _ in entries:
+        package = ".".join(module.split(".")[:depth])
+        packages[package] = packages.get(package, 0) + self_us
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def run_app(context: dict) -> Tuple[str, float]:
+    """synthesize app.py with -X importtime, returning stderr and wall seconds"""
+    with tempfile.TemporaryDirectory() as outdir:
+        env = dict(os.environ,
+                   CDK_DEFAULT_ACCOUNT=os.environ.get("CDK_DEFAULT_ACCOUNT", STUB_ACCOUNT),
+                   CDK_DEFAULT_REGION=os.environ.get("CDK_DEFAULT_REGION", STUB_REGION),
+                   CDK_OUTDIR=outdir,
+                   CDK_CONTEXT_JSON=json.dumps(context))
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "app.py"],
+                                cwd=APP_DIR, env=env, capture_output=True, text=True,
+                                check=False)
+        wall = time.perf_counter() - started
+
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise RuntimeError(f"app.py exited with {result.returncode}")
+    return result.stderr, wall
+
+
+def main() -> None:
+    """command line entry"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=20, help="number of modules to list")
+    parser.add_argument("--depth", type=int, default=1,
+                        help="number of module name parts to group packages by")
+    parser.add_argument("-c", "--context", action="append", default=[],
+                        help="context override key=value, as for cdk synth -c")
+    args = parser.parse_args()
+
+    overrides = dict(item.split("=", 1) for item in args.context)
+    stderr, wall = run_app(stub_context(os.environ.get("CDK_DEFAULT_ACCOUNT", STUB_ACCOUNT),
+                                        os.environ.get("CDK_DEFAULT_REGION", STUB_REGION),
+                                        overrides))
+    entries = parse_import_times(stderr)
+    import_us = sum(entry[1] for entry in entries)
+
+    print(f"wall {wall:.2f}s, imports {import_us / 1e6:.2f}s "
+          f"({import_us / 1e4 / wall:.0f}%), {len(entries)} modules")
+    print("\nself time by package:")
+    for package, self_us in list(group_by_package(entries, args.depth).items())[:args.top]:
+        print(f"  {self_us / 1000:>10.1f} ms  {package}")
+    print("\nslowest top level imports (cumulative):")
+    top_level = [entry for entry in entries if entry[3] == 0]
+    for module, _, cumulative_us, _ in sorted(top_level, key=lambda item: item[2],
+                                              reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:>10.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
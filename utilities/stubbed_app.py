@@ -0,0 +1,44 @@
+"""Building SwiftMain with stubbed lookups, for synthesizing without AWS access"""
+import json
+import time
+from pathlib import Path
+from typing import Tuple
+
+from aws_cdk import App, Environment
+
+from swift_main_stack.main import SwiftMain
+from utilities.cached_lookup import S3_PREFIX_LIST_NAME, prefix_list_key
+
+CDK_JSON = Path(__file__).parent / ".." / "cdk.json"
+STUB_ACCOUNT = "111111111111"
+STUB_REGION = "us-east-1"
+STUB_AVAILABILITY_ZONES = ["us-east-1a", "us-east-1b", "us-east-1c"]
+STUB_S3_PREFIX_LIST = "pl-63a5400a"
+
+
+def stub_context(account: str = STUB_ACCOUNT, region: str = STUB_REGION,
+                 overrides: dict = None) -> dict:
+    """context of cdk.json with every lookup answered locally"""
+    with open(CDK_JSON, "r", encoding="utf-8") as file:
+        context = json.load(file)["context"]
+
+    context["offline_lookups"] = "true"
+    context[prefix_list_key(account, region, S3_PREFIX_LIST_NAME)] = \
+        {"value": STUB_S3_PREFIX_LIST, "timestamp": int(time.time())}
+    context[f"availability-zones:account={account}:region={region}"] = \
+        STUB_AVAILABILITY_ZONES
+    if overrides:
+        context.update(overrides)
+    return context
+
+
+def build_stubbed_app(outdir: str = None, context: dict = None,
+                      account: str = STUB_ACCOUNT, region: str = STUB_REGION) \
+        -> Tuple[App, SwiftMain]:
+    """create the app and the SwiftMain stack, without synthesizing it.
+    AMI lookups are left to CDK, which answers missing context with dummy values"""
+    app = App(outdir=outdir, context=stub_context(account, region, context))
+    main_stack = SwiftMain(app, "SWIFTMain-" + region,
+                           env=Environment(account=account, region=region),
+                           description="Quick Start for SWIFT Connectivity (qs-1rlbqnpbe)")
+    return app, main_stack
@@ -0,0 +1,216 @@
+"""Synthesis cache, whole-app caching of the cloud assembly in cdk.out.
+
+Enabled with the synth_cache context flag: cdk synth -c synth_cache=true
+
+Before anything is constructed, the app fingerprint (context, sources, assets and
+library versions) is compared with the one of the last synthesis. When it did not
+change, the cloud assembly is restored from the cache and construction is skipped.
+
+Any change constructs and synthesizes the whole app: nested stacks share construct
+references and are synthesized together with their parent, so a nested stack is never
+reused on its own. Every nested stack is then fingerprinted from the context, its own
+source files and the parameters (upstream construct tokens) it receives from the parent
+stack, and reported as new, changed, unchanged or drifted (same inputs, different
+template, an input is not fingerprinted), telling which nested stacks the change deploys.
+"""
+import ast
+import hashlib
+import json
+import os
+import sys
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, List, Set
+
+from aws_cdk import NestedStack, Stack
+
+REPO_ROOT = (Path(__file__).parent / "..").resolve()
+CACHE_DIR_NAME = ".synth-cache"
+SOURCE_EXCLUDES = {"tests", "benchmarks", "cdk.out", "docs", ".venv", "venv", ".git"}
+LIBRARIES = ["aws-cdk-lib", "constructs", "cdk-ec2-key-pair"]
+
+
+def cli_context() -> dict:
+    """context passed by the CDK CLI, cdk.json, cdk.context.json and -c values merged"""
+    overflow = os.environ.get("CONTEXT_OVERFLOW_LOCATION_ENV")
+    if overflow:
+        with open(overflow, "r", encoding="utf-8") as file:
+            return json.load(file)
+    return json.loads(os.environ.get("CDK_CONTEXT_JSON", "{}"))
+
+
+def normalize_context(context: dict) -> bytes:
+    """serialize context, dropping the timestamps of cached lookups"""
+    normalized = {}
+    for key, value in context.items():
+        if isinstance(value, dict) and "value" in value and "timestamp" in value:
+            value = value["value"]
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True).encode()
+
+
+def digest(parts: List[bytes]) -> str:
+    """sha256 over length-prefixed parts"""
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update(len(part).to_bytes(8, "big"))
+        sha.update(part)
+    return sha.hexdigest()
+
+
+def library_versions() -> bytes:
+    """versions of the libraries that shape the templates"""
+    versions = []
+    for library in LIBRARIES:
+        try:
+            versions.append(library + "=" + metadata.version(library))
+        except metadata.PackageNotFoundError:
+            versions.append(library + "=none")
+    return ",".join(versions).encode()
+
+
+def app_source_files() -> List[Path]:
+    """every python source and asset that can affect synthesis"""
+    files = [REPO_ROOT / "app.py"]
+    for directory in sorted(REPO_ROOT.iterdir()):
+        if not directory.is_dir() or directory.name in SOURCE_EXCLUDES:
+            continue
+        pattern = "*" if directory.name == "assets" else "*.py"
+        files.extend(path for path in sorted(directory.rglob(pattern)) if path.is_file())
+    return files
+
+
+def module_source_files(module_name: str, seen: Set[Path] = None) -> Set[Path]:
+    """source file of a repo module and of every repo module it imports, transitively"""
+    seen = set() if seen is None else seen
+    path = REPO_ROOT.joinpath(*module_name.split(".")).with_suffix(".py")
+    if not path.exists() or path in seen:
+        return seen
+    seen.add(path)
+
+    for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+        if isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            module_source_files(node.module, seen)
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                module_source_files(alias.name, seen)
+    return seen
+
+
+def files_digest_parts(files) -> List[bytes]:
+    """relative path and content of every file, in a stable order"""
+    parts = []
+    for path in sorted(files):
+        parts.append(str(path.relative_to(REPO_ROOT)).encode())
+        parts.append(path.read_bytes())
+    return parts
+
+
+class SynthCache:
+    """content-addressed synthesis cache kept in the cloud assembly directory"""
+
+    def __init__(self, outdir: str, context: dict):
+        self._outdir = Path(outdir)
+        self._cache = self._outdir / CACHE_DIR_NAME
+        self._context = normalize_context(context)
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        index_file = self._cache / "index.json"
+        if not index_file.exists():
+            return {"files": {}, "stacks": {}}
+        with open(index_file, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _object_path(self, content_digest: str) -> Path:
+        return self._cache / "objects" / content_digest[:2] / content_digest
+
+    def _store_object(self, content: bytes) -> str:
+        content_digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(content_digest)
+        if not object_path.exists():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            object_path.write_bytes(content)
+        return content_digest
+
+    def _write_from_cache(self, relative: str, content_digest: str) -> None:
+        target = self._outdir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(self._object_path(content_digest).read_bytes())
+
+    def app_fingerprint(self) -> str:
+        """fingerprint of everything that goes into synthesizing the app"""
+        return digest([self._context, library_versions(),
+                       os.environ.get("CDK_DEFAULT_ACCOUNT", "").encode(),
+                       os.environ.get("CDK_DEFAULT_REGION", "").encode()]
+                      + files_digest_parts(app_source_files()))
+
+    def restore(self) -> bool:
+        """restore the whole cloud assembly when the app fingerprint did not change"""
+        files: Dict[str, str] = self._index["files"]
+        if self._index.get("app") != self.app_fingerprint() or not files:
+            return False
+        if not all(self._object_path(value).exists() for value in files.values()):
+            return False
+
+        for relative, content_digest in files.items():
+            self._write_from_cache(relative, content_digest)
+        print(f"synth cache: app unchanged, {len(files)} files restored from cache",
+              file=sys.stderr)
+        return True
+
+    def stack_fingerprint(self, parent: Stack, nested_stack: NestedStack,
+                          parent_template: dict) -> str:
+        """fingerprint of a nested stack from context, sources and upstream tokens"""
+        sources = set()
+        for cls in type(nested_stack).__mro__:
+            module_source_files(cls.__module__, sources)
+
+        logical_id = parent.resolve(parent.get_logical_id(nested_stack.nested_stack_resource))
+        parameters = parent_template["Resources"][logical_id]["Properties"].get("Parameters", {})
+        return digest([self._context, library_versions(),
+                       json.dumps(parameters, sort_keys=True).encode()]
+                      + files_digest_parts(sources))
+
+    def record(self, main_stack: Stack) -> Dict[str, str]:
+        """cache the synthesized assembly. Returns the status (new, changed, unchanged or
+        drifted) of every nested stack against the last synthesis"""
+        with open(self._outdir / main_stack.template_file, "r", encoding="utf-8") as file:
+            parent_template = json.load(file)
+
+        statuses = {}
+        stacks = {}
+        for child in main_stack.node.children:
+            if not isinstance(child, NestedStack):
+                continue
+            fingerprint = self.stack_fingerprint(main_stack, child, parent_template)
+            content_digest = self._store_object(
+                (self._outdir / child.template_file).read_bytes())
+            previous = self._index["stacks"].get(child.node.path)
+
+            if previous is None:
+                statuses[child.node.id] = "new"
+            elif previous["fingerprint"] != fingerprint:
+                statuses[child.node.id] = "changed"
+            elif previous["template"] == content_digest:
+                statuses[child.node.id] = "unchanged"
+            else:
+                # same inputs but a different template, an input is not fingerprinted
+                statuses[child.node.id] = "drifted"
+            stacks[child.node.path] = {"fingerprint": fingerprint, "template": content_digest}
+
+        files = {}
+        for path in sorted(self._outdir.rglob("*")):
+            relative = path.relative_to(self._outdir)
+            if path.is_file() and relative.parts[0] != CACHE_DIR_NAME \
+                    and not path.name.endswith(".lock"):
+                files[str(relative)] = self._store_object(path.read_bytes())
+
+        self._index = {"app": self.app_fingerprint(), "files": files, "stacks": stacks}
+        self._cache.mkdir(parents=True, exist_ok=True)
+        with open(self._cache / "index.json", "w", encoding="utf-8") as file:
+            json.dump(self._index, file, indent=2, sort_keys=True)
+
+        for name, status in statuses.items():
+            print(f"synth cache: {name} {status}", file=sys.stderr)
+        return statuses